@@ -100,6 +100,7 @@ class GoalExplorationEnv(GoalEnv, ProxyEnv, Serializable):
         
         self.append_transformed_obs = append_transformed_obs
         self.append_goal_to_observation = append_goal_to_observation
+        self._goal_feasibility = None  # (goal, whether it is feasible) of the last goal checked
 
         # TODO fix this
         if self.goal_bounds is None:
@@ -127,6 +128,22 @@ class GoalExplorationEnv(GoalEnv, ProxyEnv, Serializable):
         else:
             return True
 
+    def is_feasible_n(self, goals):
+        """ Boolean mask of whether each goal of the batch is feasible """
+        obj = self.wrapped_env
+        while not hasattr(obj, 'is_feasible_n') and not hasattr(obj, 'is_feasible') and hasattr(obj, 'wrapped_env'):
+            obj = obj.wrapped_env
+        if hasattr(obj, 'is_feasible_n'):
+            return np.asarray(obj.is_feasible_n(np.asarray(goals)), dtype=bool)
+        return np.array([self.is_feasible(goal) for goal in goals], dtype=bool)
+
+    def _is_current_goal_feasible(self):
+        """ is_feasible of the current goal, only checked again when the goal changes """
+        goal = np.array(self.current_goal)
+        if self._goal_feasibility is None or not np.array_equal(self._goal_feasibility[0], goal):
+            self._goal_feasibility = (goal, self.is_feasible(goal))
+        return self._goal_feasibility[1]
+
     def reset(self, reset_goal=True, **kwargs):  # allows to pass init_state if needed
         if reset_goal:
             self.update_goal()
@@ -148,9 +165,10 @@ class GoalExplorationEnv(GoalEnv, ProxyEnv, Serializable):
         info['reward_inner'] = reward_inner = self.inner_weight * reward
         # print(reward_inner)
         if 'distance' not in info:
+            # the distance is computed once for the reward and the goal check
             info['distance'] = dist = self.dist_to_goal(observation)
-            info['reward_dist'] = reward_dist = self.compute_dist_reward(observation)
-            info['goal_reached'] = 1.0 * self.is_goal_reached(observation)
+            info['reward_dist'] = reward_dist = - self.extend_dist_rew_weight * dist
+            info['goal_reached'] = 1.0 * self._is_dist_goal_reached(dist)
         else:
             # modified so that inner environment can pass in goal via step
             dist = info['distance']
@@ -175,10 +193,13 @@ class GoalExplorationEnv(GoalEnv, ProxyEnv, Serializable):
         
     def is_goal_reached(self, observation):
         """ Return a boolean whether the (unaugmented) observation reached the goal. """
+        return self._is_dist_goal_reached(self.dist_to_goal(observation))
+
+    def _is_dist_goal_reached(self, dist):
         if self.only_feasible:
-            return self.dist_to_goal(observation) < self.terminal_eps and self.is_feasible(self.current_goal)
+            return dist < self.terminal_eps and self._is_current_goal_feasible()
         else:
-            return self.dist_to_goal(observation) < self.terminal_eps
+            return dist < self.terminal_eps
 
     def compute_dist_reward(self, observation):
         """ Compute the 0 or 1 reward for reaching the goal. """
@@ -197,6 +218,47 @@ class GoalExplorationEnv(GoalEnv, ProxyEnv, Serializable):
             raise NotImplementedError('Unsupported distance metric type.')
         return goal_distance
         
+    def dist_to_goals(self, observations, goals=None):
+        """
+        Compute the distances of a batch of (unaugmented) observations to their goals.
+        :param goals: the goal of each observation, or a single goal for all of them. The current goal if None.
+        """
+        goal_obs = np.array([self.transform_to_goal_space(obs) for obs in observations])
+        goals = np.array(self.current_goal if goals is None else goals)
+        if goals.ndim < goal_obs.ndim:
+            goals = np.broadcast_to(goals, goal_obs.shape)
+        if len(goal_obs) == 0:
+            return np.zeros(0)
+        if self.distance_metric == 'L1':
+            return np.linalg.norm((goal_obs - goals).reshape(len(goal_obs), -1), ord=1, axis=1)
+        elif self.distance_metric == 'L2':
+            return np.linalg.norm((goal_obs - goals).reshape(len(goal_obs), -1), ord=2, axis=1)
+        elif callable(self.distance_metric):
+            return np.array([self.distance_metric(o, g) for o, g in zip(goal_obs, goals)])
+        else:
+            raise NotImplementedError('Unsupported distance metric type.')
+
+    def compute_goal_infos(self, observations, goals=None):
+        """
+        Compute the distance, reward_dist and goal_reached env_infos of step for a batch of (unaugmented)
+        observations and goals, e.g. to score the stored paths against other goals without stepping the env again.
+        :param goals: the goal of each observation, or a single goal for all of them. The current goal if None.
+        :return: dict of the arrays of the env_infos
+        """
+        goals = np.array(self.current_goal if goals is None else goals)
+        distance = self.dist_to_goals(observations, goals)
+        goal_reached = distance < self.terminal_eps
+        if self.only_feasible:
+            if goals.ndim > 1:
+                goal_reached &= self.is_feasible_n(goals)
+            else:
+                goal_reached &= self.is_feasible(goals)
+        return dict(
+            distance=distance,
+            reward_dist=- self.extend_dist_rew_weight * distance,
+            goal_reached=1.0 * goal_reached,
+        )
+
     def transform_to_goal_space(self, obs):
         """ Apply the goal space transformation to the given observation. """
         return self._obs2goal_transform(obs)
@@ -119,6 +119,7 @@ class MazeEnv(ProxyEnv, Serializable):
 
         self._goal_range = self._find_goal_range()
         self._cached_segments = None
+        self._init_grid()
 
         inner_env = model_cls(file_path=file_path, *args, **kwargs)  # file to the robot specifications
         ProxyEnv.__init__(self, inner_env)  # here is where the robot env will be initialized
@@ -197,39 +198,88 @@ class MazeEnv(ProxyEnv, Serializable):
                     maxy = i * size_scaling + size_scaling * 0.5 - self._init_torso_y
                     return minx, maxx, miny, maxy
 
-    def _is_in_collision(self, pos):
-        x, y = pos
+    def _init_grid(self):
+        """
+        Precompute the occupancy of the cells of the maze and their bounds, for the collision and feasibility checks
+        """
         structure = self.MAZE_STRUCTURE
         size_scaling = self.MAZE_SIZE_SCALING
+        # over the columns of the first row, like the loops over the cells (the rows of some mazes are longer)
+        n_rows, n_cols = len(structure), len(structure[0])
+        self._wall_grid = np.zeros((n_rows, n_cols), dtype=bool)
+        self._empty_grid = np.zeros((n_rows, n_cols), dtype=bool)
+        for i in range(n_rows):
+            for j in range(n_cols):
+                self._wall_grid[i, j] = structure[i][j] == 1
+                self._empty_grid[i, j] = structure[i][j] == 'r' or structure[i][j] == 'g' or structure[i][j] == 0
+        # same expressions as in the loops over the cells, so that the comparisons give the same results
+        self._cell_min_x = [j * size_scaling - size_scaling * 0.5 - self._init_torso_x for j in range(len(structure[0]))]
+        self._cell_max_x = [j * size_scaling + size_scaling * 0.5 - self._init_torso_x for j in range(len(structure[0]))]
+        self._cell_min_y = [i * size_scaling - size_scaling * 0.5 - self._init_torso_y for i in range(len(structure))]
+        self._cell_max_y = [i * size_scaling + size_scaling * 0.5 - self._init_torso_y for i in range(len(structure))]
+        self._cell_center_x = np.array([j * size_scaling - self._init_torso_x for j in range(len(structure[0]))])
+        self._cell_center_y = np.array([i * size_scaling - self._init_torso_y for i in range(len(structure))])
+        self._empty_space = []
         for i in range(len(structure)):
             for j in range(len(structure[0])):
-                if structure[i][j] == 1:
-                    minx = j * size_scaling - size_scaling * 0.5 - self._init_torso_x
-                    maxx = j * size_scaling + size_scaling * 0.5 - self._init_torso_x
-                    miny = i * size_scaling - size_scaling * 0.5 - self._init_torso_y
-                    maxy = i * size_scaling + size_scaling * 0.5 - self._init_torso_y
-                    if minx <= x <= maxx and miny <= y <= maxy:
-                        return True
+                if self._empty_grid[i, j]:
+                    self._empty_space.append((j * size_scaling - self._init_torso_x,
+                                              i * size_scaling - self._init_torso_y))
+
+    def _cell_indices(self, coords, offset, n_cells):
+        """
+        Index of the cell whose center is the closest to each coordinate (any index outside [0, n_cells) if there is
+        none). The boundaries of the cells are closed or open depending on the check, so both neighbours of this cell
+        have to be checked as well.
+        """
+        idx = np.clip(np.floor((coords + offset) / self.MAZE_SIZE_SCALING + 0.5), -2, n_cells + 1)
+        idx[np.isnan(idx)] = -2
+        return idx.astype(int)
+
+    def _is_in_collision(self, pos):
+        x, y = pos
+        if not (math.isfinite(x) and math.isfinite(y)):
+            return False
+        n_rows, n_cols = self._wall_grid.shape
+        i0 = int(math.floor((y + self._init_torso_y) / self.MAZE_SIZE_SCALING + 0.5))
+        j0 = int(math.floor((x + self._init_torso_x) / self.MAZE_SIZE_SCALING + 0.5))
+        for i in range(max(i0 - 1, 0), min(i0 + 2, n_rows)):
+            if not self._cell_min_y[i] <= y <= self._cell_max_y[i]:
+                continue
+            for j in range(max(j0 - 1, 0), min(j0 + 2, n_cols)):
+                if self._wall_grid[i, j] and self._cell_min_x[j] <= x <= self._cell_max_x[j]:
+                    return True
         return False
 
     def find_empty_space(self):
-        structure = self.MAZE_STRUCTURE
-        size_scaling = self.MAZE_SIZE_SCALING
-        empty_space = []
-        for i in range(len(structure)):
-            for j in range(len(structure[0])):
-                if structure[i][j] == 'r' or structure[i][j] == 'g' or structure[i][j] == 0:
-                    empty_space.append((j * size_scaling - self._init_torso_x, i * size_scaling - self._init_torso_y))
-                    #return j * size_scaling, i * size_scaling
-        return empty_space
+        return list(self._empty_space)
 
     def is_feasible(self, pos):  # the arg is the goal, not the full space!!!
-        empty_space = self.find_empty_space()
-        for space in empty_space:
-            if np.size(np.where(np.abs(np.array(np.array(pos).reshape(-1)[:2])-np.array(space)) < self.MAZE_SIZE_SCALING/2)[0]) == 2:
-                # print("Pos {} is in empty space: {}".format(pos, space))
-                return True
-        return False
+        return bool(self.is_feasible_n(np.array(pos).reshape(1, -1))[0])
+
+    def is_feasible_n(self, states):
+        """
+        :param states: array of shape (N, d) of goals or starts, of which only the first 2 coordinates are checked
+        :return: boolean mask of the states that are strictly inside an empty cell of the maze
+        """
+        states = np.asarray(states, dtype=np.float64).reshape(len(states), -1)
+        x, y = states[:, 0], states[:, 1]
+        n_rows, n_cols = self._empty_grid.shape
+        i0 = self._cell_indices(y, self._init_torso_y, n_rows)
+        j0 = self._cell_indices(x, self._init_torso_x, n_cols)
+        half_size = self.MAZE_SIZE_SCALING / 2
+        feasible = np.zeros(len(states), dtype=bool)
+        for di in (-1, 0, 1):
+            i = i0 + di
+            i_in = (i >= 0) & (i < n_rows)
+            i = np.where(i_in, i, 0)
+            for dj in (-1, 0, 1):
+                j = j0 + dj
+                in_grid = i_in & (j >= 0) & (j < n_cols)
+                j = np.where(in_grid, j, 0)
+                feasible |= in_grid & self._empty_grid[i, j] & \
+                    (np.abs(x - self._cell_center_x[j]) < half_size) & (np.abs(y - self._cell_center_y[i]) < half_size)
+        return feasible
 
     @overrides
     def reset(self, *args, **kwargs):
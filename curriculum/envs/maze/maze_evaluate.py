@@ -13,6 +13,7 @@ import matplotlib.patches as patches
 
 from rllab.sampler.utils import rollout
 from rllab.misc import logger
+from rllab.misc.compact_snapshot import load_snapshot
 from curriculum.envs.base import FixedStateGenerator
 # from curriculum.state.selectors import FixedStateSelector
 from curriculum.state.evaluator import evaluate_states
@@ -37,7 +38,7 @@ def get_policy(file):
             policy = data['policy']
             train_env = data['env']
     else:
-        data = joblib.load(file)
+        data = load_snapshot(file)
         policy = data['policy']
         train_env = data['env']
     return policy, train_env
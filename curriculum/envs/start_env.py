@@ -246,9 +246,11 @@ def generate_starts(env, policy=None, starts=None, horizon=50, size=10000, subsa
                 # timestep = 0.05
                 # time.sleep(timestep / speedup)
             else:
-                # import pdb; pdb.set_trace()
-                brownian_state_wrapper = FunctionWrapper(
-                    brownian,
+                # each worker runs brownian walks from its share of the starts until it collects its share of states
+                n_workers = max(singleton_pool.n_parallel, 1)
+                worker_size = int(np.ceil((size - len(states)) / n_workers))
+                brownian_chunk_wrapper = FunctionWrapper(
+                    brownian_chunk,
                     env=env,
                     kill_outside=env.kill_outside,
                     kill_radius=env.kill_radius,  # this should be set before passing the env to generate_starts
@@ -256,23 +258,20 @@ def generate_starts(env, policy=None, starts=None, horizon=50, size=10000, subsa
                     variance=variance,
                     policy=policy,
                 )
-                parallel_starts = [starts[j % n_starts] for j in range(i,i+singleton_pool.n_parallel)]
-                # print("parallel sampling from :", parallel_starts)
-                i += singleton_pool.n_parallel
-                results = parallel_map(brownian_state_wrapper, parallel_starts)
+                chunks = [(starts, i + w, n_workers, worker_size) for w in range(n_workers)]
+                results = parallel_map(brownian_chunk_wrapper, chunks, resident=True)
                 new_states = np.concatenate([result[0] for result in results])
 
-                # show where these states are:
                 np.random.shuffle(new_states)  # todo: this has a prety big impoact!! Why?? (related to collection)
-                # generate_starts(env, starts=new_states, horizon=10, variance=0,
-                #                 zero_action=True, animated=True, speedup=10, size=100)
 
-                print('Just collected {} rollouts, with {} states'.format(len(results), new_states.shape))
+                n_rollouts = np.sum([result[2] for result in results])
+                print('Just collected {} rollouts, with {} states'.format(n_rollouts, new_states.shape))
                 states.extend(new_states.tolist())
                 print('now the states are of len: ', len(states))
                 num_roll_reached_goal += np.sum([result[1] for result in results])
                 print("num_roll_reached_goal ",  np.sum([result[1] for result in results]))
-                num_roll += len(results)
+                num_roll += n_rollouts
+                i += n_rollouts
         logger.log("Generating starts, rollouts that reached goal: " + str(num_roll_reached_goal) + " out of " + str(num_roll))
     logger.log("Starts generated.")
     if subsample is None:
@@ -284,35 +283,61 @@ def generate_starts(env, policy=None, starts=None, horizon=50, size=10000, subsa
         return states[np.random.choice(np.shape(states)[0], size=subsample)]
 
 def parallel_check_feasibility(starts, env, max_path_length=50, n_processes=-1):
+    """ Keep only the feasible starts (see check_feasibility) """
+    if len(starts) == 0:
+        return np.array(starts)
+    is_feasible = feasibility_mask(starts, env, max_path_length=max_path_length, n_processes=n_processes)
+    return np.asarray(starts)[is_feasible]
+
+
+def feasibility_mask(starts, env, max_path_length=50, n_processes=-1):
+    """
+    Boolean mask of the feasible starts, equal to [check_feasibility(start, env) for start in starts]. The starts are
+    only split in one chunk per worker, with the env resident in it; each start is still checked by its own sequential
+    check_feasibility rollout.
+    """
+    if n_processes == -1:
+        n_processes = singleton_pool.n_parallel
+    n_chunks = max(min(n_processes, len(starts)), 1)
+    chunks = np.array_split(np.asarray(starts), n_chunks)
     feasibility_wrapper = FunctionWrapper(
-        check_feasibility,
-        env =env,
+        check_feasibility_batch,
+        env=env,
         max_path_length=max_path_length,
     )
-    is_feasible = parallel_map(
+    masks = parallel_map(
         feasibility_wrapper,
-        starts,
+        chunks,
         n_processes,
+        resident=True,
     )
-    #TODO: is there better way to do this?
-    result = [starts[i] for i in range(len(starts)) if is_feasible[i]] # keep starts that are feasible only
-    return np.array(result)
+    return np.concatenate(masks)
+
+
+def check_feasibility_batch(starts, env, max_path_length=50):
+    """ Boolean mask with one sequential check_feasibility call per start, sharing the zero action """
+    zero_action = np.zeros(env.action_space.flat_dim)
+    return np.array([check_feasibility(start, env, max_path_length, action=zero_action) for start in starts],
+                    dtype=bool)
 
-def check_feasibility(start, env, max_path_length = 50):
+
+def check_feasibility(start, env, max_path_length = 50, action=None):
     """
     Rolls out a policy with no action on ENV wifh init_state START for STEPS
     useful for checking if a state should be added to generated starts--if it's incredibly unstable, then a trained
     policy will likely not be able to work well
     :param env:
     :param steps:
+    :param action: the zero action, if already allocated
     :return: True iff state is good
     """
+    if action is None:
+        action = np.zeros(env.action_space.flat_dim)
     path_length = 0
     d = False
     o = env.reset(start)
     while path_length < max_path_length:
-        a = np.zeros(env.action_space.flat_dim)
-        next_o, r, d, env_info = env.step(a)
+        next_o, r, d, env_info = env.step(action)
         path_length += 1
         if d:
             break
@@ -449,6 +474,28 @@ def brownian(start, env, kill_outside, kill_radius, horizon, variance, policy=No
     return states, goal_reached
 
 
+def brownian_chunk(chunk, env, kill_outside, kill_radius, horizon, variance, policy=None):
+    """
+    Run brownian walks from starts[offset], starts[offset + stride], ... (cycling over the starts) until at least
+    size states are collected.
+    :param chunk: tuple (starts, offset, stride, size)
+    :return: the array of visited states, the number of walks that reached the goal and the number of walks
+    """
+    starts, offset, stride, size = chunk
+    states = []
+    n_states = 0
+    num_roll_reached_goal = 0
+    num_roll = 0
+    while n_states < size:
+        walk_states, goal_reached = brownian(starts[(offset + num_roll * stride) % len(starts)], env, kill_outside,
+                                             kill_radius, horizon, variance, policy=policy)
+        states.append(np.array(walk_states))
+        n_states += len(walk_states)
+        num_roll_reached_goal += int(goal_reached)
+        num_roll += 1
+    return np.concatenate(states), num_roll_reached_goal, num_roll
+
+
 def find_all_feasible_states(env, seed_starts, distance_threshold=0.1, brownian_variance=1, animate=False, speedup=10,
                              max_states = None, horizon = 1000, states_transform = None):
     # states_transform is optional transform of states
@@ -24,7 +24,7 @@ from rllab.baselines.linear_feature_baseline import LinearFeatureBaseline
 from rllab.envs.normalized_env import normalize
 from rllab.policies.gaussian_mlp_policy import GaussianMLPPolicy
 
-from curriculum.state.evaluator import label_states, label_states_from_paths
+from curriculum.state.evaluator import label_states, label_states_from_accumulator, StateRewardAccumulator
 from curriculum.envs.base import UniformListStateGenerator, UniformStateGenerator
 from curriculum.state.generator import StateGAN
 from curriculum.state.utils import StateCollection
@@ -151,6 +151,8 @@ def run_task(v):
         else:
             goals = raw_goals
 
+        # the goals are labeled from the rewards of the training paths, aggregated as they are collected
+        accumulator = StateRewardAccumulator(key='goal_reached')
         if not debug:
             with ExperimentLogger(log_dir, 'last', snapshot_mode='last', hold_outter_log=True):
                 logger.log("Updating the environment goal generator")
@@ -171,9 +173,11 @@ def run_task(v):
                     step_size=0.01,
                     discount=v['discount'],
                     plot=False,
+                    path_accumulator=accumulator,
+                    return_all_paths=False,
                 )
 
-                all_paths = algo.train()
+                algo.train()
         else:
             logger.log("Updating the environment goal generator")
             env.update_goal_generator(
@@ -193,11 +197,13 @@ def run_task(v):
                 step_size=0.01,
                 discount=v['discount'],
                 plot=False,
+                path_accumulator=accumulator,
+                return_all_paths=False,
             )
 
-            all_paths = algo.train()
+            algo.train()
 
-        [goals, labels] = label_states_from_paths(all_paths, n_traj=v['n_traj'], key='goal_reached')
+        [goals, labels] = label_states_from_accumulator(accumulator, n_traj=v['n_traj'])
 
         logger.log('Generating the Heatmap...')
         test_and_plot_policy(policy, env, max_reward=v['max_reward'], sampling_res=sampling_res, n_traj=v['n_traj'],
@@ -27,8 +27,8 @@ from rllab.baselines.gaussian_mlp_baseline import GaussianMLPBaseline
 from rllab.envs.normalized_env import normalize
 from rllab.policies.gaussian_mlp_policy import GaussianMLPPolicy
 
-from curriculum.state.evaluator import convert_label, label_states, evaluate_states, label_states_from_paths, \
-    compute_labels
+from curriculum.state.evaluator import convert_label, label_states, evaluate_states, label_states_from_accumulator, \
+    compute_labels, StateRewardAccumulator
 from curriculum.envs.base import UniformListStateGenerator, UniformStateGenerator, FixedStateGenerator
 from curriculum.state.utils import StateCollection, SmartStateCollection
 
@@ -200,6 +200,8 @@ def run_task(v):
             )
 
             logger.log("Training the algorithm")
+            # the starts are labeled from the rewards of the training paths, aggregated as they are collected
+            accumulator = StateRewardAccumulator(key='goal_reached', as_goal=False, env=env)
             algo = TRPO(
                 env=env,
                 policy=policy,
@@ -210,21 +212,21 @@ def run_task(v):
                 step_size=0.01,
                 discount=v['discount'],
                 plot=False,
+                path_accumulator=accumulator,
+                return_all_paths=False,
             )
 
-            trpo_paths = algo.train()
+            algo.train()
 
 
 
         logger.log("Labeling the starts")
 
         if v['smart_replay_buffer']:
-            [starts, labels, mean_rewards] = label_states_from_paths(trpo_paths, n_traj=v['n_traj'], key='goal_reached',
-                                                   as_goal=False, env=env, return_mean_rewards=True)
+            [starts, labels, mean_rewards] = label_states_from_accumulator(accumulator, n_traj=v['n_traj'],
+                                                                           return_mean_rewards=True)
         else:
-            [starts, labels] = label_states_from_paths(trpo_paths, n_traj=v['n_traj'], key='goal_reached',
-                                                       # using the min n_traj
-                                                       as_goal=False, env=env)
+            [starts, labels] = label_states_from_accumulator(accumulator, n_traj=v['n_traj'])  # using the min n_traj
 
         start_classes, text_labels = convert_label(labels)
         plot_labeled_states(starts, labels, report=report, itr=outer_iter, limit=v['goal_range'],
@@ -5,8 +5,11 @@ import numpy as np
 from collections import OrderedDict
 import cloudpickle
 import time
+import weakref
 
-from rllab.sampler.utils import rollout
+from rllab.sampler.utils import rollout, batch_rollout, preallocated_rollout
+from rllab.sampler.stateful_pool import singleton_pool, SharedGlobal
+from rllab.core.parameterized import Parameterized
 from rllab.misc import logger
 
 from curriculum.envs.base import FixedStateGenerator
@@ -51,21 +54,30 @@ def disable_cuda_initializer(*args, **kwargs):
     os.environ['CUDA_VISIBLE_DEVICES'] = ''
 
 
-def parallel_map(func, iterable_object, num_processes=-1):
+def parallel_map(func, iterable_object, num_processes=-1, resident=False):
     """Parallelized map function based on python process
     Args:
     func: Pickleable callable object that takes one parameter.
     iterable_object: An iterable of elements to map the function on.
     num_processes: Number of process to use. When num_processes is 1,
                    no new process will be created.
+    resident: If True and func is a FunctionWrapper, it is kept in the workers of the
+              singleton_pool between calls: later calls with the same arguments only push
+              the flat parameters of its Parameterized arguments (ie the policy).
     Returns:
     The list resulted in calling the func on all objects in the original list.
     """
     if num_processes == 1:
         return [func(x) for x in iterable_object]
     if num_processes == -1:
-        from rllab.sampler.stateful_pool import singleton_pool
         num_processes = singleton_pool.n_parallel
+    if isinstance(func, FunctionWrapper) and singleton_pool.pool is not None \
+            and num_processes == singleton_pool.n_parallel:
+        populate_evaluator(func, resident=resident)
+        return singleton_pool.run_map(
+            _worker_run_evaluator,
+            [(x, _EVALUATOR_SCOPE) for x in iterable_object]
+        )
     process_pool = multiprocessing.Pool(
         num_processes,
         initializer=disable_cuda_initializer
@@ -75,6 +87,97 @@ def parallel_map(func, iterable_object, num_processes=-1):
     process_pool.join()
     return results
 
+
+_EVALUATOR_SCOPE = 'evaluator'
+_cached_evaluator = dict(func=None, state=None, param_values={})
+
+
+def _parameterized_arguments(func):
+    """ Return a dict from argument position or name to the Parameterized arguments of the wrapper. """
+    arguments = dict(enumerate(func.args))
+    arguments.update(func.kwargs)
+    return {k: v for k, v in arguments.items() if isinstance(v, Parameterized)}
+
+
+def _evaluator_state(func):
+    """
+    Pickle the wrapped function with all its arguments except the Parameterized ones, whose flat parameters are
+    pushed separately. Any change to the env (a new goal, an updated start or goal generator...) changes this state.
+    """
+    args = tuple(None if isinstance(a, Parameterized) else a for a in func.args)
+    kwargs = {k: None if isinstance(v, Parameterized) else v for k, v in func.kwargs.items()}
+    return cloudpickle.dumps((func.func, args, kwargs))
+
+
+def _is_resident(func, state):
+    cached = _cached_evaluator['func']
+    if cached is None or _cached_evaluator['state'] != state:
+        return False
+    cached_parameterized = _parameterized_arguments(cached)
+    parameterized = _parameterized_arguments(func)
+    return set(cached_parameterized) == set(parameterized) and \
+        all(cached_parameterized[k] is v for k, v in parameterized.items())
+
+
+def invalidate_evaluator():
+    """ Force the next populate_evaluator call to send the whole wrapped function to the workers again. """
+    _cached_evaluator['func'] = None
+    _cached_evaluator['state'] = None
+    _cached_evaluator['param_values'] = {}
+
+
+def populate_evaluator(func, resident=True):
+    """
+    Make func (a FunctionWrapper) available in every worker of the singleton_pool. The wrapper, with its env and
+    policy, is pickled only once per call, instead of once per mapped element. If resident, the same Parameterized
+    arguments are already populated and the rest of the wrapper pickles to the same state as before (so the env has
+    not changed), only the changed flat parameters are sent to the workers.
+    """
+    param_values = {k: v.get_param_values() for k, v in _parameterized_arguments(func).items()}
+    state = _evaluator_state(func) if resident else None
+    if resident and _is_resident(func, state):
+        changed = {k: v for k, v in param_values.items()
+                   if not np.array_equal(v, _cached_evaluator['param_values'].get(k))}
+        if changed:
+            singleton_pool.run_each(
+                _worker_set_evaluator_params,
+                [(changed, _EVALUATOR_SCOPE)] * singleton_pool.n_parallel
+            )
+    else:
+        logger.log("Populating evaluator workers...")
+        singleton_pool.run_each(
+            _worker_populate_evaluator,
+            [(cloudpickle.dumps(func), _EVALUATOR_SCOPE)] * singleton_pool.n_parallel
+        )
+    _cached_evaluator['func'] = func if resident else None
+    _cached_evaluator['state'] = state
+    _cached_evaluator['param_values'] = param_values
+
+
+def _get_evaluator_G(G, scope):
+    if not hasattr(G, "scopes"):
+        G.scopes = dict()
+    if scope not in G.scopes:
+        G.scopes[scope] = SharedGlobal()
+    return G.scopes[scope]
+
+
+def _worker_populate_evaluator(G, func, scope):
+    G = _get_evaluator_G(G, scope)
+    G.func = cloudpickle.loads(func)
+
+
+def _worker_set_evaluator_params(G, param_values, scope):
+    G = _get_evaluator_G(G, scope)
+    for k, params in param_values.items():
+        obj = G.func.args[k] if isinstance(k, int) else G.func.kwargs[k]
+        obj.set_param_values(params)
+
+
+def _worker_run_evaluator(G, obj, scope):
+    return _get_evaluator_G(G, scope).func(obj)
+
+
 def compute_rewards_from_paths(all_paths, key='rewards', as_goal=True, env=None, terminal_eps=0.1):
     all_rewards = []
     all_states = []
@@ -108,43 +211,85 @@ def compute_rewards_from_paths(all_paths, key='rewards', as_goal=True, env=None,
     return [all_states, all_rewards]
 
 
-def label_states_from_paths(all_paths, min_reward=0, max_reward=1, key='rewards', as_goal=True,
-                 old_rewards=None, improvement_threshold=0, n_traj=1, env=None, return_mean_rewards = False,
-                            order_of_states = None):
-    state_dict = {}
-    for paths in all_paths:
+class StateRewardAccumulator(object):
+    """
+    Running count and sum of the path rewards obtained from each state (the goal of the path if as_goal, its start
+    otherwise). It can be fed the paths as they are collected (see the path_accumulator of BatchPolopt), so that
+    labeling the states does not require keeping all the paths in memory.
+    """
+
+    def __init__(self, key='rewards', as_goal=True, env=None):
+        self.key = key
+        self.as_goal = as_goal
+        self.env = env
+        self.counts = OrderedDict()
+        self.sums = dict()
+
+    def add_path(self, path):
+        reward = evaluate_path(path, key=self.key)
+        if self.as_goal:
+            state = tuple(path['env_infos']['goal'][0])
+        else:
+            env_infos_first_time_step = {key: value[0] for key, value in path['env_infos'].items()}
+            state = tuple(self.env.transform_to_start_space(path['observations'][0], env_infos_first_time_step))
+        if state in self.counts:
+            self.counts[state] += 1
+            self.sums[state] += reward
+        else:
+            self.counts[state] = 1
+            self.sums[state] = reward
+
+    def add_paths(self, paths):
         for path in paths:
-            reward = evaluate_path(path, key=key)
-            if as_goal:
-                state = tuple(path['env_infos']['goal'][0])
-            else:
-                env_infos_first_time_step = {key: value[0] for key, value in path['env_infos'].items()}
-                state = tuple(env.transform_to_start_space(path['observations'][0], env_infos_first_time_step))
-            if state in state_dict:
-                state_dict[state].append(reward)
-            else:
-                state_dict[state] = [reward]
+            self.add_path(path)
 
-    states = []
-    unlabeled_state = []
-    mean_rewards = []
+    def empty(self):
+        self.counts = OrderedDict()
+        self.sums = dict()
 
-    if order_of_states is None:
-        for state, rewards in state_dict.items():
-            if len(rewards) >= n_traj:
-                states.append(list(state))
-                mean_rewards.append(np.mean(rewards))
-    # case where you want states returned in a specific order (useful for TSCL)
-    else:
+    def mean_rewards(self, n_traj=1, order_of_states=None):
+        """
+        :return: the states with at least n_traj paths and their mean reward, or, if order_of_states is given,
+        all those states with a mean reward of 0 and an updated flag False when they have less than n_traj paths
+        """
+        states = []
+        mean_rewards = []
+        if order_of_states is None:
+            for state, count in self.counts.items():
+                if count >= n_traj:
+                    states.append(list(state))
+                    mean_rewards.append(self.sums[state] / count)
+            return states, mean_rewards, None
         updated = []
         for state in order_of_states:
             states.append(state)
-            if state not in state_dict or len(state_dict[tuple(state)]) < n_traj:
+            count = self.counts.get(tuple(state), 0)
+            if count < n_traj or count == 0:
                 mean_rewards.append(0)
                 updated.append(False)
             else:
-                mean_rewards.append(np.mean(state_dict[tuple(state)]))
+                mean_rewards.append(self.sums[tuple(state)] / count)
                 updated.append(True)
+        return states, mean_rewards, updated
+
+
+def label_states_from_paths(all_paths, min_reward=0, max_reward=1, key='rewards', as_goal=True,
+                 old_rewards=None, improvement_threshold=0, n_traj=1, env=None, return_mean_rewards = False,
+                            order_of_states = None):
+    accumulator = StateRewardAccumulator(key=key, as_goal=as_goal, env=env)
+    for paths in all_paths:
+        accumulator.add_paths(paths)
+    return label_states_from_accumulator(accumulator, min_reward=min_reward, max_reward=max_reward,
+                                         old_rewards=old_rewards, improvement_threshold=improvement_threshold,
+                                         n_traj=n_traj, return_mean_rewards=return_mean_rewards,
+                                         order_of_states=order_of_states)
+
+
+def label_states_from_accumulator(accumulator, min_reward=0, max_reward=1, old_rewards=None, improvement_threshold=0,
+                                  n_traj=1, return_mean_rewards=False, order_of_states=None):
+    """ Same as label_states_from_paths, from the rewards already aggregated by a StateRewardAccumulator """
+    # case where you want states returned in a specific order (useful for TSCL)
+    states, mean_rewards, updated = accumulator.mean_rewards(n_traj=n_traj, order_of_states=order_of_states)
 
     # Make this a vertical list.
     mean_rewards = np.array(mean_rewards).reshape(-1, 1)
@@ -161,11 +306,12 @@ def label_states_from_paths(all_paths, min_reward=0, max_reward=1, key='rewards'
 
 
 def label_states(states, env, policy, horizon, as_goals=True, min_reward=0.1, max_reward=0.9, key='rewards',
-                 old_rewards=None, improvement_threshold=0.1, n_traj=1, n_processes=-1, full_path=False, return_rew=False):
+                 old_rewards=None, improvement_threshold=0.1, n_traj=1, n_processes=-1, full_path=False, return_rew=False,
+                 n_envs=1):
     logger.log("Labelling starts")
     result = evaluate_states(
         states, env, policy, horizon, as_goals=as_goals,
-        n_traj=n_traj, n_processes=n_processes, key=key, full_path=full_path
+        n_traj=n_traj, n_processes=n_processes, key=key, full_path=full_path, n_envs=n_envs
     )
     if full_path:
         mean_rewards, paths = result
@@ -241,7 +387,15 @@ def convert_label(labels):
 
 def evaluate_states(states, env, policy, horizon, n_traj=1, n_processes=-1, full_path=False, key='rewards',
                     as_goals=True,
-                    aggregator=(np.sum, np.mean)):
+                    aggregator=(np.sum, np.mean), n_envs=1):
+    """
+    Evaluate the policy from every state. If n_envs > 1, each worker steps n_envs copies of the env in lockstep
+    (see evaluate_states_batch), with a single batched policy call per time step.
+    """
+    if n_envs > 1:
+        return _evaluate_states_chunked(states, env, policy, horizon, n_traj=n_traj, n_processes=n_processes,
+                                        full_path=full_path, key=key, as_goals=as_goals, aggregator=aggregator,
+                                        n_envs=n_envs)
     evaluate_state_wrapper = FunctionWrapper(
         evaluate_state,
         env=env,
@@ -257,6 +411,7 @@ def evaluate_states(states, env, policy, horizon, n_traj=1, n_processes=-1, full
         evaluate_state_wrapper,
         states,
         n_processes,
+        resident=True,
     )
 
     if full_path:
@@ -264,6 +419,79 @@ def evaluate_states(states, env, policy, horizon, n_traj=1, n_processes=-1, full
     return np.array(result)
 
 
+def _evaluate_states_chunked(states, env, policy, horizon, n_processes=-1, full_path=False, **kwargs):
+    if n_processes == -1:
+        n_processes = singleton_pool.n_parallel
+    states = list(states)
+    if len(states) == 0:
+        return (np.array([]), []) if full_path else np.array([])
+    n_chunks = max(min(n_processes, len(states)), 1)
+    chunk_size = int(np.ceil(len(states) / n_chunks))
+    chunks = [states[i:i + chunk_size] for i in range(0, len(states), chunk_size)]
+    evaluate_states_wrapper = FunctionWrapper(
+        evaluate_states_batch,
+        env=env,
+        policy=policy,
+        horizon=horizon,
+        full_path=full_path,
+        **kwargs
+    )
+    result = parallel_map(evaluate_states_wrapper, chunks, n_processes, resident=True)
+
+    if full_path:
+        return np.concatenate([chunk[0] for chunk in result]), [path for chunk in result for path in chunk[1]]
+    return np.concatenate(result)
+
+
+_cached_env_copies = weakref.WeakKeyDictionary()
+
+
+def _get_env_copies(env, n_envs):
+    """
+    Copies of env used by evaluate_states_batch, kept around as long as the same env is evaluated and it still pickles
+    to the same state: any change to env (a new goal, updated generators...) rebuilds the copies.
+    """
+    state = cloudpickle.dumps(env)
+    cached_state, copies = _cached_env_copies.get(env, (None, []))
+    if cached_state != state:
+        copies = []
+    while len(copies) < n_envs:
+        copies.append(cloudpickle.loads(state))
+    _cached_env_copies[env] = (state, copies)
+    return copies[:n_envs]
+
+
+def evaluate_states_batch(states, env, policy, horizon, n_traj=1, full_path=False, key='rewards', as_goals=True,
+                          aggregator=(np.sum, np.mean), n_envs=10):
+    """
+    Same output as evaluate_states with n_processes=1, but the n_traj rollouts of all the states are run n_envs at a
+    time with batch_rollout, so the policy is called once per time step for all the live envs.
+    """
+    if n_envs < 1:
+        raise ValueError("n_envs must be at least 1, got %s" % n_envs)
+    jobs = [i for i in range(len(states)) for _ in range(n_traj)]
+    envs = _get_env_copies(env, min(n_envs, len(jobs))) if jobs else []
+    all_paths = []
+    for wave_start in range(0, len(jobs), max(len(envs), 1)):
+        wave = jobs[wave_start:wave_start + len(envs)]
+        for state_idx, wave_env in zip(wave, envs):
+            if as_goals:
+                wave_env.update_goal_generator(FixedStateGenerator(states[state_idx]))
+            else:
+                wave_env.update_start_generator(FixedStateGenerator(states[state_idx]))
+        all_paths.extend(batch_rollout(envs[:len(wave)], policy, horizon))
+
+    mean_rewards = []
+    for i in range(len(states)):
+        paths = all_paths[i * n_traj:(i + 1) * n_traj]
+        mean_rewards.append(aggregator[1]([evaluate_path(path, key=key, aggregator=aggregator[0]) for path in paths]))
+    mean_rewards = np.array(mean_rewards)
+
+    if full_path:
+        return mean_rewards, all_paths
+    return mean_rewards
+
+
 def evaluate_state(state, env, policy, horizon, n_traj=1, full_path=False, key='rewards', as_goals=True,
                    aggregator=(np.sum, np.mean)):
     aggregated_data = []
@@ -274,7 +502,7 @@ def evaluate_state(state, env, policy, horizon, n_traj=1, full_path=False, key='
         env.update_start_generator(FixedStateGenerator(state))
 
     for j in range(n_traj):
-        paths.append(rollout(env, policy, horizon))
+        paths.append(preallocated_rollout(env, policy, horizon))
 
         if key in paths[-1]:
             aggregated_data.append(
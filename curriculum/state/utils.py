@@ -1,3 +1,4 @@
+import heapq
 import multiprocessing
 from rllab.sampler.stateful_pool import singleton_pool
 import scipy.spatial
@@ -18,31 +19,166 @@ import scipy.misc
 from curriculum.state.evaluator import parallel_map, disable_cuda_initializer
 
 
+class StateIndex(object):
+    """
+    Incrementally maintained index for nearest-neighbor distance queries over a growing set of points.
+    The points are held in a few cKDTrees of geometrically increasing size, that are merged and rebuilt only when a
+    chunk of new points is full, plus a buffer with the most recent points.
+    """
+
+    def __init__(self, chunk_size=1000):
+        self.chunk_size = chunk_size
+        self.trees = []
+        self.buffer = []
+        self.buffer_size = 0
+
+    @property
+    def size(self):
+        return sum(tree.n for tree in self.trees) + self.buffer_size
+
+    def add(self, points):
+        points = np.asarray(points, dtype=float)
+        if len(points) == 0:
+            return
+        self.buffer.append(points.reshape(len(points), -1))
+        self.buffer_size += len(points)
+        if self.buffer_size >= self.chunk_size:
+            data = np.concatenate(self.buffer)
+            self.buffer = []
+            self.buffer_size = 0
+            while len(self.trees) > 0 and self.trees[-1].n <= len(data):
+                data = np.concatenate([self.trees.pop().data, data])
+            self.trees.append(scipy.spatial.cKDTree(data))
+
+    def min_distances(self, points, distance_upper_bound=np.inf):
+        """ Distance from each point to its nearest indexed point (inf if it is above distance_upper_bound) """
+        points = np.asarray(points, dtype=float).reshape(len(points), -1)
+        dists = np.full(len(points), np.inf)
+        if len(points) == 0:
+            return dists
+        for tree in self.trees:
+            tree_dists, _ = tree.query(points, k=1, distance_upper_bound=distance_upper_bound)
+            dists = np.minimum(dists, tree_dists)
+        if self.buffer_size > 0:
+            buffer_dists = np.amin(scipy.spatial.distance.cdist(np.concatenate(self.buffer), points), axis=0)
+            buffer_dists[buffer_dists > distance_upper_bound] = np.inf
+            dists = np.minimum(dists, buffer_dists)
+        return dists
+
+    def __getstate__(self):
+        points = [tree.data for tree in self.trees] + self.buffer
+        return dict(chunk_size=self.chunk_size, points=np.concatenate(points) if points else np.zeros((0, 0)))
+
+    def __setstate__(self, d):
+        self.__init__(chunk_size=d['chunk_size'])
+        self.add(d['points'])
+
+
 class StateCollection(object):
     """ A collection of states, with minimum distance threshold for new states. """
 
     def __init__(self, distance_threshold=None, states_transform = None, idx_lim=None):
         self.distance_threshold = distance_threshold
-        self.state_list = []
         self.states_transform = states_transform
         self.idx_lim = idx_lim
-        if self.states_transform:
-            self.transformed_state_list = []
+        # states (and their transformation) are stored in the first _size rows of preallocated arrays that double
+        # their capacity when full
+        self._states = None
+        self._transformed_states = None
+        self._size = 0
+        self._index = None
 
     @property
     def size(self):
-        return len(self.state_list)
+        return self._size
 
     def empty(self):
-        self.state_list = []
+        # new buffers are allocated, so the arrays previously returned by states stay valid
+        self._states = None
+        self._transformed_states = None
+        self._size = 0
+        self._index = None
 
     def sample(self, size, replace=False, replay_noise=0):
-        states = sample_matrix_row(np.array(self.state_list), size, replace)
+        states = sample_matrix_row(self.states, size, replace)
+        if states.base is self._states:  # all the states were returned without sampling
+            states = states.copy()
         if replay_noise > 0:
             states += replay_noise * np.random.randn(*states.shape)
         return states
 
+    @property
+    def states(self):
+        """ Read-only view of the stored states """
+        if self._states is None:
+            return np.zeros((0, 0))
+        states = self._states[:self._size]
+        states.flags.writeable = False
+        return states
+
+    @property
+    def projected_states(self):
+        """ Read-only view of the stored states in the space where the distance threshold is checked """
+        if self.states_transform:
+            if self._transformed_states is None:
+                return np.zeros((0, 0))
+            states = self._transformed_states[:self._size]
+            states.flags.writeable = False
+            return states
+        return self.states[:, :self.idx_lim]
+
+    @property
+    def state_list(self):
+        """ The stored states as a list of lists, for code written for the former list storage """
+        return self.states.tolist()
+
+    @property
+    def transformed_state_list(self):
+        return self.projected_states.tolist()
+
+    def _store(self, states, transformed_states=None):
+        if len(states) == 0:
+            return
+        self._states = _append_rows(self._states, self._size, states)
+        if self.states_transform:
+            self._transformed_states = _append_rows(self._transformed_states, self._size, transformed_states)
+        self._size += len(states)
+
+    def __setstate__(self, d):
+        # collections pickled with the former list storage
+        state_list = d.pop('state_list', None)
+        transformed_state_list = d.pop('transformed_state_list', None)
+        self.__dict__.update(d)
+        if state_list is not None:
+            self._states, self._transformed_states, self._size, self._index = None, None, 0, None
+            if len(state_list) > 0:
+                if self.states_transform:
+                    self._store(np.array(state_list), np.array(transformed_state_list))
+                else:
+                    self._store(np.array(state_list))
+
+    def _project(self, states):
+        """ Space in which the distance threshold is checked: states_transform, or the first idx_lim coordinates """
+        states = np.asarray(states)
+        if self.states_transform:
+            return np.asarray(self.states_transform(states))
+        return states[:, :self.idx_lim]
+
+    def _get_index(self):
+        # collections pickled before the index existed build it on first use
+        if getattr(self, '_index', None) is None:
+            self._index = StateIndex()
+            if self._size > 0:
+                self._index.add(self.projected_states)
+        return self._index
+
     def append(self, states, n_process=None):
+        """
+        Add the states that are further than distance_threshold from the other new states (greedily, in order) and
+        from all the states already in the collection. The distance checks use an incrementally maintained StateIndex,
+        so n_process is only kept for backwards compatibility.
+        :return: the added states
+        """
         if self.states_transform:
             return self.append_states_transform(states)
         if len(states) > 0:
@@ -51,60 +187,51 @@ class StateCollection(object):
             if self.distance_threshold is not None and self.distance_threshold > 0:
                 states = self._process_states(states)
             logger.log("after processing, we are left with : {}".format(states.shape))
-            if n_process is None:
-                n_process = singleton_pool.n_parallel
-            elif n_process in [-1, 0]:
-                n_process = 1
-            if states.shape[0] >= n_process > 1:
-                states_per_process = states.shape[0] // singleton_pool.n_parallel
-                list_of_states = [states[i * states_per_process: (i+1) * states_per_process, :] for i in range(n_process-1)]
-                list_of_states.append(states[states_per_process * (n_process - 1):, :])
-                states = parallel_map(self._select_states, list_of_states)
-                states = np.concatenate(states)
-            else:
-                states = self._select_states(states)
-            self.state_list.extend(states.tolist())
-            return states
+            states = self._select_states(states)
+            self._get_index().add(self._project(states))
+            self._store(states)
+        return np.array(states)
 
     def _select_states(self, states):
-        # print('selecting states from shape: ', states.shape)
+        "keep only the states that are at more than dist_threshold from the states in the collection"
         selected_states = states
-        selected_states_idx_lim = np.array([state[:self.idx_lim] for state in states])
-        # print('selecting states from shape (after idx_lim of ', self.idx_lim, ': ', selected_states_idx_lim.shape)
-        state_list_idx_lim = np.array([state[:self.idx_lim] for state in self.state_list])
-        # print('the state_list_idx_lim shape: ', np.shape(self.state_list))
         if self.distance_threshold is not None and self.distance_threshold > 0:
-            if len(self.state_list) > 0:
-                dists = scipy.spatial.distance.cdist(state_list_idx_lim, selected_states_idx_lim)
-                indices = np.amin(dists, axis=0) > self.distance_threshold
-                selected_states = selected_states[indices, :]
-        # print('the selected states are: {}'.format(selected_states.shape))
+            if self._size > 0 and len(states) > 0:
+                dists = self._get_index().min_distances(self._project(states), 2 * self.distance_threshold)
+                selected_states = selected_states[dists > self.distance_threshold, :]
         return selected_states
 
+    def _greedy_select(self, transformed_states, block_size=256):
+        "indices of the states kept when scanning them in order, keeping those at more than dist_threshold from the kept"
+        transformed_states = np.asarray(transformed_states, dtype=float)
+        transformed_states = transformed_states.reshape(len(transformed_states), -1)
+        kept = []
+        kept_index = StateIndex()
+        for block_start in range(0, len(transformed_states), block_size):
+            block = transformed_states[block_start:block_start + block_size]
+            # states close to the ones kept in previous blocks are rejected at once, the rest are scanned in order
+            candidates = np.where(kept_index.min_distances(block, 2 * self.distance_threshold) >
+                                  self.distance_threshold)[0]
+            too_close = scipy.spatial.distance.cdist(block[candidates], block[candidates]) <= self.distance_threshold
+            block_kept = []
+            for j in range(len(candidates)):
+                if not np.any(too_close[j, block_kept]):
+                    block_kept.append(j)
+            kept.extend(block_start + candidates[block_kept])
+            kept_index.add(block[candidates[block_kept]])
+        return np.array(kept, dtype=int)
+
     def _process_states(self, states):
         "keep only the states that are at more than dist_threshold from each other"
         # adding a states transform allows you to maintain full state information while possibly disregarding some dim
         states = np.array(states)
-        results = [states[0]]
-        results_idx_lim = [states[0][:self.idx_lim]]
-        for i, state in enumerate(states[1:]):
-            # print("analyzing state : ", i)
-            if np.amin(scipy.spatial.distance.cdist(results_idx_lim, state.reshape(1, -1)[:self.idx_lim])) > self.distance_threshold:
-                results.append(state)
-                results_idx_lim.append(state[:self.idx_lim])
-        return np.array(results)
+        return states[self._greedy_select(self._project(states))]
 
     def _process_states_transform(self, states, transformed_states):
         "keep only the states that are at more than dist_threshold from each other"
         # adding a states transform allows you to maintain full state information while possibly disregarding some dim
-        results = [states[0]]
-        transformed_results = [transformed_states[0]]
-        for i in range(1, len(states)):
-            # checks if valid in transformed space
-            if np.amin(scipy.spatial.distance.cdist(transformed_results, transformed_states[i].reshape(1, -1))) > self.distance_threshold:
-                results.append(states[i])
-                transformed_results.append(transformed_states[i])
-        return np.array(results), np.array(transformed_results)
+        kept = self._greedy_select(transformed_states)
+        return np.array(states)[kept], np.array(transformed_states)[kept]
 
     def append_states_transform(self, states):
         assert self.idx_lim is None, "Can't use state transform and idx_lim with StateCollection!"
@@ -113,15 +240,13 @@ class StateCollection(object):
             transformed_states = self.states_transform(states)
             if self.distance_threshold is not None and self.distance_threshold > 0:
                 states, transformed_states = self._process_states_transform(states, transformed_states)
-                if len(self.state_list) > 0:
-                    print("hi")
-                    dists = scipy.spatial.distance.cdist(self.transformed_state_list, transformed_states)
-                    indices = np.amin(dists, axis=0) > self.distance_threshold
+                if self._size > 0:
+                    dists = self._get_index().min_distances(transformed_states, 2 * self.distance_threshold)
+                    indices = dists > self.distance_threshold
                     states = states[indices, :]
                     transformed_states = transformed_states[indices, :]
-            self.state_list.extend(states)
-            self.transformed_state_list.extend(transformed_states)
-            assert(len(self.state_list) == len(self.transformed_state_list))
+            self._get_index().add(transformed_states)
+            self._store(states, transformed_states)
         return states # modifed to return added states
 
     # def append(self, states):
@@ -138,10 +263,6 @@ class StateCollection(object):
     #         self.state_list.extend(states)
     #     return states # modifed to return added states
 
-    @property
-    def states(self):
-        return np.array(self.state_list)
-
 class SmartStateCollection(StateCollection):
     # should be used same as before, just need to update Q values
     #TODO: update alpha smartly
@@ -149,11 +270,67 @@ class SmartStateCollection(StateCollection):
         self.eps = eps # percentage of random
         self.alpha = alpha
         self.abs = abs
-        self.q_vals = {} #TODO: smarter way to keep list sorted, maybe priority queue?
-        # use heapq https://stackoverflow.com/questions/7197315/5-maximum-values-in-a-python-dictionary if slow
+        self.q_vals = {}
         self.prev_vals = {}
+        # slot of each state (its first row in the collection, also the order of insertion in q_vals), the key of
+        # every row, and a max-heap of (-priority, slot) with lazy deletion: entries whose priority is no longer the
+        # current one, or whose slot is not the slot of its state, are skipped
+        self._slots = {}
+        self._slot_keys = []
+        self._heap = []
         super(SmartStateCollection, self).__init__(*args, **kwargs)
 
+    @staticmethod
+    def _key(state):
+        return tuple(np.asarray(state, dtype=float).ravel())
+
+    def _priority(self, q_val):
+        return abs(q_val) if self.abs else q_val
+
+    def _set_q(self, key, q_val):
+        self.q_vals[key] = q_val
+        heapq.heappush(self._heap, (-self._priority(q_val), self._slots[key]))
+        if len(self._heap) > 2 * len(self.q_vals) + 100:
+            self._rebuild_heap()
+
+    def _rebuild_heap(self):
+        self._heap = [(-self._priority(self.q_vals[key]), self._slots[key]) for key in self.q_vals]
+        heapq.heapify(self._heap)
+
+    def _top_slots(self, k):
+        """ Slots of the k states with highest priority, ties broken by order of insertion """
+        top, popped = [], []
+        seen = set()
+        while self._heap and len(top) < k:
+            entry = heapq.heappop(self._heap)
+            neg_priority, slot = entry
+            key = self._slot_keys[slot]
+            if slot in seen or self._slots[key] != slot or -neg_priority != self._priority(self.q_vals[key]):
+                continue  # stale entry, dropped for good
+            top.append(slot)
+            seen.add(slot)
+            popped.append(entry)
+        for entry in popped:
+            heapq.heappush(self._heap, entry)
+        return top
+
+    def empty(self):
+        super(SmartStateCollection, self).empty()
+        self.q_vals = {}
+        self.prev_vals = {}
+        self._slots = {}
+        self._slot_keys = []
+        self._heap = []
+
+    def __setstate__(self, d):
+        super(SmartStateCollection, self).__setstate__(d)
+        if '_heap' not in d:  # pickled before the slots and heap existed
+            self._slot_keys = [self._key(state) for state in self.states]
+            self._slots = {}
+            for slot, key in enumerate(self._slot_keys):
+                self._slots.setdefault(key, slot)
+            self._rebuild_heap()
+
     def update_starts(self, states, rewards, only_good = True, logger = None):
         old_states, old_rewards, new_states, new_rewards = [], [], [], []
         for i in range(len(states)):
@@ -165,7 +342,7 @@ class SmartStateCollection(StateCollection):
                 if reward < 0.02 or reward > 0.98:
                     continue
             # check if state shows up
-            if len(self.state_list) > 0 and np.sum(np.all(state == self.state_list, axis = 1)) > 0:
+            if self._key(state) in self._slots:
                 old_states.append(state)
                 old_rewards.append(reward)
             else:
@@ -177,29 +354,29 @@ class SmartStateCollection(StateCollection):
         self.update_q(old_states, old_rewards)
 
     def append(self, states, rewards):
-        zero_index = 0 # check on np.argmax
+        first_index = {}
+        for index, state in enumerate(states):
+            first_index.setdefault(self._key(state), index)
         added_states = super(SmartStateCollection, self).append(states)
         for state in added_states:
-            index = np.argmax(np.all(states == state, axis =1)) # should only get one index
-            if index == 0:
-                zero_index += 1
-            reward = rewards[index]
-            self.q_vals[tuple(state)] = self.alpha * reward # TODO: not sure what the initialization should be, is there alpha term?
-            self.prev_vals[tuple(state)] = reward
-        assert (zero_index < 2)
+            key = self._key(state)
+            reward = rewards[first_index[key]]
+            # a state stored more than once keeps the slot of its first row, so that it is sampled once by priority
+            self._slots.setdefault(key, len(self._slot_keys))
+            self._slot_keys.append(key)
+            self._set_q(key, self.alpha * reward) # TODO: not sure what the initialization should be, is there alpha term?
+            self.prev_vals[key] = reward
 
     def sample(self, size, replace=False, replay_noise=0):
         size_random_samples = int(size * self.eps)
         size_good_samples = size - size_random_samples
         print("Random starts: {}".format(size_random_samples))
-        states = sample_matrix_row(np.array(self.state_list), size_random_samples, replace)
+        states = sample_matrix_row(self.states, size_random_samples, replace)
+        if states.base is self._states:
+            states = states.copy()
         if size_good_samples == 0:
             return states # fully uniform states
-        if self.abs:
-            good_states = sorted(self.q_vals, key= lambda k: abs(self.q_vals[k]), reverse=True)[:size_good_samples]
-        else:
-            good_states = sorted(self.q_vals, key=self.q_vals.get, reverse=True)[:size_good_samples]
-        good_states = np.array(good_states)
+        good_states = self.states[self._top_slots(size_good_samples)]
         return np.concatenate((states, good_states))
         # if replay_noise > 0:
         #     states += replay_noise * np.random.randn(*states.shape)
@@ -207,22 +384,30 @@ class SmartStateCollection(StateCollection):
 
     def update_q(self, states, rewards):
         # updated should be true if there are enough samples
-        previous_values = np.array([self.prev_vals[tuple(state)] for state in states])
-        curr_q_values =  np.array([self.q_vals[tuple(state)] for state in states])
+        keys = [self._key(state) for state in states]
+        previous_values = np.array([self.prev_vals[key] for key in keys])
+        curr_q_values =  np.array([self.q_vals[key] for key in keys])
         improvement = rewards - previous_values
         new_values = self.alpha * improvement + (1 - self.alpha) * curr_q_values
 
         for i in range(len(states)):
             # if updated[i]:
-            self.q_vals[tuple(states[i])] = new_values[i]
-            self.prev_vals[tuple(states[i])] = rewards[i]
-
-
-
-
-
-
-
+            self._set_q(keys[i], new_values[i])
+            self.prev_vals[keys[i]] = rewards[i]
+
+
+def _append_rows(buffer, size, rows):
+    """ Write rows after the first size rows of buffer, doubling its capacity if needed. Returns the buffer. """
+    rows = np.asarray(rows, dtype=float)
+    rows = rows.reshape(len(rows), -1)
+    if buffer is None:
+        buffer = np.empty((max(len(rows), 1024), rows.shape[1]))
+    elif size + len(rows) > len(buffer):
+        new_buffer = np.empty((max(2 * len(buffer), size + len(rows)), buffer.shape[1]))
+        new_buffer[:size] = buffer[:size]
+        buffer = new_buffer
+    buffer[size:size + len(rows)] = rows
+    return buffer
 
 
 def sample_matrix_row(M, size, replace=False):
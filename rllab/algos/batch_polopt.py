@@ -1,5 +1,8 @@
+from concurrent.futures import Future, ThreadPoolExecutor
+
 from rllab.algos.base import RLAlgorithm
 from rllab.sampler import parallel_sampler
+from rllab.sampler.stateful_pool import singleton_pool
 from rllab.sampler.base import BaseSampler
 import rllab.misc.logger as logger
 import rllab.plotter as plotter
@@ -7,25 +10,66 @@ from rllab.policies.base import Policy
 
 
 class BatchSampler(BaseSampler):
-    def __init__(self, algo):
+    def __init__(self, algo, shared_memory=False, fixed_path_length=False):
         """
         :type algo: BatchPolopt
+        :param shared_memory: Whether the workers send the paths back through shared memory instead of pickling them.
+        :param fixed_path_length: Whether all the paths last exactly max_path_length steps (the env never terminates
+        earlier), so that the number of paths of each worker is fixed up front.
         """
         self.algo = algo
+        self.shared_memory = shared_memory
+        self.fixed_path_length = fixed_path_length
+        self._executor = None
 
     def start_worker(self):
         parallel_sampler.populate_task(self.algo.env, self.algo.policy, scope=self.algo.scope)
 
     def shutdown_worker(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
         parallel_sampler.terminate_task(scope=self.algo.scope)
 
     def obtain_samples(self, itr):
-        cur_params = self.algo.policy.get_param_values()
+        return self._sample(self.algo.policy.get_param_values())
+
+    def obtain_samples_async(self, itr):
+        """
+        Start collecting samples with the current policy parameters in a background thread of the master, while the
+        workers collect them. The pool is locked for the whole collection, so the other calls to the pool wait for it
+        to finish. Without parallel workers, the samples are collected right away.
+        :return: a future whose result is the list of paths
+        """
+        if singleton_pool.n_parallel <= 1:
+            # the single "worker" is the master itself, which would sample with the policy being optimized
+            future = Future()
+            future.set_result(self.obtain_samples(itr))
+            return future
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=1)
+        return self._executor.submit(self._sample_locked, self.algo.policy.get_param_values())
+
+    def _sample_locked(self, cur_params):
+        with singleton_pool.lock:
+            # no progress bar, as the master is logging the optimization at the same time
+            return self._sample(cur_params, show_prog_bar=False)
+
+    def __getstate__(self):
+        # the algo (and its sampler) is pickled in the snapshots
+        d = dict(self.__dict__)
+        d["_executor"] = None
+        return d
+
+    def _sample(self, cur_params, show_prog_bar=True):
         paths = parallel_sampler.sample_paths(
             policy_params=cur_params,
             max_samples=self.algo.batch_size,
             max_path_length=self.algo.max_path_length,
             scope=self.algo.scope,
+            shared_memory=self.shared_memory,
+            fixed_path_length=self.fixed_path_length,
+            show_prog_bar=show_prog_bar,
         )
         if self.algo.whole_paths:
             return paths
@@ -60,6 +104,9 @@ class BatchPolopt(RLAlgorithm):
             whole_paths=True,
             sampler_cls=None,
             sampler_args=None,
+            path_accumulator=None,
+            return_all_paths=True,
+            pipelined_sampling=False,
             **kwargs
     ):
         """
@@ -81,6 +128,15 @@ class BatchPolopt(RLAlgorithm):
         :param positive_adv: Whether to shift the advantages so that they are always positive. When used in
         conjunction with center_adv the advantages will be standardized before shifting.
         :param store_paths: Whether to save all paths data to the snapshot.
+        :param path_accumulator: Object with an add_paths(paths) method, fed with the paths of every iteration as soon
+        as they are sampled (e.g. a curriculum.state.evaluator.StateRewardAccumulator).
+        :param return_all_paths: Whether train keeps the paths of all the iterations in memory and returns them.
+        :param pipelined_sampling: Whether the workers collect the samples of the next iteration while the policy is
+        optimized on the current ones. The samples of every iteration but the first are then collected with the
+        parameters of one iteration before. Algorithms whose optimization depends on the distribution of the policy
+        that collected the samples (like NPO) recompute it with the current parameters, and weight the advantages by
+        the truncated importance ratio of the current policy to the stale one. Requires a sampler with
+        obtain_samples_async.
         """
         self.env = env
         self.policy = policy
@@ -98,6 +154,9 @@ class BatchPolopt(RLAlgorithm):
         self.positive_adv = positive_adv
         self.store_paths = store_paths
         self.whole_paths = whole_paths
+        self.path_accumulator = path_accumulator
+        self.return_all_paths = return_all_paths
+        self.pipelined_sampling = pipelined_sampling
         if sampler_cls is None:
             sampler_cls = BatchSampler
         if sampler_args is None:
@@ -118,9 +177,19 @@ class BatchPolopt(RLAlgorithm):
         if not already_init:
             self.init_opt()
         all_paths = []
+        next_paths = None
+        if self.pipelined_sampling and self.current_itr < self.n_itr:
+            next_paths = self.sampler.obtain_samples_async(self.current_itr)
         for itr in range(self.current_itr, self.n_itr):
             with logger.prefix('itr #%d | ' % itr):
-                paths = self.sampler.obtain_samples(itr)
+                if next_paths is not None:
+                    paths = next_paths.result()
+                    # collected with the parameters from before the optimization of this iteration
+                    next_paths = self.sampler.obtain_samples_async(itr + 1) if itr + 1 < self.n_itr else None
+                else:
+                    paths = self.sampler.obtain_samples(itr)
+                if self.path_accumulator is not None:
+                    self.path_accumulator.add_paths(paths)
                 samples_data = self.sampler.process_samples(itr, paths)
                 self.log_diagnostics(paths)
                 self.optimize_policy(itr, samples_data)
@@ -130,7 +199,8 @@ class BatchPolopt(RLAlgorithm):
                 params["algo"] = self
                 if self.store_paths:
                     params["paths"] = samples_data["paths"]
-                all_paths.append(paths)
+                if self.return_all_paths:
+                    all_paths.append(paths)
                 logger.save_itr_params(itr, params)
                 logger.log("saved")
                 logger.dump_tabular(with_prefix=False)
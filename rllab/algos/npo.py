@@ -1,3 +1,5 @@
+import numpy as np
+
 from rllab.misc import ext
 from rllab.misc.overrides import overrides
 from rllab.algos.batch_polopt import BatchPolopt
@@ -18,8 +20,13 @@ class NPO(BatchPolopt):
             optimizer_args=None,
             step_size=0.01,
             truncate_local_is_ratio=None,
+            truncate_stale_is_ratio=1.,
             **kwargs
     ):
+        """
+        :param truncate_stale_is_ratio: With pipelined sampling, upper bound of the importance ratio of the current
+        policy to the one that collected the samples, by which the advantages are weighted.
+        """
         if optimizer is None:
             if optimizer_args is None:
                 optimizer_args = dict()
@@ -27,6 +34,7 @@ class NPO(BatchPolopt):
         self.optimizer = optimizer
         self.step_size = step_size
         self.truncate_local_is_ratio = truncate_local_is_ratio
+        self.truncate_stale_is_ratio = truncate_stale_is_ratio
         super(NPO, self).__init__(**kwargs)
 
     @overrides
@@ -72,6 +80,7 @@ class NPO(BatchPolopt):
         dist_info_vars = self.policy.dist_info_sym(obs_var, state_info_vars)
         kl = dist.kl_sym(old_dist_info_vars, dist_info_vars)
         lr = dist.likelihood_ratio_sym(action_var, old_dist_info_vars, dist_info_vars)
+        stale_lr = lr
         if self.truncate_local_is_ratio is not None:
             lr = TT.minimum(self.truncate_local_is_ratio, lr)
         if is_recurrent:
@@ -96,6 +105,13 @@ class NPO(BatchPolopt):
             inputs=input_list,
             constraint_name="mean_kl"
         )
+        if self.pipelined_sampling:
+            # fed with the distribution of the policy that collected the samples as the old one
+            self._f_stale_is_ratio = ext.compile_function(
+                inputs=[obs_var, action_var] + state_info_vars_list + old_dist_info_vars_list,
+                outputs=[stale_lr] + [dist_info_vars[k] for k in dist.dist_info_keys],
+                log_name="f_stale_is_ratio",
+            )
         return dict()
 
     @overrides
@@ -106,7 +122,23 @@ class NPO(BatchPolopt):
         ))
         agent_infos = samples_data["agent_infos"]
         state_info_list = [agent_infos[k] for k in self.policy.state_info_keys]
-        dist_info_list = [agent_infos[k] for k in self.policy.distribution.dist_info_keys]
+        if self.pipelined_sampling:
+            # the samples were collected with the parameters of one iteration before: the likelihood ratio and the KL
+            # constraint are taken with respect to the current policy, so that the trust region is around it, and the
+            # advantages are weighted by the truncated importance ratio of the current policy to the stale one
+            stale_dist_info_list = [agent_infos[k] for k in self.policy.distribution.dist_info_keys]
+            outputs = self._f_stale_is_ratio(
+                samples_data["observations"], samples_data["actions"], *(state_info_list + stale_dist_info_list))
+            is_ratio = np.minimum(outputs[0], self.truncate_stale_is_ratio)
+            dist_info_list = outputs[1:]
+            all_input_values = all_input_values[:2] + (all_input_values[2] * is_ratio,)
+            if self.policy.recurrent:
+                mean_is_ratio = np.sum(is_ratio * samples_data["valids"]) / np.sum(samples_data["valids"])
+            else:
+                mean_is_ratio = np.mean(is_ratio)
+            logger.record_tabular('MeanStaleISRatio', mean_is_ratio)
+        else:
+            dist_info_list = [agent_infos[k] for k in self.policy.distribution.dist_info_keys]
         all_input_values += tuple(state_info_list) + tuple(dist_info_list)
         if self.policy.recurrent:
             all_input_values += (samples_data["valids"],)
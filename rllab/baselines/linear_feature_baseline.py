@@ -4,9 +4,18 @@ import numpy as np
 
 
 class LinearFeatureBaseline(Baseline):
-    def __init__(self, env_spec, reg_coeff=1e-5):
+    def __init__(self, env_spec, reg_coeff=1e-5, stats_decay=None):
+        """
+        :param stats_decay: if not None, fit on the statistics X^T X and X^T y of all the previous batches, multiplied
+        by stats_decay at every fit, plus the ones of the new batch (instead of only the ones of the new batch)
+        """
         self._coeffs = None
         self._reg_coeff = reg_coeff
+        self._stats_decay = stats_decay
+        self._xtx = None
+        self._xty = None
+        self._cached_paths = None
+        self._cached_featmat = None
 
     @overrides
     def get_param_values(self, **tags):
@@ -22,15 +31,46 @@ class LinearFeatureBaseline(Baseline):
         al = np.arange(l).reshape(-1, 1) / 100.0
         return np.concatenate([o, o ** 2, al, al ** 2, al ** 3, np.ones((l, 1))], axis=1)
 
+    def _batch_features(self, paths):
+        """
+        Same as concatenating the _features of all the paths, computed in one pass. The features of the last batch
+        given to predict_n are kept until the next fit, which is usually called on the same paths.
+        """
+        if self._cached_paths is not None and len(self._cached_paths) == len(paths) and \
+                all(cached is path for cached, path in zip(self._cached_paths, paths)):
+            return self._cached_featmat
+        lengths = [len(path["rewards"]) for path in paths]
+        o = np.concatenate([path["observations"] for path in paths])
+        o = o.reshape(len(o), -1)
+        obs_dim = o.shape[1]
+        starts = np.cumsum(lengths) - lengths
+        al = (np.arange(len(o)) - np.repeat(starts, lengths)) / 100.0
+        featmat = np.empty((len(o), 2 * obs_dim + 4), dtype=np.result_type(o, al))
+        np.clip(o, -10, 10, out=featmat[:, :obs_dim])
+        np.square(featmat[:, :obs_dim], out=featmat[:, obs_dim:2 * obs_dim])
+        featmat[:, 2 * obs_dim] = al
+        featmat[:, 2 * obs_dim + 1] = al ** 2
+        featmat[:, 2 * obs_dim + 2] = al ** 3
+        featmat[:, 2 * obs_dim + 3] = 1
+        return featmat
+
     @overrides
     def fit(self, paths):
-        featmat = np.concatenate([self._features(path) for path in paths])
+        featmat = self._batch_features(paths)
+        self._cached_paths = self._cached_featmat = None
         returns = np.concatenate([path["returns"] for path in paths])
+        xtx = featmat.T.dot(featmat)
+        xty = featmat.T.dot(returns)
+        if self._stats_decay is not None:
+            if self._xtx is not None and self._xtx.shape == xtx.shape:
+                xtx += self._stats_decay * self._xtx
+                xty += self._stats_decay * self._xty
+            self._xtx, self._xty = xtx, xty
         reg_coeff = self._reg_coeff
         for _ in range(5):
             self._coeffs = np.linalg.lstsq(
-                featmat.T.dot(featmat) + reg_coeff * np.identity(featmat.shape[1]),
-                featmat.T.dot(returns)
+                xtx + reg_coeff * np.identity(featmat.shape[1]),
+                xty
             )[0]
             if not np.any(np.isnan(self._coeffs)):
                 break
@@ -41,3 +81,21 @@ class LinearFeatureBaseline(Baseline):
         if self._coeffs is None:
             return np.zeros(len(path["rewards"]))
         return self._features(path).dot(self._coeffs)
+
+    def predict_n(self, paths):
+        lengths = [len(path["rewards"]) for path in paths]
+        featmat = self._batch_features(paths)
+        self._cached_paths, self._cached_featmat = list(paths), featmat
+        if self._coeffs is None:
+            return [np.zeros(l) for l in lengths]
+        return np.split(featmat.dot(self._coeffs), np.cumsum(lengths)[:-1])
+
+    def __getstate__(self):
+        d = dict(self.__dict__)
+        d["_cached_paths"] = d["_cached_featmat"] = None
+        return d
+
+    def __setstate__(self, d):
+        # pickles from before the statistics and the features cache were added
+        self.__dict__.update(dict(_stats_decay=None, _xtx=None, _xty=None, _cached_paths=None, _cached_featmat=None))
+        self.__dict__.update(d)
@@ -178,7 +178,9 @@ class GatherEnv(ProxyEnv, Serializable):
         self.sensor_span = sensor_span
         self.coef_inner_rew = coef_inner_rew
         self.dying_cost = dying_cost
-        self.objects = []
+        # x, y and type of the objects, of which the first _n_objects are left
+        self._objects = np.zeros((n_apples + n_bombs, 3))
+        self._n_objects = 0
         self.viewer = None
         # super(GatherEnv, self).__init__(*args, **kwargs)
         model_cls = self.__class__.MODEL_CLASS
@@ -222,10 +224,19 @@ class GatherEnv(ProxyEnv, Serializable):
         # pylint: enable=not-callable
         ProxyEnv.__init__(self, inner_env)  # to access the inner env, do self.wrapped_env
 
+    @property
+    def objects(self):
+        """ Array of the x, y and type of the objects left in the episode """
+        return self._objects[:self._n_objects]
+
+    def _add_object(self, x, y, typ):
+        self._objects[self._n_objects] = x, y, typ
+        self._n_objects += 1
+
     def reset(self, also_wrapped=True):
-        self.objects = []
+        self._n_objects = 0
         existing = set()
-        while len(self.objects) < self.n_apples:
+        while self._n_objects < self.n_apples:
             x = np.random.randint(-self.activity_range / 2,
                                   self.activity_range / 2) * 2
             y = np.random.randint(-self.activity_range / 2,
@@ -236,9 +247,9 @@ class GatherEnv(ProxyEnv, Serializable):
             if (x, y) in existing:
                 continue
             typ = APPLE
-            self.objects.append((x, y, typ))
+            self._add_object(x, y, typ)
             existing.add((x, y))
-        while len(self.objects) < self.n_apples + self.n_bombs:
+        while self._n_objects < self.n_apples + self.n_bombs:
             x = np.random.randint(-self.activity_range / 2,
                                   self.activity_range / 2) * 2
             y = np.random.randint(-self.activity_range / 2,
@@ -249,7 +260,7 @@ class GatherEnv(ProxyEnv, Serializable):
             if (x, y) in existing:
                 continue
             typ = BOMB
-            self.objects.append((x, y, typ))
+            self._add_object(x, y, typ)
             existing.add((x, y))
 
         if also_wrapped:
@@ -265,8 +276,10 @@ class GatherEnv(ProxyEnv, Serializable):
         com = self.wrapped_env.get_body_com("torso")
         x, y = com[:2]
         reward = self.coef_inner_rew * inner_rew
+        # python floats give the same results as the numpy scalars, faster
+        x, y = float(x), float(y)
         new_objs = []
-        for obj in self.objects:
+        for obj in self.objects.tolist():
             ox, oy, typ = obj
             # object within zone!
             if (ox - x) ** 2 + (oy - y) ** 2 < self.catch_range ** 2:
@@ -278,8 +291,10 @@ class GatherEnv(ProxyEnv, Serializable):
                     info['outer_rew'] = -1
             else:
                 new_objs.append(obj)
-        self.objects = new_objs
-        done = len(self.objects) == 0
+        if len(new_objs) < self._n_objects:
+            self._n_objects = len(new_objs)
+            self._objects[:self._n_objects] = np.reshape(new_objs, (-1, 3))
+        done = self._n_objects == 0
         return Step(self.get_current_obs(), reward, done, **info)
 
     def get_readings(self):  # equivalent to get_current_maze_obs in maze_env.py
@@ -288,19 +303,19 @@ class GatherEnv(ProxyEnv, Serializable):
         apple_readings = np.zeros(self.n_bins)
         bomb_readings = np.zeros(self.n_bins)
         robot_x, robot_y = self.wrapped_env.get_body_com("torso")[:2]
-        # sort objects by distance to the robot, so that farther objects'
-        # signals will be occluded by the closer ones'
-        sorted_objects = sorted(
-            self.objects, key=lambda o:
-            (o[0] - robot_x) ** 2 + (o[1] - robot_y) ** 2)[::-1]
-        # fill the readings
+        robot_x, robot_y = float(robot_x), float(robot_y)
         bin_res = self.sensor_span / self.n_bins
+        half_span = self.sensor_span * 0.5
 
-        ori = self.get_ori()  # overwrite this for Ant!
+        ori = np.asarray(self.get_ori()).item()  # overwrite this for Ant!
 
-        for ox, oy, typ in sorted_objects:
+        # the closest object of each type in a bin occludes the farther ones (and the first one the others at the same
+        # distance), so only the closest ones are kept instead of sorting all the objects by distance
+        closest = dict()
+        for ox, oy, typ in self.objects.tolist():
             # compute distance between object and robot
-            dist = ((oy - robot_y) ** 2 + (ox - robot_x) ** 2) ** 0.5
+            sq_dist = (ox - robot_x) ** 2 + (oy - robot_y) ** 2
+            dist = sq_dist ** 0.5
             # only include readings for objects within range
             if dist > self.sensor_range:
                 continue
@@ -313,10 +328,13 @@ class GatherEnv(ProxyEnv, Serializable):
             if angle < -math.pi:
                 angle = angle + 2 * math.pi
             # outside of sensor span - skip this
-            half_span = self.sensor_span * 0.5
             if abs(angle) > half_span:
                 continue
             bin_number = int((angle + half_span) / bin_res)
+            if (bin_number, typ) not in closest or sq_dist < closest[bin_number, typ][0]:
+                closest[bin_number, typ] = (sq_dist, dist)
+        # fill the readings
+        for (bin_number, typ), (_, dist) in closest.items():
             intensity = 1.0 - dist / self.sensor_range
             if typ == APPLE:
                 apple_readings[bin_number] = intensity
@@ -8,7 +8,7 @@ from rllab import spaces
 from rllab.envs.base import Step
 from rllab.envs.proxy_env import ProxyEnv
 from rllab.envs.mujoco.maze.maze_env_utils import construct_maze
-from rllab.envs.mujoco.maze.maze_env_utils import ray_segment_intersect, point_distance
+from rllab.envs.mujoco.maze.maze_env_utils import rays_segments_intersect, point_distance
 from rllab.envs.mujoco.mujoco_env import MODEL_DIR, BIG
 from rllab.core.serializable import Serializable
 from rllab.misc.overrides import overrides
@@ -119,7 +119,7 @@ class MazeEnv(ProxyEnv, Serializable):
         tree.write(file_path)  # here we write a temporal file with the robot specifications. Why not the original one??
 
         self._goal_range = self._find_goal_range()
-        self._cached_segments = None
+        self._cached_segments = self._get_segments()
 
         inner_env = model_cls(*args, file_path=file_path, **kwargs)  # file to the robot specifications
         ProxyEnv.__init__(self, inner_env)  # here is where the robot env will be initialized
@@ -130,13 +130,48 @@ class MazeEnv(ProxyEnv, Serializable):
         robot_x, robot_y = self.wrapped_env.get_body_com("torso")[:2]
         ori = self.get_ori()
 
+        segments, is_goal = self._cached_segments
+
+        wall_readings = np.zeros(self._n_bins)
+        goal_readings = np.zeros(self._n_bins)
+
+        ray_oris = [ori - self._sensor_span * 0.5 + 1.0 * (2 * ray_idx + 1) / (2 * self._n_bins) * self._sensor_span
+                    for ray_idx in range(self._n_bins)]
+        valid, xi, yi = rays_segments_intersect((robot_x, robot_y), ray_oris, segments)
+        # the distances are computed with point_distance to be exactly the same as with ray_segment_intersect, but
+        # only for the intersections that can be the closest one (np.sqrt can differ from ** 0.5 in the last bit)
+        approx_distances = np.where(valid, np.sqrt((xi - robot_x) ** 2 + (yi - robot_y) ** 2), np.inf)
+        min_distances = approx_distances.min(axis=1, keepdims=True)
+        candidates = approx_distances <= min_distances * (1 + 1e-9)
+
+        for ray_idx in np.flatnonzero(np.isfinite(min_distances[:, 0])):
+            first_idx, first_distance = None, None
+            for seg_idx in np.flatnonzero(candidates[ray_idx]):
+                distance = point_distance((xi[ray_idx, seg_idx], yi[ray_idx, seg_idx]), (robot_x, robot_y))
+                # the first segment wins ties, as with a stable sort of the segments by distance
+                if first_distance is None or distance < first_distance:
+                    first_idx, first_distance = seg_idx, distance
+            if first_distance <= self._sensor_range:
+                if is_goal[first_idx]:
+                    goal_readings[ray_idx] = (self._sensor_range - first_distance) / self._sensor_range
+                else:
+                    wall_readings[ray_idx] = (self._sensor_range - first_distance) / self._sensor_range
+
+        obs = np.concatenate([
+            wall_readings,
+            goal_readings
+        ])
+        return obs
+
+    def _get_segments(self):
+        """
+        :return: array of the line segments x1, y1, x2, y2 of the goal and the obstacles, and whether each is a goal
+        """
         structure = self.MAZE_STRUCTURE
         size_scaling = self.MAZE_SIZE_SCALING
 
         segments = []
-        # compute the distance of all segments
-
-        # Get all line segments of the goal and the obstacles
+        is_goal = []
         for i in range(len(structure)):
             for j in range(len(structure[0])):
                 if structure[i][j] == 1 or structure[i][j] == 'g':
@@ -152,46 +187,10 @@ class MazeEnv(ProxyEnv, Serializable):
                         ((x2, y2), (x1, y2)),
                         ((x1, y2), (x1, y1)),
                     ]
-                    for seg in struct_segments:
-                        segments.append(dict(
-                            segment=seg,
-                            type=structure[i][j],
-                        ))
-
-        wall_readings = np.zeros(self._n_bins)
-        goal_readings = np.zeros(self._n_bins)
-
-        for ray_idx in range(self._n_bins):
-            ray_ori = ori - self._sensor_span * 0.5 + 1.0 * (2 * ray_idx + 1) / (2 * self._n_bins) * self._sensor_span
-            ray_segments = []
-            for seg in segments:
-                p = ray_segment_intersect(ray=((robot_x, robot_y), ray_ori), segment=seg["segment"])
-                if p is not None:
-                    ray_segments.append(dict(
-                        segment=seg["segment"],
-                        type=seg["type"],
-                        ray_ori=ray_ori,
-                        distance=point_distance(p, (robot_x, robot_y)),
-                    ))
-            if len(ray_segments) > 0:
-                first_seg = sorted(ray_segments, key=lambda x: x["distance"])[0]
-                # print first_seg
-                if first_seg["type"] == 1:
-                    # Wall -> add to wall readings
-                    if first_seg["distance"] <= self._sensor_range:
-                        wall_readings[ray_idx] = (self._sensor_range - first_seg["distance"]) / self._sensor_range
-                elif first_seg["type"] == 'g':
-                    # Goal -> add to goal readings
-                    if first_seg["distance"] <= self._sensor_range:
-                        goal_readings[ray_idx] = (self._sensor_range - first_seg["distance"]) / self._sensor_range
-                else:
-                    assert False
-
-        obs = np.concatenate([
-            wall_readings,
-            goal_readings
-        ])
-        return obs
+                    for (xa, ya), (xb, yb) in struct_segments:
+                        segments.append((xa, ya, xb, yb))
+                        is_goal.append(structure[i][j] == 'g')
+        return np.array(segments, dtype=np.float64).reshape(-1, 4), np.array(is_goal, dtype=bool)
 
     def get_current_robot_obs(self):
         return self.wrapped_env.get_current_obs()
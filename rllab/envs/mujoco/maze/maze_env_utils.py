@@ -96,6 +96,37 @@ def point_distance(p1, p2):
     return ((x1 - x2) ** 2 + (y1 - y2) ** 2) ** 0.5
 
 
+def rays_segments_intersect(pt, thetas, segments):
+    """
+    ray_segment_intersect of all the rays originated from pt with the directions thetas against all the segments at
+    once. The operations are the ones of line_intersect, in the same order, so the intersection points are identical.
+    :param segments: array of shape (n_segments, 4) whose rows are the segments x1, y1, x2, y2
+    :return: boolean array of shape (n_rays, n_segments) of whether each ray intersects each segment, and the x and y
+    coordinates of the intersection points (only meaningful where there is one)
+    """
+    DET_TOLERANCE = 0.00000001
+
+    # the first line is the ray, from pt to the point at distance 1 along it (one row per ray)
+    x1, y1 = pt
+    dx1 = np.array([(x1 + math.cos(theta)) - x1 for theta in thetas]).reshape(-1, 1)
+    dy1 = np.array([(y1 + math.sin(theta)) - y1 for theta in thetas]).reshape(-1, 1)
+
+    # the second line is the segment (one column per segment)
+    x, y = segments[:, 0], segments[:, 1]
+    dx = segments[:, 2] - x
+    dy = segments[:, 3] - y
+
+    DET = (-dx1 * dy + dy1 * dx)
+    with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+        DETinv = 1.0 / DET
+        r = DETinv * (-dy * (x - x1) + dx * (y - y1))
+        s = DETinv * (-dy1 * (x - x1) + dx1 * (y - y1))
+        xi = (x1 + r * dx1 + x + s * dx) / 2.0
+        yi = (y1 + r * dy1 + y + s * dy) / 2.0
+        valid = (np.abs(DET) >= DET_TOLERANCE) & (r >= 0) & (0 <= s) & (s <= 1)
+    return valid, xi, yi
+
+
 def construct_maze(maze_id=0, length=1):
     # define the maze to use
     if maze_id == 0:
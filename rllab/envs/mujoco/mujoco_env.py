@@ -1,3 +1,4 @@
+import ctypes
 import numpy as np
 import os.path as osp
 
@@ -5,6 +6,7 @@ from rllab import spaces
 from rllab.envs.base import Env
 from rllab.misc.overrides import overrides
 from rllab.mujoco_py import MjModel, MjViewer
+from rllab.mujoco_py.mjtypes import MJCONTACT
 from rllab.misc import autoargs
 from rllab.misc import logger
 import theano
@@ -37,6 +39,10 @@ def q_mult(a, b): # multiply two quaternion
 
 class MujocoEnv(Env):
     FILE = None
+    # blocks of the observation of _get_full_obs, in order. The envs that use it can keep only the ones they need, so
+    # that the others are not read from the simulation.
+    FULL_OBS_BLOCKS = ('qpos', 'qvel', 'cinert', 'cvel', 'qfrc_actuator', 'cfrc_ext', 'qfrc_constraint', 'cdists',
+                       'dcom')
 
     @autoargs.arg('action_noise', type=float,
                   help='Noise added to the controls, which will be '
@@ -93,6 +99,7 @@ class MujocoEnv(Env):
             self.init_qpos = init_qpos
         self.dcom = None
         self.current_com = None
+        self._full_obs_model = None
         self.reset()
         super(MujocoEnv, self).__init__()
 
@@ -139,7 +146,7 @@ class MujocoEnv(Env):
                     datum = getattr(self, 'init_' + datum_name)
                 setattr(self.model.data, datum_name, datum)
                 start += datum_dim
-                self.model.forward()
+        # forwarded once by reset, after all the data is set
         # print("inside mujoco reset: ", self.model.data.qpos, self.model.data.qvel, self.model.data.qacc, self.model.data.ctrl)
 
     @overrides
@@ -154,26 +161,50 @@ class MujocoEnv(Env):
     def get_current_obs(self):
         return self._get_full_obs()
 
+    def _init_full_obs(self):
+        """
+        Lay out the blocks of _get_full_obs, and make numpy views of the arrays of the simulation they are read from
+        (instead of copying these arrays element by element through the properties of the data wrapper)
+        """
+        model, data = self.model, self.model.data
+        self._full_obs_layout = []
+        start = 0
+        for block in self.FULL_OBS_BLOCKS:
+            if block == 'cdists':
+                view = np.ctypeslib.as_array(model.obj.geom_margin, shape=(model.ngeom,))
+                # the dist and geom2 fields of all the contacts
+                contact_size = ctypes.sizeof(MJCONTACT)
+                contacts = (ctypes.c_char * (model.nconmax * contact_size)).from_address(
+                    ctypes.addressof(data.obj.contact.contents))
+                self._contact_dists = np.ndarray((model.nconmax,), np.float64, contacts, MJCONTACT.dist.offset,
+                                                 (contact_size,))
+                self._contact_geoms = np.ndarray((model.nconmax,), np.intc, contacts, MJCONTACT.geom2.offset,
+                                                 (contact_size,))
+            elif block == 'dcom':
+                view = None
+            else:
+                view = np.ctypeslib.as_array(getattr(data.obj, block), shape=(getattr(data, block).size,))
+            size = np.size(self.dcom) if block == 'dcom' else view.size
+            self._full_obs_layout.append((block, view, start, start + size))
+            start += size
+        self._full_obs_size = start
+        self._full_obs_model = model
+
     def _get_full_obs(self):
-        data = self.model.data
-        cdists = np.copy(self.model.geom_margin).flat
-        for c in self.model.data.contact:
-            cdists[c.geom2] = min(cdists[c.geom2], c.dist)
-        obs = np.concatenate([
-            data.qpos.flat,
-            data.qvel.flat,
-            # data.cdof.flat,
-            data.cinert.flat,
-            data.cvel.flat,
-            # data.cacc.flat,
-            data.qfrc_actuator.flat,
-            data.cfrc_ext.flat,
-            data.qfrc_constraint.flat,
-            cdists,
-            # data.qfrc_bias.flat,
-            # data.qfrc_passive.flat,
-            self.dcom.flat,
-        ])
+        if self._full_obs_model is not self.model:
+            self._init_full_obs()
+        # a new array for every observation, since the callers keep them
+        obs = np.empty(self._full_obs_size)
+        for block, view, start, stop in self._full_obs_layout:
+            if block == 'cdists':
+                # smallest distance of the contacts of each geom, or its margin
+                obs[start:stop] = view
+                ncon = self.model.data.ncon
+                np.minimum.at(obs[start:stop], self._contact_geoms[:ncon], self._contact_dists[:ncon])
+            elif block == 'dcom':
+                obs[start:stop] = self.dcom.flat
+            else:
+                obs[start:stop] = view
         return obs
 
     @property
@@ -0,0 +1,112 @@
+"""
+Append-only columnar storage of the tabular log, used by the logger for the tabular outputs whose name ends with
+COLUMNAR_SUFFIX (e.g. progress.cols) instead of a csv file.
+
+The output is a directory with one file of float64 values per key, and a keys file listing, in order of appearance,
+the row at which every key appeared and its name. A new key only adds a line and a file (the earlier rows of its
+column are NaN), and every row appends one value to each column, so nothing is ever rewritten.
+"""
+import os
+import os.path as osp
+
+import numpy as np
+
+COLUMNAR_SUFFIX = '.cols'
+KEYS_FILE = 'keys.tsv'
+
+
+def is_columnar(file_name):
+    return file_name.endswith(COLUMNAR_SUFFIX)
+
+
+def _to_float(value):
+    # same conversion as when reading the csv files in viskit
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return 0.
+
+
+class ColumnarWriter(object):
+    """
+    Rows are buffered and appended to the files every flush_every rows (and when flushed or closed)
+    """
+
+    def __init__(self, dir_name, flush_every=10):
+        if osp.exists(dir_name):
+            # same as opening a csv output in 'w' mode
+            for file_name in os.listdir(dir_name):
+                os.remove(osp.join(dir_name, file_name))
+        else:
+            os.makedirs(dir_name)
+        self.dir_name = dir_name
+        self.flush_every = flush_every
+        self._keys = []
+        self._key_indices = dict()
+        self._n_rows = 0
+        self._pending_rows = []
+        self._pending_keys = []
+
+    def write_row(self, row):
+        """
+        :param row: dict of the values (numbers, or strings of numbers) of the row. Keys that are not in it are NaN.
+        """
+        for key in row:
+            if key not in self._key_indices:
+                self._key_indices[key] = len(self._keys)
+                self._keys.append(key)
+                self._pending_keys.append((self._n_rows, key))
+        self._pending_rows.append([_to_float(row[key]) if key in row else np.nan for key in self._keys])
+        self._n_rows += 1
+        if len(self._pending_rows) >= self.flush_every:
+            self.flush()
+
+    def flush(self):
+        if len(self._pending_keys) > 0:
+            with open(osp.join(self.dir_name, KEYS_FILE), 'a') as f:
+                for start_row, key in self._pending_keys:
+                    f.write('%d\t%s\n' % (start_row, key))
+            self._pending_keys = []
+        if len(self._pending_rows) == 0:
+            return
+        for idx in range(len(self._keys)):
+            # the keys only get added, so the rows that have this key are the last ones
+            values = [row[idx] for row in self._pending_rows if len(row) > idx]
+            with open(osp.join(self.dir_name, '%d.f8' % idx), 'ab') as f:
+                f.write(np.asarray(values, dtype='<f8').tobytes())
+        self._pending_rows = []
+
+    def close(self):
+        self.flush()
+
+
+def load_columnar(dir_name):
+    """
+    :return: dict of the columns, all of the same length (NaN before the row where a key appeared). Rows that were
+    only partially written (e.g. if the process was killed while flushing) are dropped.
+    """
+    keys_file = osp.join(dir_name, KEYS_FILE)
+    if not osp.exists(keys_file):
+        return dict()
+    starts = []
+    with open(keys_file, 'r') as f:
+        for line in f:
+            if line.endswith('\n'):
+                start_row, key = line[:-1].split('\t', 1)
+                starts.append((int(start_row), key))
+    columns = []
+    for idx, (start_row, key) in enumerate(starts):
+        column_file = osp.join(dir_name, '%d.f8' % idx)
+        if osp.exists(column_file):
+            values = np.fromfile(column_file, dtype='<f8')
+        else:
+            values = np.zeros(0)
+        columns.append((start_row, key, values))
+    n_rows = min([start_row + len(values) for start_row, _, values in columns] or [0])
+    entries = dict()
+    for start_row, key, values in columns:
+        column = np.full(max(n_rows, 0), np.nan)
+        if n_rows > start_row:
+            column[start_row:] = values[:n_rows - start_row]
+        entries[key] = column
+    return entries
@@ -0,0 +1,164 @@
+"""
+Compact snapshots, made of the objects of a run pickled once (the constructor arguments of Serializable objects) and,
+for every iteration, only the flat parameter values of these objects in an uncompressed .npz file (plus the entries of
+the snapshot that are plain numbers or arrays).
+
+The objects are only built when they are accessed, and can be reused to load the parameters of other iterations, so
+that going through many iterations does not unpickle (and e.g. compile or load models) again for each of them.
+"""
+import os
+import os.path as osp
+import pickle
+
+import numpy as np
+
+from rllab.core.serializable import Serializable
+
+OBJECTS_FILE = 'objects.pkl'
+
+
+def _has_params(obj):
+    return hasattr(obj, 'get_param_values') and hasattr(obj, 'set_param_values')
+
+
+def _object_state(obj):
+    """ What is pickled once per run for an object: its constructor arguments if it is Serializable """
+    if isinstance(obj, Serializable):
+        return type(obj), Serializable.__getstate__(obj)
+    return None, obj
+
+
+def _build_object(obj_type, state):
+    if obj_type is None:
+        return state
+    obj = obj_type.__new__(obj_type)
+    Serializable.__setstate__(obj, state)
+    return obj
+
+
+class CompactSnapshotWriter(object):
+    """
+    Writes the compact snapshots of the iterations of one run in a directory. The objects file is written again only
+    when the snapshot has an object that was not saved yet (a new key, or another object under a saved key).
+    """
+
+    def __init__(self, dir_name, prefix=''):
+        self.dir_name = dir_name
+        self.prefix = prefix
+        self._saved_objects = dict()  # key -> object saved under it
+        self._objects = dict()
+
+    def _update_objects(self, objects):
+        if all(self._saved_objects.get(k) is v for k, v in objects.items()):
+            return
+        import cloudpickle
+        for k, v in objects.items():
+            self._objects[k] = cloudpickle.dumps(_object_state(v), protocol=3)
+            self._saved_objects[k] = v
+        _atomic_write(osp.join(self.dir_name, self.prefix + OBJECTS_FILE),
+                      lambda f: pickle.dump(self._objects, f, protocol=3))
+
+    def save(self, file_name, params):
+        """
+        :param file_name: path of the .npz file of the iteration
+        :param params: dict of the snapshot. Entries that are neither numbers, arrays nor Serializable objects or
+        objects with parameters (e.g. the algo, or the paths) are not saved.
+        :return: the keys that were not saved
+        """
+        objects = dict()
+        arrays = dict()
+        skipped = []
+        for k, v in params.items():
+            if isinstance(v, (int, float, np.number, np.ndarray)):
+                arrays['value/' + k] = np.asarray(v)
+            elif isinstance(v, Serializable) or _has_params(v):
+                objects[k] = v
+                if _has_params(v):
+                    param_values = v.get_param_values()
+                    if param_values is None:
+                        # e.g. a baseline that was not fitted yet
+                        arrays['no_params/' + k] = np.zeros(0)
+                    else:
+                        arrays['params/' + k] = param_values
+            else:
+                skipped.append(k)
+        self._update_objects(objects)
+        _atomic_write(file_name, lambda f: np.savez(f, **arrays))
+        return skipped
+
+
+def _atomic_write(file_name, write):
+    tmp_file_name = file_name + '.tmp'
+    with open(tmp_file_name, 'wb') as f:
+        write(f)
+    os.replace(tmp_file_name, file_name)
+
+
+class CompactSnapshot(object):
+    """
+    Dict-like view of a compact snapshot. The arrays are read, and the objects unpickled and built, only on access.
+    Objects are built once per CompactSnapshot: use load_iteration to reuse them with the parameters of another
+    snapshot file of the same run.
+    """
+
+    def __init__(self, file_name):
+        self.dir_name = osp.dirname(file_name)
+        self.file_name = file_name
+        objects_file = osp.join(self.dir_name, self._prefix(file_name) + OBJECTS_FILE)
+        with open(objects_file, 'rb') as f:
+            self._object_states = pickle.load(f)
+        self._objects = dict()
+        self._arrays = np.load(file_name)
+
+    @staticmethod
+    def _prefix(file_name):
+        base_name = osp.basename(file_name)
+        for name in ('itr_', 'params.npz'):
+            if name in base_name:
+                return base_name[:base_name.index(name)]
+        return ''
+
+    def load_iteration(self, file_name):
+        """ Switch to the parameters of another snapshot file of the run (the objects already built are updated) """
+        self._arrays.close()
+        self.file_name = file_name
+        self._arrays = np.load(file_name)
+        for k, obj in self._objects.items():
+            self._set_params(k, obj)
+
+    def _set_params(self, key, obj):
+        if 'params/' + key in self._arrays.files:
+            obj.set_param_values(self._arrays['params/' + key])
+        elif 'no_params/' + key in self._arrays.files:
+            obj.set_param_values(None)
+
+    def keys(self):
+        return list(self._object_states.keys()) + [k[len('value/'):] for k in self._arrays.files
+                                                     if k.startswith('value/')]
+
+    def __contains__(self, key):
+        return key in self.keys()
+
+    def __getitem__(self, key):
+        if 'value/' + key in self._arrays.files:
+            value = self._arrays['value/' + key]
+            return value[()] if value.ndim == 0 else value
+        if key not in self._objects:
+            import cloudpickle  # the objects may have been pickled with it
+            obj = _build_object(*cloudpickle.loads(self._object_states[key]))
+            self._set_params(key, obj)
+            self._objects[key] = obj
+        return self._objects[key]
+
+    def get(self, key, default=None):
+        return self[key] if key in self else default
+
+
+def load_snapshot(file_name):
+    """
+    Load a snapshot saved by logger.save_itr_params: a CompactSnapshot for .npz files, the unpickled dict otherwise
+    """
+    if file_name.endswith('.npz'):
+        return CompactSnapshot(file_name)
+    import joblib
+    return joblib.load(file_name)
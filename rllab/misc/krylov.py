@@ -4,13 +4,23 @@ from rllab.misc.ext import sliced_fun
 EPS = np.finfo('float64').tiny
 
 
-def cg(f_Ax, b, cg_iters=10, callback=None, verbose=False, residual_tol=1e-10):
+def cg(f_Ax, b, cg_iters=10, callback=None, verbose=False, residual_tol=1e-10, x0=None):
     """
     Demmel p 312
+    :param x0: initial guess of the solution (zero if None), which costs one more evaluation of f_Ax
     """
-    p = b.copy()
-    r = b.copy()
-    x = np.zeros_like(b)
+    if x0 is None:
+        r = b.copy()
+        x = np.zeros_like(b)
+    else:
+        x = np.array(x0, dtype=b.dtype)
+        r = b - f_Ax(x)
+        if r.dot(r) < residual_tol:
+            # the first step would divide by a zero (or vanishing) search direction
+            if callback is not None:
+                callback(x)
+            return x
+    p = r.copy()
     rdotr = r.dot(r)
 
     fmtstr = "%10i %10.3g %10.3g"
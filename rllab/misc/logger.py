@@ -3,6 +3,7 @@ from enum import Enum
 from rllab.misc.tabulate import tabulate
 from rllab.misc.console import mkdir_p, colorize
 from rllab.misc.autoargs import get_all_parameters
+from rllab.misc.columnar_log import ColumnarWriter, is_columnar
 from contextlib import contextmanager
 import numpy as np
 import os
@@ -15,6 +16,11 @@ import joblib
 import json
 import pickle
 import base64
+import atexit
+import copyreg
+import queue
+import threading
+import types
 
 _prefixes = []
 _prefix_str = ''
@@ -35,6 +41,10 @@ _tabular_header_written = set()
 _snapshot_dir = None
 _snapshot_mode = 'all'
 _snapshot_gap = 1
+_snapshot_writer = None
+_snapshot_format = 'pickle'
+_compact_snapshot_writers = {}  # key: (snapshot dir, prefix)
+_compact_snapshot_warned = set()
 
 _log_tabular_only = False
 _header_printed = False
@@ -96,9 +106,16 @@ def remove_text_output(file_name):
 
 
 def add_tabular_output(file_name):
+    """
+    :param file_name: csv file, or directory of columns if it ends with .cols (see rllab.misc.columnar_log)
+    """
     if file_name in _tabular_fds_hold.keys():
         _tabular_outputs.append(file_name)
         _tabular_fds[file_name] = _tabular_fds_hold[file_name]
+    elif is_columnar(file_name):
+        if file_name not in _tabular_outputs:
+            _tabular_outputs.append(file_name)
+            _tabular_fds[file_name] = ColumnarWriter(file_name)
     else:
         _add_output(file_name, _tabular_outputs, _tabular_fds, mode='w')
 
@@ -162,6 +179,179 @@ def set_snapshot_gap(gap):
     _snapshot_gap = gap
 
 
+class _CapturedObject(object):
+    """
+    Stands for an object of the params of save_itr_params in their captured copy (see _capture_snapshot). It is
+    pickled as the object itself would be, but with the state the object had when it was captured.
+    """
+
+    def __init__(self, reduce_value):
+        self.reduce_value = reduce_value
+        self.state = None
+
+    @property
+    def __class__(self):
+        # pickle checks that the class given to copyreg.__newobj__ is the class of the pickled object
+        return self.reduce_value[1][0]
+
+    def __reduce__(self):
+        func, args = self.reduce_value[:2]
+        return (func, args, self.state) + tuple(self.reduce_value[3:])
+
+
+_UNCAPTURED_TYPES = (int, float, complex, bool, str, bytes, type(None), type, types.FunctionType,
+                     types.BuiltinFunctionType, types.MethodType, types.ModuleType)
+
+
+def _capture_snapshot(value, memo=None):
+    """
+    Copy the structure of the params of save_itr_params without serializing them, so that they can be serialized later
+    by another thread while training goes on. The containers are copied, and the objects pickled with the default
+    protocol (like the Serializable policy, baseline and env, whose state are their constructor arguments and a copy
+    of their flat parameters) are replaced by the state returned by their __getstate__ at this point. Any other value
+    (arrays, objects with their own __reduce__...) is kept as it is, so it should not be modified in place afterwards.
+    """
+    if memo is None:
+        memo = dict()
+    if id(value) in memo:
+        return memo[id(value)][1]
+    if isinstance(value, _UNCAPTURED_TYPES):
+        return value
+    if type(value) in (list, dict):
+        captured = type(value)()
+        # the value is kept in the memo, so that its id is not reused by a temporary state
+        memo[id(value)] = (value, captured)
+        if isinstance(value, list):
+            captured.extend(_capture_snapshot(v, memo) for v in value)
+        else:
+            captured.update((k, _capture_snapshot(v, memo)) for k, v in value.items())
+        return captured
+    if type(value) is tuple:
+        captured = tuple(_capture_snapshot(v, memo) for v in value)
+        memo[id(value)] = (value, captured)
+        return captured
+    cls = type(value)
+    if cls.__reduce_ex__ is not object.__reduce_ex__ or cls.__reduce__ is not object.__reduce__:
+        return value
+    reduce_value = value.__reduce_ex__(3)
+    if reduce_value[0] is not copyreg.__newobj__ or any(v is not None for v in reduce_value[3:]):
+        return value
+    captured = _CapturedObject(reduce_value)
+    memo[id(value)] = (value, captured)
+    captured.state = _capture_snapshot(reduce_value[2], memo)
+    return captured
+
+
+class _SnapshotWriter(object):
+    """
+    Background thread serializing and writing the snapshots submitted by save_itr_params. Submitting blocks while
+    max_pending snapshots are waiting to be written, so that the captured snapshots do not pile up in memory.
+    """
+
+    def __init__(self, max_pending):
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._error = None
+        self._thread = threading.Thread(target=self._run, name="snapshot_writer")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            try:
+                if item is None:
+                    return
+                self._write(*item)
+            except Exception as e:
+                self._error = e
+            finally:
+                self._queue.task_done()
+
+    @staticmethod
+    def _write(file_name, params, use_cloudpickle):
+        # write next to the final file and rename it, so that a snapshot file is never partially written
+        tmp_file_name = file_name + '.tmp'
+        if use_cloudpickle:
+            import cloudpickle
+            with open(tmp_file_name, 'wb') as f:
+                cloudpickle.dump(params, f, protocol=3)
+        else:
+            joblib.dump(params, tmp_file_name, compress=3)
+        os.replace(tmp_file_name, file_name)
+
+    def _raise_error(self):
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise error
+
+    def submit(self, file_name, params, use_cloudpickle):
+        self._raise_error()
+        self._queue.put((file_name, params, use_cloudpickle))
+
+    def flush(self):
+        self._queue.join()
+        self._raise_error()
+
+    def close(self):
+        self.flush()
+        self._queue.put(None)
+        self._thread.join()
+
+
+def get_snapshot_format():
+    return _snapshot_format
+
+
+def set_snapshot_format(snapshot_format):
+    """
+    :param snapshot_format: 'pickle' to pickle the whole params of save_itr_params, or 'compact' to only save the
+    parameter values of the objects (and the plain numbers and arrays) at every iteration, see
+    rllab.misc.compact_snapshot
+    """
+    assert snapshot_format in ('pickle', 'compact')
+    global _snapshot_format
+    _snapshot_format = snapshot_format
+
+
+def get_snapshot_async():
+    return _snapshot_writer is not None
+
+
+def set_snapshot_async(async_snapshots, max_pending=2):
+    """
+    :param async_snapshots: whether save_itr_params only captures the current state of the params (see
+    _capture_snapshot) and leaves their serialization, and the writing (and compression) of the files, to a background
+    thread. The files are written atomically.
+    :param max_pending: number of captured snapshots waiting to be written above which save_itr_params blocks
+    """
+    global _snapshot_writer
+    if _snapshot_writer is not None:
+        _snapshot_writer.close()
+        _snapshot_writer = None
+    if async_snapshots:
+        _snapshot_writer = _SnapshotWriter(max_pending)
+
+
+def wait_for_snapshots():
+    """
+    Block until all the snapshots submitted by save_itr_params are written (e.g. before reading them)
+    """
+    if _snapshot_writer is not None:
+        _snapshot_writer.flush()
+
+
+atexit.register(wait_for_snapshots)
+
+
+def _flush_columnar_outputs():
+    for fd in list(_tabular_fds.values()) + list(_tabular_fds_hold.values()):
+        if isinstance(fd, ColumnarWriter):
+            fd.flush()
+
+
+atexit.register(_flush_columnar_outputs)
+
+
 def set_log_tabular_only(log_tabular_only):
     global _log_tabular_only
     _log_tabular_only = log_tabular_only
@@ -272,6 +462,10 @@ def dump_tabular(*args, **kwargs):
                 # Also write to the csv files
                 # This assumes that the keys in each iteration won't change!
                 for tabular_file_name, tabular_fd in list(_tabular_fds.items()):
+                    if isinstance(tabular_fd, ColumnarWriter):
+                        # new keys are added without rewriting anything, and the writes are batched
+                        tabular_fd.write_row(tabular_dict)
+                        continue
                     keys = tabular_dict.keys()
                     if tabular_file_name in _tabular_headers:
                         # check against existing keys: if new keys re-write Header and pad with NaNs
@@ -332,7 +526,11 @@ def save_itr_params(itr, params, use_cloudpickle=True, pkl_prefix=''):
             return
         else:
             raise NotImplementedError
-        if use_cloudpickle:
+        if _snapshot_format == 'compact':
+            _save_compact_snapshot(file_name[:-len('.pkl')] + '.npz', params, pkl_prefix)
+        elif _snapshot_writer is not None:
+            _snapshot_writer.submit(file_name, _capture_snapshot(params), use_cloudpickle)
+        elif use_cloudpickle:
             import cloudpickle
             with open(file_name, 'wb') as f:
                 cloudpickle.dump(params, f, protocol=3)
@@ -340,6 +538,18 @@ def save_itr_params(itr, params, use_cloudpickle=True, pkl_prefix=''):
             joblib.dump(params, file_name, compress=3)
 
 
+def _save_compact_snapshot(file_name, params, prefix):
+    from rllab.misc.compact_snapshot import CompactSnapshotWriter
+    key = (get_snapshot_dir(), prefix)
+    if key not in _compact_snapshot_writers:
+        _compact_snapshot_writers[key] = CompactSnapshotWriter(get_snapshot_dir(), prefix)
+    skipped = _compact_snapshot_writers[key].save(file_name, params)
+    for k in skipped:
+        if k not in _compact_snapshot_warned:
+            _compact_snapshot_warned.add(k)
+            log("%s is not saved in compact snapshots" % k)
+
+
 def log_parameters(log_file, args, classes):
     log_params = {}
     for param_name, param_value in args.__dict__.items():
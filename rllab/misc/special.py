@@ -111,6 +111,27 @@ def discount_cumsum(x, discount):
     return scipy.signal.lfilter([1], [1, float(-discount)], x[::-1], axis=0)[::-1]
 
 
+def discount_cumsum_concatenated(x, path_lengths, discount):
+    """
+    discount_cumsum of every path of x, for several paths concatenated along the first axis: the sums restart at the
+    end of every path. All the paths are summed at once, by doubling at every pass the number of steps added to each
+    sum, so in about log2(max path length) vectorized passes.
+    """
+    x = np.asarray(x)
+    dtype = x.dtype if np.issubdtype(x.dtype, np.floating) else np.float64
+    sums = x.astype(dtype)
+    # discount ** (number of steps summed) of every entry, 0 when they cross the end of the path
+    decay = np.full(len(x), discount, dtype=dtype)
+    decay[np.cumsum(path_lengths) - 1] = 0
+    decay = decay.reshape((-1,) + (1,) * (x.ndim - 1))
+    shift = 1
+    while shift < np.max(path_lengths):
+        sums[:-shift] += decay[:-shift] * sums[shift:]
+        decay[:-shift] *= decay[shift:]
+        shift *= 2
+    return sums
+
+
 def discount_return(x, discount):
     return np.sum(x * (discount ** np.arange(len(x))))
 
@@ -7,7 +7,14 @@ import theano
 import itertools
 import numpy as np
 from rllab.misc.ext import sliced_fun
-from _ast import Num
+
+
+def _cast_inputs(inputs, dtypes):
+    """
+    Convert the inputs once to the dtypes of the compiled function (e.g. float64 observations to floatX), instead of
+    letting theano do it at every call in the CG loop
+    """
+    return tuple(np.asarray(x, dtype=dtype) for x, dtype in zip(inputs, dtypes))
 
 
 class PerlmutterHvp(Serializable):
@@ -22,6 +29,7 @@ class PerlmutterHvp(Serializable):
     def update_opt(self, f, target, inputs, reg_coeff):
         self.target = target
         self.reg_coeff = reg_coeff
+        self.input_dtypes = [x.dtype for x in inputs]
         params = target.get_params(trainable=True)
 
         constraint_grads = theano.grad(
@@ -46,6 +54,8 @@ class PerlmutterHvp(Serializable):
         )
 
     def build_eval(self, inputs):
+        inputs = _cast_inputs(inputs, self.input_dtypes)
+
         def eval(x):
             xs = tuple(self.target.flat_to_params(x, trainable=True))
             ret = sliced_fun(self.opt_fun["f_Hx_plain"], self._num_slices)(
@@ -67,6 +77,7 @@ class FiniteDifferenceHvp(Serializable):
     def update_opt(self, f, target, inputs, reg_coeff):
         self.target = target
         self.reg_coeff = reg_coeff
+        self.input_dtypes = [x.dtype for x in inputs]
 
         params = target.get_params(trainable=True)
 
@@ -105,6 +116,8 @@ class FiniteDifferenceHvp(Serializable):
         )
 
     def build_eval(self, inputs):
+        inputs = _cast_inputs(inputs, self.input_dtypes)
+
         def eval(x):
             xs = tuple(self.target.flat_to_params(x, trainable=True))
             ret = sliced_fun(self.opt_fun["f_Hx_plain"], self._num_slices)(
@@ -130,7 +143,9 @@ class ConjugateGradientOptimizer(Serializable):
             max_backtracks=15,
             accept_violation=False,
             hvp_approach=None,
-            num_slices=1):
+            num_slices=1,
+            warm_start=False,
+            n_batched_backtracks=1):
         """
 
         :param cg_iters: The number of CG iterations used to calculate A^-1 g
@@ -139,6 +154,9 @@ class ConjugateGradientOptimizer(Serializable):
         computation time for the descent direction dominates, this can greatly reduce the overall computation time.
         :param accept_violation: whether to accept the descent step if it violates the line search condition after
         exhausting all backtracking budgets
+        :param warm_start: start CG from the descent direction of the previous call to optimize instead of zero
+        :param n_batched_backtracks: number of backtracking steps whose loss and constraint are evaluated by one call
+        of a compiled function (the ratios are still tried in order, and the first acceptable one is taken)
         :return:
         """
         Serializable.quick_init(self, locals())
@@ -148,6 +166,9 @@ class ConjugateGradientOptimizer(Serializable):
         self._backtrack_ratio = backtrack_ratio
         self._max_backtracks = max_backtracks
         self._num_slices = num_slices
+        self._warm_start = warm_start
+        self._n_batched_backtracks = n_batched_backtracks
+        self._prev_descent_direction = None
 
         self._opt_fun = None
         self._target = None
@@ -189,6 +210,28 @@ class ConjugateGradientOptimizer(Serializable):
         self._target = target
         self._max_constraint_val = constraint_value
         self._constraint_name = constraint_name
+        self._prev_descent_direction = None
+
+        # loss and constraint after the steps -ratios[i] * flat_step, for several ratios at once
+        flat_step = TT.vector("flat_step")
+        ratios = TT.vector("ratios")
+        batched_losses = []
+        batched_constraints = []
+        if self._n_batched_backtracks > 1:
+            steps = []
+            offset = 0
+            for param, shape in zip(params, target.get_param_shapes(trainable=True)):
+                size = int(np.prod(shape))
+                steps.append(TT.reshape(flat_step[offset:offset + size], shape))
+                offset += size
+            for i in range(self._n_batched_backtracks):
+                stepped_loss, stepped_constraint = theano.clone(
+                    [loss, constraint_term],
+                    replace={param: param - TT.cast(ratios[i] * step, param.dtype)
+                             for param, step in zip(params, steps)}
+                )
+                batched_losses.append(stepped_loss)
+                batched_constraints.append(stepped_constraint)
 
         self._opt_fun = ext.lazydict(
             f_loss=lambda: ext.compile_function(
@@ -211,6 +254,11 @@ class ConjugateGradientOptimizer(Serializable):
                 outputs=[loss, constraint_term],
                 log_name="f_loss_constraint",
             ),
+            f_batched_loss_constraint=lambda: ext.compile_function(
+                inputs=inputs + extra_inputs + (flat_step, ratios),
+                outputs=[TT.stack(batched_losses), TT.stack(batched_constraints)],
+                log_name="f_batched_loss_constraint",
+            ),
         )
 
     def loss(self, inputs, extra_inputs=None):
@@ -254,7 +302,16 @@ class ConjugateGradientOptimizer(Serializable):
 
         Hx = self._hvp_approach.build_eval(subsample_inputs + extra_inputs)
 
-        descent_direction = krylov.cg(Hx, flat_g, cg_iters=self._cg_iters)
+        descent_direction = None
+        if self._warm_start and self._prev_descent_direction is not None and \
+                self._prev_descent_direction.shape == flat_g.shape:
+            descent_direction = krylov.cg(Hx, flat_g, cg_iters=self._cg_iters, x0=self._prev_descent_direction)
+            if not np.all(np.isfinite(descent_direction)):
+                descent_direction = None
+        if descent_direction is None:
+            descent_direction = krylov.cg(Hx, flat_g, cg_iters=self._cg_iters)
+        if self._warm_start:
+            self._prev_descent_direction = descent_direction
 
         initial_step_size = np.sqrt(
             2.0 * self._max_constraint_val *
@@ -267,15 +324,19 @@ class ConjugateGradientOptimizer(Serializable):
         logger.log("descent direction computed")
 
         prev_param = np.copy(self._target.get_param_values(trainable=True))
-        n_iter = 0
-        for n_iter, ratio in enumerate(self._backtrack_ratio ** np.arange(self._max_backtracks)):
-            cur_step = ratio * flat_descent_step
-            cur_param = prev_param - cur_step
-            self._target.set_param_values(cur_param, trainable=True)
-            loss, constraint_val = sliced_fun(
-                self._opt_fun["f_loss_constraint"], self._num_slices)(inputs, extra_inputs)
-            if loss < loss_before and constraint_val <= self._max_constraint_val:
-                break
+        if self._n_batched_backtracks > 1:
+            n_iter, loss, constraint_val = self._batched_line_search(
+                inputs, extra_inputs, prev_param, flat_descent_step, loss_before)
+        else:
+            n_iter = 0
+            for n_iter, ratio in enumerate(self._backtrack_ratio ** np.arange(self._max_backtracks)):
+                cur_step = ratio * flat_descent_step
+                cur_param = prev_param - cur_step
+                self._target.set_param_values(cur_param, trainable=True)
+                loss, constraint_val = sliced_fun(
+                    self._opt_fun["f_loss_constraint"], self._num_slices)(inputs, extra_inputs)
+                if loss < loss_before and constraint_val <= self._max_constraint_val:
+                    break
         if (np.isnan(loss) or np.isnan(constraint_val) or loss >= loss_before or constraint_val >=
                 self._max_constraint_val) and not self._accept_violation:
             logger.log("Line search condition violated. Rejecting the step!")
@@ -293,3 +354,26 @@ class ConjugateGradientOptimizer(Serializable):
         logger.log("backtrack iters: %d" % n_iter)
         logger.log("computing loss after")
         logger.log("optimization finished")
+
+    def _batched_line_search(self, inputs, extra_inputs, prev_param, flat_descent_step, loss_before):
+        """
+        Same backtracking as in optimize, evaluating n_batched_backtracks ratios per call from prev_param. Leaves the
+        target at the accepted (or last) step.
+        :return: the index of the accepted (or last) ratio, and its loss and constraint value
+        """
+        all_ratios = self._backtrack_ratio ** np.arange(self._max_backtracks)
+        n_iter, loss, constraint_val = 0, np.nan, np.nan
+        for start in range(0, len(all_ratios), self._n_batched_backtracks):
+            ratios = all_ratios[start:start + self._n_batched_backtracks]
+            # the compiled function takes a fixed number of ratios
+            padded_ratios = np.concatenate(
+                [ratios, np.repeat(ratios[-1:], self._n_batched_backtracks - len(ratios))])
+            losses, constraint_vals = sliced_fun(self._opt_fun["f_batched_loss_constraint"], self._num_slices)(
+                inputs, extra_inputs + (flat_descent_step, padded_ratios))
+            for i in range(len(ratios)):
+                n_iter, loss, constraint_val = start + i, losses[i], constraint_vals[i]
+                if loss < loss_before and constraint_val <= self._max_constraint_val:
+                    self._target.set_param_values(prev_param - all_ratios[n_iter] * flat_descent_step, trainable=True)
+                    return n_iter, loss, constraint_val
+        self._target.set_param_values(prev_param - all_ratios[n_iter] * flat_descent_step, trainable=True)
+        return n_iter, loss, constraint_val
@@ -46,36 +46,43 @@ class BaseSampler(Sampler):
         self.algo = algo
 
     def process_samples(self, itr, paths):
-        baselines = []
-        returns = []
-
         if hasattr(self.algo.baseline, "predict_n"):
             all_path_baselines = self.algo.baseline.predict_n(paths)
         else:
             all_path_baselines = [self.algo.baseline.predict(path) for path in paths]
 
-        for idx, path in enumerate(paths):
-            path_baselines = np.append(all_path_baselines[idx], 0)
-            deltas = path["rewards"] + \
-                     self.algo.discount * path_baselines[1:] - \
-                     path_baselines[:-1]
-            path["advantages"] = special.discount_cumsum(
-                deltas, self.algo.discount * self.algo.gae_lambda)
-            path["returns"] = special.discount_cumsum(path["rewards"], self.algo.discount)
-            baselines.append(path_baselines[:-1])
-            returns.append(path["returns"])
+        # the returns and advantages of all the paths are computed at once on the concatenated paths
+        path_lengths = np.array([len(path["rewards"]) for path in paths])
+        path_starts = np.cumsum(path_lengths) - path_lengths
+        rewards = tensor_utils.concat_tensor_list([path["rewards"] for path in paths])
+        baselines = tensor_utils.concat_tensor_list(all_path_baselines)
+        # the baseline after the last step of every path is 0
+        next_baselines = np.zeros_like(baselines)
+        next_baselines[:-1] = baselines[1:]
+        next_baselines[path_starts[1:] - 1] = 0
+        deltas = rewards + \
+                 self.algo.discount * next_baselines - \
+                 baselines
+        advantages = special.discount_cumsum_concatenated(
+            deltas, path_lengths, self.algo.discount * self.algo.gae_lambda)
+        returns = special.discount_cumsum_concatenated(rewards, path_lengths, self.algo.discount)
+        for path, path_advantages, path_returns in zip(paths, np.split(advantages, path_starts[1:]),
+                                                       np.split(returns, path_starts[1:])):
+            path["advantages"] = path_advantages
+            path["returns"] = path_returns
 
         ev = special.explained_variance_1d(
-            np.concatenate(baselines),
-            np.concatenate(returns)
+            baselines,
+            returns
         )
 
+        average_discounted_return = np.mean(returns[path_starts])
+
+        undiscounted_returns = np.add.reduceat(rewards, path_starts)
+
         if not self.algo.policy.recurrent:
             observations = tensor_utils.concat_tensor_list([path["observations"] for path in paths])
             actions = tensor_utils.concat_tensor_list([path["actions"] for path in paths])
-            rewards = tensor_utils.concat_tensor_list([path["rewards"] for path in paths])
-            returns = tensor_utils.concat_tensor_list([path["returns"] for path in paths])
-            advantages = tensor_utils.concat_tensor_list([path["advantages"] for path in paths])
             env_infos = tensor_utils.concat_tensor_dict_list([path["env_infos"] for path in paths])
             agent_infos = tensor_utils.concat_tensor_dict_list([path["agent_infos"] for path in paths])
 
@@ -85,11 +92,6 @@ class BaseSampler(Sampler):
             if self.algo.positive_adv:
                 advantages = util.shift_advantages_to_positive(advantages)
 
-            average_discounted_return = \
-                np.mean([path["returns"][0] for path in paths])
-
-            undiscounted_returns = [sum(path["rewards"]) for path in paths]
-
             ent = np.mean(self.algo.policy.distribution.entropy(agent_infos))
 
             samples_data = dict(
@@ -103,30 +105,26 @@ class BaseSampler(Sampler):
                 paths=paths,
             )
         else:
-            max_path_length = max([len(path["advantages"]) for path in paths])
-
             # make all paths the same length (pad extra advantages with 0)
+            max_path_length = np.max(path_lengths)
+            valid_mask = np.arange(max_path_length) < path_lengths[:, None]
+            padded_advantages = _pad_concatenated(advantages, valid_mask)
+
             obs = [path["observations"] for path in paths]
             obs = tensor_utils.pad_tensor_n(obs, max_path_length)
 
             if self.algo.center_adv:
-                raw_adv = np.concatenate([path["advantages"] for path in paths])
-                adv_mean = np.mean(raw_adv)
-                adv_std = np.std(raw_adv) + 1e-8
-                adv = [(path["advantages"] - adv_mean) / adv_std for path in paths]
+                adv_mean = np.mean(advantages)
+                adv_std = np.std(advantages) + 1e-8
+                adv = np.where(valid_mask, (padded_advantages - adv_mean) / adv_std, 0.)
             else:
-                adv = [path["advantages"] for path in paths]
-
-            adv = np.asarray([tensor_utils.pad_tensor(a, max_path_length) for a in adv])
+                adv = padded_advantages
 
             actions = [path["actions"] for path in paths]
             actions = tensor_utils.pad_tensor_n(actions, max_path_length)
 
-            rewards = [path["rewards"] for path in paths]
-            rewards = tensor_utils.pad_tensor_n(rewards, max_path_length)
-
-            returns = [path["returns"] for path in paths]
-            returns = tensor_utils.pad_tensor_n(returns, max_path_length)
+            rewards = _pad_concatenated(rewards, valid_mask)
+            returns = _pad_concatenated(returns, valid_mask)
 
             agent_infos = [path["agent_infos"] for path in paths]
             agent_infos = tensor_utils.stack_tensor_dict_list(
@@ -138,13 +136,7 @@ class BaseSampler(Sampler):
                 [tensor_utils.pad_tensor_dict(p, max_path_length) for p in env_infos]
             )
 
-            valids = [np.ones_like(path["returns"]) for path in paths]
-            valids = tensor_utils.pad_tensor_n(valids, max_path_length)
-
-            average_discounted_return = \
-                np.mean([path["returns"][0] for path in paths])
-
-            undiscounted_returns = [sum(path["rewards"]) for path in paths]
+            valids = valid_mask.astype(returns.dtype)
 
             ent = np.sum(self.algo.policy.distribution.entropy(agent_infos) * valids) / np.sum(valids)
 
@@ -172,9 +164,16 @@ class BaseSampler(Sampler):
                               average_discounted_return)
         logger.record_tabular('ExplainedVariance', ev)
         logger.record_tabular('NumTrajs', len(paths))
-        logger.record_tabular_misc_stat('TrajLen', [len(p["rewards"]) for p in paths], placement='front')
+        logger.record_tabular_misc_stat('TrajLen', path_lengths, placement='front')
         logger.record_tabular('Entropy', ent)
         logger.record_tabular('Perplexity', np.exp(ent))
         logger.record_tabular_misc_stat('Return', undiscounted_returns, placement='front')
 
         return samples_data
+
+
+def _pad_concatenated(x, valid_mask):
+    """ Pad the concatenated paths of x with zeros to the shape of valid_mask, which is True on the steps of each path """
+    padded = np.zeros(valid_mask.shape, dtype=x.dtype)
+    padded[valid_mask] = x
+    return padded
@@ -1,5 +1,6 @@
-from rllab.sampler.utils import rollout
+from rllab.sampler.utils import rollout, preallocated_rollout
 from rllab.sampler.stateful_pool import singleton_pool, SharedGlobal
+from rllab.sampler import shared_paths
 from rllab.misc import ext
 from rllab.misc import logger
 from rllab.misc import tensor_utils
@@ -107,10 +108,24 @@ def _worker_set_env_params(G, params, scope=None):
 
 def _worker_collect_one_path(G, max_path_length, scope=None):
     G = _get_scoped_G(G, scope)
-    path = rollout(G.env, G.policy, max_path_length)
+    path = preallocated_rollout(G.env, G.policy, max_path_length)
     return path, len(path["rewards"])
 
 
+def _worker_collect_one_path_shared(G, max_path_length, collect_id, capacity, directory, scope=None):
+    G = _get_scoped_G(G, scope)
+    writer = getattr(G, "path_writer", None)
+    if writer is None or writer.collect_id != collect_id:
+        if writer is not None:
+            writer.close()
+        G.path_writer = writer = shared_paths.SharedPathWriter(collect_id, capacity, directory)
+    path = preallocated_rollout(G.env, G.policy, max_path_length)
+    record = writer.write(path)
+    if record is None:
+        return path, len(path["rewards"])
+    return record, record["length"]
+
+
 # def _worker_collect_one_path_snn(G, max_path_length, switch_lat_every=0, scope=None):
 #     G = _get_scoped_G(G, scope)
 #     path = rollout_snn(G.env, G.policy, max_path_length, switch_lat_every=switch_lat_every)
@@ -121,13 +136,21 @@ def sample_paths(
         max_samples,
         max_path_length=np.inf,
         env_params=None,
-        scope=None):
+        scope=None,
+        shared_memory=False,
+        fixed_path_length=False,
+        show_prog_bar=True):
     """
     :param policy_params: parameters for the policy. This will be updated on each worker process
     :param max_samples: desired maximum number of samples to be collected. The actual number of collected samples
     might be greater since all trajectories will be rolled out either until termination or until max_path_length is
     reached
     :param max_path_length: horizon / maximum length of a single trajectory
+    :param shared_memory: whether the workers write the paths to memory-mapped columns (see shared_paths) instead of
+    sending them through the result pipe. Only used with several workers and a finite max_path_length.
+    :param fixed_path_length: whether all the paths last exactly max_path_length steps (the env never terminates
+    earlier), so that the number of paths of each worker can be fixed up front
+    :param show_prog_bar: whether to show the progress of the collection
     :return: a list of collected paths
     """
     singleton_pool.run_each(
@@ -139,11 +162,28 @@ def sample_paths(
             _worker_set_env_params,
             [(env_params, scope)] * singleton_pool.n_parallel
         )
+    fixed_increment = int(max_path_length) if fixed_path_length and max_path_length < np.inf else None
+    if shared_memory and singleton_pool.n_parallel > 1 and max_path_length < np.inf:
+        # a worker can collect all the samples, plus the path it is finishing when the threshold is reached
+        capacity = int(max_samples + max_path_length)
+        collect_id, directory = shared_paths.new_collect_id(), shared_paths.default_directory()
+        try:
+            results = singleton_pool.run_collect(
+                _worker_collect_one_path_shared,
+                threshold=max_samples,
+                args=(max_path_length, collect_id, capacity, directory, scope),
+                show_prog_bar=show_prog_bar,
+                fixed_increment=fixed_increment,
+            )
+            return shared_paths.read_shared_paths(results)
+        finally:
+            shared_paths.remove_files(collect_id, directory)
     return singleton_pool.run_collect(
         _worker_collect_one_path,
         threshold=max_samples,
         args=(max_path_length, scope),
-        show_prog_bar=True
+        show_prog_bar=show_prog_bar,
+        fixed_increment=fixed_increment,
     )
 
 
@@ -0,0 +1,176 @@
+"""
+Transfer of the collected paths from the sampling workers to the master through memory-mapped files (in /dev/shm
+when available) instead of pickling every array through the result pipe of the pool.
+
+Each worker writes the time-indexed arrays of its paths one after the other into its own columns, one file per key,
+and only sends back the offset and length of every path. The master maps the columns and builds the paths as views.
+This only saves the pickling of the arrays: process_samples still concatenates the paths into new arrays.
+"""
+import glob
+import os
+import tempfile
+import uuid
+
+import numpy as np
+
+TIME_INDEXED_KEYS = ["observations", "actions", "rewards", "dones"]
+TIME_INDEXED_DICT_KEYS = ["env_infos", "agent_infos"]
+
+
+def default_directory():
+    if os.path.isdir("/dev/shm"):
+        return "/dev/shm"
+    return tempfile.gettempdir()
+
+
+def new_collect_id():
+    return uuid.uuid4().hex
+
+
+def remove_files(collect_id, directory=None):
+    """
+    Remove the files of the workers for this collection that are still there, e.g. columns allocated for a path that
+    did not fit in them, or all of them if the collection failed before the master read them
+    """
+    for file_name in glob.glob(os.path.join(directory or default_directory(), "rllab_paths_%s_*.dat" % collect_id)):
+        try:
+            os.unlink(file_name)
+        except OSError:
+            pass
+
+
+def _flatten_path(path):
+    """
+    Split a path into the time-indexed arrays that can be stored in columns, keyed by tuples of keys, and the
+    remaining entries (e.g. last_obs, or infos of dtype object), that are sent as they are.
+    """
+    columns = dict()
+    extras = dict()
+
+    def add(key, value, extras_dict):
+        value = np.asarray(value)
+        if value.dtype.hasobject:
+            extras_dict[key[-1]] = value
+        else:
+            columns[key] = value
+
+    for k, v in path.items():
+        if k in TIME_INDEXED_KEYS:
+            add((k,), v, extras)
+        elif k in TIME_INDEXED_DICT_KEYS:
+            extras[k] = dict()
+            _flatten_info_dict((k,), v, add, extras[k])
+        else:
+            extras[k] = v
+    return columns, extras
+
+
+def _flatten_info_dict(prefix, info_dict, add, extras_dict):
+    for k, v in info_dict.items():
+        if isinstance(v, dict):
+            extras_dict[k] = dict()
+            _flatten_info_dict(prefix + (k,), v, add, extras_dict[k])
+        else:
+            add(prefix + (k,), v, extras_dict)
+
+
+def _unflatten_path(columns, extras):
+    path = dict()
+    for k, v in extras.items():
+        path[k] = _copy_dict_structure(v) if isinstance(v, dict) else v
+    for key, value in columns.items():
+        d = path
+        for k in key[:-1]:
+            d = d.setdefault(k, dict())
+        d[key[-1]] = value
+    return path
+
+
+def _copy_dict_structure(d):
+    return {k: _copy_dict_structure(v) if isinstance(v, dict) else v for k, v in d.items()}
+
+
+class SharedPathWriter(object):
+    """
+    Worker side of the transfer. The columns are allocated when the first path is written, with the shapes and dtypes
+    of its arrays, and hold up to capacity time steps. The files are sparse, so only the written steps use memory.
+    """
+
+    def __init__(self, collect_id, capacity, directory=None):
+        self.collect_id = collect_id
+        self.capacity = capacity
+        self.directory = directory or default_directory()
+        self.prefix = os.path.join(self.directory, "rllab_paths_%s_%d" % (collect_id, os.getpid()))
+        self.layout = None
+        self.columns = None
+        self.size = 0
+
+    def _allocate(self, columns):
+        self.layout = dict()
+        self.columns = dict()
+        for idx, (key, value) in enumerate(sorted(columns.items())):
+            file_name = "%s_%d.dat" % (self.prefix, idx)
+            shape = (self.capacity,) + value.shape[1:]
+            self.layout[key] = (file_name, shape, value.dtype.str)
+            self.columns[key] = np.memmap(file_name, dtype=value.dtype, mode="w+", shape=shape)
+
+    def _fits(self, columns, length):
+        if self.size + length > self.capacity or set(columns.keys()) != set(self.layout.keys()):
+            return False
+        return all(
+            value.shape[1:] == self.layout[key][1][1:] and value.dtype.str == self.layout[key][2]
+            for key, value in columns.items()
+        )
+
+    def write(self, path):
+        """
+        :return: the record describing where the path was written, or None if it does not fit in the columns (in
+        which case the path itself should be sent)
+        """
+        columns, extras = _flatten_path(path)
+        length = len(path["rewards"])
+        if length > self.capacity or any(len(value) != length for value in columns.values()):
+            return None
+        if self.columns is None:
+            self._allocate(columns)
+        if not self._fits(columns, length):
+            return None
+        for key, value in columns.items():
+            self.columns[key][self.size:self.size + length] = value
+        record = dict(prefix=self.prefix, layout=self.layout, offset=self.size, length=length, extras=extras)
+        self.size += length
+        return record
+
+    def close(self):
+        self.columns = None
+
+
+def is_shared_record(result):
+    return isinstance(result, dict) and "layout" in result and "offset" in result
+
+
+def read_shared_paths(results):
+    """
+    Build the paths from the results of the workers: records written by a SharedPathWriter, or paths that were sent
+    as they are. The columns are mapped copy-on-write, so the paths are views that can still be modified, and the
+    files are unlinked right away: the memory is released once the paths are no longer referenced.
+    """
+    mapped = dict()
+    paths = []
+    for result in results:
+        if not is_shared_record(result):
+            paths.append(result)
+            continue
+        if result["prefix"] not in mapped:
+            columns = dict()
+            for key, (file_name, shape, dtype) in result["layout"].items():
+                columns[key] = np.memmap(file_name, dtype=np.dtype(dtype), mode="c", shape=shape)
+                os.unlink(file_name)
+            mapped[result["prefix"]] = columns
+        columns = mapped[result["prefix"]]
+        start, stop = result["offset"], result["offset"] + result["length"]
+        paths.append(_unflatten_path(
+            {key: np.asarray(column[start:stop]) for key, column in columns.items()},
+            result["extras"],
+        ))
+    return paths
@@ -2,6 +2,8 @@ from joblib.pool import MemmappingPool
 import multiprocessing as mp
 from rllab.misc import logger
 import pyprind
+import functools
+import threading
 import time
 import traceback
 import sys
@@ -35,14 +37,28 @@ class SharedGlobal(object):
     pass
 
 
+def _locked(method):
+    @functools.wraps(method)
+    def locked_method(self, *args, **kwargs):
+        with self.lock:
+            return method(self, *args, **kwargs)
+    return locked_method
+
+
 class StatefulPool(object):
     def __init__(self):
         self.n_parallel = 1
         self.pool = None
         self.queue = None
         self.worker_queue = None
+        self.collect_counts = None
+        self.collect_done = None
         self.G = SharedGlobal()
+        # the pool can be driven by a background thread of the master (e.g. pipelined sampling): its calls are run one
+        # at a time, the others wait for the current one to finish
+        self.lock = threading.RLock()
 
+    @_locked
     def initialize(self, n_parallel):
         self.n_parallel = n_parallel
         if self.pool is not None:
@@ -54,6 +70,10 @@ class StatefulPool(object):
         if n_parallel > 1:
             self.queue = mp.Queue()
             self.worker_queue = mp.Queue()
+            # shared with the workers by inheritance, for run_collect: one count per task, each only written by the
+            # worker running that task, and an event set as soon as the counts reach the threshold
+            self.collect_counts = mp.RawArray('l', n_parallel)
+            self.collect_done = mp.Event()
             # FIXME: memmap is slow.
             # self.pool = MemmapingPool(
             #     self.n_parallel,
@@ -63,6 +83,7 @@ class StatefulPool(object):
                 self.n_parallel
             )
 
+    @_locked
     def run_each(self, runner, args_list=None):
         """
         Run the method on each worker process, and collect the result of execution.
@@ -84,6 +105,7 @@ class StatefulPool(object):
             return results.get()
         return [runner(self.G, *args_list[0])]
 
+    @_locked
     def run_map(self, runner, args_list):
         if self.n_parallel > 1:
             return self.pool.map(_worker_run_map, [(runner, args) for args in args_list])
@@ -93,15 +115,15 @@ class StatefulPool(object):
                 ret.append(runner(self.G, *args))
             return ret
 
+    @_locked
     def run_imap_unordered(self, runner, args_list):
+        # drained while the lock is held: a generator left unfinished by the caller would keep it forever
         if self.n_parallel > 1:
-            for x in self.pool.imap_unordered(_worker_run_map, [(runner, args) for args in args_list]):
-                yield x
-        else:
-            for args in args_list:
-                yield runner(self.G, *args)
+            return list(self.pool.imap_unordered(_worker_run_map, [(runner, args) for args in args_list]))
+        return [runner(self.G, *args) for args in args_list]
 
-    def run_collect(self, collect_once, threshold, args=None, show_prog_bar=True):
+    @_locked
+    def run_collect(self, collect_once, threshold, args=None, show_prog_bar=True, fixed_increment=None):
         """
         Run the collector method using the worker pool. The collect_once method will receive 'G' as
         its first argument, followed by the provided args, if any. The method should return a pair of values.
@@ -117,31 +139,40 @@ class StatefulPool(object):
 
         :param collector:
         :param threshold:
+        :param fixed_increment: if every call to collect_once is known to return this increment (e.g. paths that never
+        terminate before the horizon), the number of calls of each worker is fixed up front and the workers do not
+        need to share their progress
         :return:
         """
         if args is None:
             args = tuple()
-        if self.pool:
-            manager = mp.Manager()
-            counter = manager.Value('i', 0)
-            lock = manager.RLock()
+        if self.pool and fixed_increment is not None:
+            n_calls = (threshold + fixed_increment - 1) // fixed_increment
+            quotas = [n_calls // self.n_parallel + int(i < n_calls % self.n_parallel) for i in range(self.n_parallel)]
+            results = self.pool.map_async(
+                _worker_run_collect_quota,
+                [(collect_once, quota, args) for quota in quotas]
+            )
+            return sum(results.get(), [])
+        elif self.pool:
+            for slot in range(self.n_parallel):
+                self.collect_counts[slot] = 0
+            self.collect_done.clear()
             results = self.pool.map_async(
                 _worker_run_collect,
-                [(collect_once, counter, lock, threshold, args)] * self.n_parallel
+                [(collect_once, slot, threshold, args) for slot in range(self.n_parallel)]
             )
             if show_prog_bar:
                 pbar = ProgBarCounter(threshold)
             last_value = 0
-            while True:
-                time.sleep(0.1)
-                with lock:
-                    if counter.value >= threshold:
-                        if show_prog_bar:
-                            pbar.stop()
-                        break
-                    if show_prog_bar:
-                        pbar.inc(counter.value - last_value)
-                    last_value = counter.value
+            # the timeout only paces the progress bar: the event is set as soon as the threshold is reached
+            while not self.collect_done.wait(0.1) and not results.ready():
+                if show_prog_bar:
+                    value = sum(self.collect_counts)
+                    pbar.inc(value - last_value)
+                    last_value = value
+            if show_prog_bar:
+                pbar.stop()
             print('Done sampling.')
             start = time.time()
             out = sum(results.get(), [])
@@ -181,18 +212,23 @@ def _worker_run_each(all_args):
 
 def _worker_run_collect(all_args):
     try:
-        collect_once, counter, lock, threshold, args = all_args
+        collect_once, slot, threshold, args = all_args
+        counts = singleton_pool.collect_counts
         collected = []
-        while True:
-            with lock:
-                if counter.value >= threshold:
-                    return collected
+        while sum(counts) < threshold:
             result, inc = collect_once(singleton_pool.G, *args)
             collected.append(result)
-            with lock:
-                counter.value += inc
-                if counter.value >= threshold:
-                    return collected
+            counts[slot] += inc
+        singleton_pool.collect_done.set()
+        return collected
+    except Exception:
+        raise Exception("".join(traceback.format_exception(*sys.exc_info())))
+
+
+def _worker_run_collect_quota(all_args):
+    try:
+        collect_once, quota, args = all_args
+        return [collect_once(singleton_pool.G, *args)[0] for _ in range(quota)]
     except Exception:
         raise Exception("".join(traceback.format_exception(*sys.exc_info())))
 
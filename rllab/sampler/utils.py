@@ -50,3 +50,185 @@ def rollout(env, agent, max_path_length=np.inf, animated=False, speedup=1, init_
         dones=np.asarray(dones),
         last_obs=o,
     )
+
+
+
+class _Column(object):
+    """ Preallocated storage of one time-indexed value of a path, with the shape and dtype of its first value """
+
+    def __init__(self, value, capacity):
+        value_type = type(value)
+        value = np.asarray(value)
+        self.data = np.empty((capacity,) + value.shape, dtype=value.dtype)
+        self.values = None  # only used if the shape of the values changes along the path
+        self._set_fast_type(value_type, value)
+        self.data[0] = value
+
+    def _set_fast_type(self, value_type, value):
+        # only values of this type are written as they are: numeric scalars, or arrays if they also have the same shape
+        # and dtype. Lists, tuples and any other values go through write, which checks their shape and dtype
+        fast = value_type is np.ndarray or (value.ndim == 0 and value.dtype.kind in 'biufc')
+        self.type = value_type if fast and value.dtype == self.data.dtype else None
+        self.shape = self.data.shape[1:] if value_type is np.ndarray else None
+        self.dtype = self.data.dtype
+
+    def write(self, t, value):
+        if self.values is not None:
+            self.values.append(value)
+            return
+        value_type = type(value)
+        value = np.asarray(value)
+        if value.shape != self.data.shape[1:]:
+            # fall back to stacking a list, as rollout does
+            self.values = list(self.data[:t]) + [value]
+            self.type = None
+            return
+        dtype = np.promote_types(self.data.dtype, value.dtype)
+        if dtype != self.data.dtype:
+            self.data = self.data.astype(dtype)
+        self._set_fast_type(value_type, value)
+        self.data[t] = value
+
+    def grow(self, capacity):
+        if self.values is None:
+            data = np.empty((capacity,) + self.data.shape[1:], dtype=self.data.dtype)
+            data[:len(self.data)] = self.data
+            self.data = data
+
+    def stack(self, length):
+        if self.values is not None:
+            return tensor_utils.stack_tensor_list(self.values)
+        if length < len(self.data):
+            return self.data[:length].copy()
+        return self.data
+
+
+def _leaf_columns(source, keys, value, capacity, columns):
+    """ Add a column for every non-dict value of value, nested under the given keys of the source-th step value """
+    if isinstance(value, dict):
+        for k, v in value.items():
+            _leaf_columns(source, keys + (k,), v, capacity, columns)
+    else:
+        columns.append((source, keys, _Column(value, capacity)))
+
+
+def _nest_columns(columns, source, length):
+    nested = dict()
+    for column_source, keys, column in columns:
+        if column_source == source:
+            d = nested
+            for k in keys[:-1]:
+                d = d.setdefault(k, dict())
+            d[keys[-1]] = column.stack(length)
+    return nested
+
+
+def preallocated_rollout(env, agent, max_path_length=np.inf, init_state=None, no_action=False, initial_capacity=1000):
+    """
+    Same as rollout (without rendering), but every value of the path (including each key of the info dicts) is
+    written into an array allocated at the first step, with the shape and dtype of its first value and
+    max_path_length rows (initial_capacity rows, doubled when full, if the horizon is infinite). The arrays are
+    trimmed at termination, so the info dicts of every step are not kept around and stacked at the end.
+    """
+    if init_state is not None:
+        o = env.reset(init_state)
+    else:
+        o = env.reset()
+    agent.reset()
+    capacity = int(max_path_length) if max_path_length < np.inf else initial_capacity
+    columns = None
+    path_length = 0
+    while path_length < max_path_length:
+        a, agent_info = agent.get_action(o)
+        if no_action:
+            a = np.zeros_like(a)
+        next_o, r, d, env_info = env.step(a)
+        step = (env.observation_space.flatten(o), env.action_space.flatten(a), r, agent_info, env_info, d)
+        if columns is None:
+            columns = []
+            for source, value in enumerate(step):
+                _leaf_columns(source, (), value, capacity, columns)
+        else:
+            if path_length == capacity:
+                capacity *= 2
+                for _, _, column in columns:
+                    column.grow(capacity)
+            for source, keys, column in columns:
+                value = step[source]
+                for k in keys:
+                    value = value[k]
+                if type(value) is column.type and (column.shape is None or (
+                        value.shape == column.shape and value.dtype == column.dtype)):
+                    column.data[path_length] = value
+                else:
+                    column.write(path_length, value)
+        path_length += 1
+        if d:
+            break
+        o = next_o
+
+    if columns is None:
+        return rollout(env, agent, max_path_length, init_state=init_state, no_action=no_action)
+    observations, actions, rewards, dones = [column.stack(path_length) for source, _, column in columns
+                                             if source in (0, 1, 2, 5)]
+    return dict(
+        observations=observations,
+        actions=actions,
+        rewards=rewards,
+        agent_infos=_nest_columns(columns, 3, path_length),
+        env_infos=_nest_columns(columns, 4, path_length),
+        dones=dones,
+        last_obs=o,
+    )
+
+def batch_rollout(envs, agent, max_path_length=np.inf):
+    """
+    Roll out the agent in all the envs in lockstep: each time step does a single agent.get_actions call for the envs
+    that are not done yet. Envs are dropped from the batch as soon as they terminate.
+    :return: a list with one path per env, in the same format as rollout
+    """
+    if agent.recurrent:
+        # the hidden state of recurrent policies is tied to a fixed batch
+        return [rollout(env, agent, max_path_length) for env in envs]
+    n_envs = len(envs)
+    observations = [[] for _ in range(n_envs)]
+    actions = [[] for _ in range(n_envs)]
+    rewards = [[] for _ in range(n_envs)]
+    agent_infos = [[] for _ in range(n_envs)]
+    env_infos = [[] for _ in range(n_envs)]
+    dones = [[] for _ in range(n_envs)]
+    last_obs = [env.reset() for env in envs]
+    agent.reset()
+    live = list(range(n_envs))
+    path_length = 0
+    while live and path_length < max_path_length:
+        a_n, agent_info_n = agent.get_actions([last_obs[i] for i in live])
+        still_live = []
+        for j, i in enumerate(live):
+            env = envs[i]
+            a = a_n[j]
+            next_o, r, d, env_info = env.step(a)
+            observations[i].append(env.observation_space.flatten(last_obs[i]))
+            rewards[i].append(r)
+            actions[i].append(env.action_space.flatten(a))
+            agent_infos[i].append({k: v[j] for k, v in agent_info_n.items()})
+            env_infos[i].append(env_info)
+            dones[i].append(d)
+            if not d:
+                last_obs[i] = next_o
+                still_live.append(i)
+        live = still_live
+        path_length += 1
+
+    return [
+        dict(
+            observations=tensor_utils.stack_tensor_list(observations[i]),
+            actions=tensor_utils.stack_tensor_list(actions[i]),
+            rewards=tensor_utils.stack_tensor_list(rewards[i]),
+            agent_infos=tensor_utils.stack_tensor_dict_list(agent_infos[i]),
+            env_infos=tensor_utils.stack_tensor_dict_list(env_infos[i]),
+            dones=np.asarray(dones[i]),
+            last_obs=last_obs[i],
+        )
+        for i in range(n_envs)
+    ]
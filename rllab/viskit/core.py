@@ -1,10 +1,14 @@
 import csv
+import hashlib
+import io
 from rllab.misc import ext
+from rllab.misc.columnar_log import is_columnar, load_columnar
 import os
 import numpy as np
 import base64
 import pickle
 import json
+import warnings
 import itertools
 # import ipywidgets
 # import IPython.display
@@ -21,21 +25,142 @@ def flatten(l):
     return [item for sublist in l for item in sublist]
 
 
-def load_progress(progress_csv_path):
+_progress_cache = dict()  # key: path of a progress csv, value: dict of the parsed columns (see _parse_progress)
+
+
+def _parse_float_column(values):
+    try:
+        return np.array(values, dtype=np.float64)
+    except ValueError:
+        column = np.zeros(len(values))
+        for i, v in enumerate(values):
+            try:
+                column[i] = float(v)
+            except ValueError:
+                pass
+        return column
+
+
+def _parse_progress_rows(data, n_keys):
+    """
+    :param data: bytes of complete csv lines
+    :return: the columns of the rows, as float arrays (0 for the values that are not numbers, or are missing)
+    """
+    text = data.decode()
+    if '"' not in text:
+        # no quoted cells: parse all the cells at once
+        lines = [line for line in text.replace('\r', '').split('\n') if len(line) > 0]
+        if all(line.count(',') == n_keys - 1 for line in lines):
+            with warnings.catch_warnings():
+                # fromstring stops (with a warning) at the first cell that is not a number
+                warnings.simplefilter('ignore')
+                values = np.fromstring(','.join(lines), sep=',') if len(lines) > 0 else np.zeros(0)
+            if len(values) == len(lines) * n_keys:
+                values = values.reshape(len(lines), n_keys)
+                return [values[:, i].copy() for i in range(n_keys)]
+            cells = ','.join(lines).split(',') if len(lines) > 0 else []
+            return [_parse_float_column(cells[i::n_keys]) for i in range(n_keys)]
+    rows = [row for row in csv.reader(io.StringIO(text)) if len(row) > 0]
+    return [_parse_float_column([row[i] if i < len(row) else '' for row in rows]) for i in range(n_keys)]
+
+
+_DIGEST_BYTES = 4096
+
+
+def _parsed_digest(f, start, end):
+    """ Hash of the first and last (at most) _DIGEST_BYTES bytes of f between start and end """
+    f.seek(start)
+    head = f.read(min(_DIGEST_BYTES, end - start))
+    tail_start = max(start, end - _DIGEST_BYTES)
+    f.seek(tail_start)
+    tail = f.read(end - tail_start)
+    return hashlib.md5(head + tail).hexdigest()
+
+
+def _parse_progress(progress_csv_path, cached=None):
+    """
+    Parse the complete lines of a progress csv. If cached is the result of a previous call on the same file and the
+    file was only appended to since then, only the new lines are parsed. A file that was replaced (new inode) or
+    rewritten (the parsed bytes do not hash the same anymore) is parsed again from the start.
+    """
+    stat = os.stat(progress_csv_path)
+    if cached is not None and cached["mtime"] == stat.st_mtime and cached["size"] == stat.st_size and \
+            cached["inode"] == stat.st_ino:
+        return cached
+    with open(progress_csv_path, 'rb') as f:
+        header = f.readline()
+        if not header.endswith(b'\n'):
+            return dict(mtime=stat.st_mtime, size=stat.st_size, inode=stat.st_ino, digest='', header=b'', offset=0,
+                        keys=[], columns=[])
+        if cached is not None and cached["header"] == header and cached["inode"] == stat.st_ino and \
+                len(header) <= cached["offset"] <= stat.st_size and \
+                _parsed_digest(f, len(header), cached["offset"]) == cached["digest"]:
+            offset = cached["offset"]
+            keys, columns = cached["keys"], cached["columns"]
+        else:
+            offset = len(header)
+            keys = next(csv.reader([header.decode()]))
+            columns = [np.zeros(0) for _ in keys]
+        f.seek(offset)
+        data = f.read(stat.st_size - offset)
+        # a line being written by a live run is parsed at the next reload
+        data = data[:data.rfind(b'\n') + 1]
+        digest = _parsed_digest(f, len(header), offset + len(data))
+    new_columns = _parse_progress_rows(data, len(keys))
+    return dict(mtime=stat.st_mtime, size=stat.st_size, inode=stat.st_ino, digest=digest, header=header,
+                offset=offset + len(data), keys=keys,
+                columns=[np.concatenate([c, new_c]) for c, new_c in zip(columns, new_columns)])
+
+
+def _progress_cache_file(progress_csv_path):
+    return os.path.join(os.path.dirname(progress_csv_path), "." + os.path.basename(progress_csv_path) + ".cache.npz")
+
+
+def _load_progress_cache_file(progress_csv_path):
+    try:
+        with np.load(_progress_cache_file(progress_csv_path)) as data:
+            meta = json.loads(str(data["meta"]))
+            return dict(mtime=meta["mtime"], size=meta["size"], inode=meta["inode"], digest=meta["digest"],
+                        header=meta["header"].encode(), offset=meta["offset"], keys=meta["keys"],
+                        columns=[data["column_%d" % i] for i in range(len(meta["keys"]))])
+    except (IOError, OSError, KeyError, ValueError):
+        return None
+
+
+def _save_progress_cache_file(progress_csv_path, parsed):
+    meta = dict(mtime=parsed["mtime"], size=parsed["size"], inode=parsed["inode"], digest=parsed["digest"],
+                header=parsed["header"].decode(), offset=parsed["offset"], keys=parsed["keys"])
+    cache_file = _progress_cache_file(progress_csv_path)
+    try:
+        with open(cache_file + ".tmp", 'wb') as f:
+            np.savez(f, meta=json.dumps(meta), **{"column_%d" % i: c for i, c in enumerate(parsed["columns"])})
+        os.replace(cache_file + ".tmp", cache_file)
+    except (IOError, OSError):
+        # e.g. read-only experiment directories
+        pass
+
+
+def load_progress(progress_csv_path, use_cache=True):
+    """
+    :param use_cache: whether to reuse the columns parsed by previous calls (kept in memory, and in a hidden .npz file
+    next to the csv file), when the file did not change or was only appended to. Files that were rewritten are parsed
+    again from the start
+    """
     print("Reading %s" % progress_csv_path)
-    entries = dict()
-    with open(progress_csv_path, 'r') as csvfile:
-        reader = csv.DictReader(csvfile)
-        for row in reader:
-            for k, v in row.items():
-                if k not in entries:
-                    entries[k] = []
-                try:
-                    entries[k].append(float(v))
-                except:
-                    entries[k].append(0.)
-    entries = dict([(k, np.array(v)) for k, v in entries.items()])
-    return entries
+    if is_columnar(progress_csv_path):
+        return load_columnar(progress_csv_path)
+    if not use_cache:
+        parsed = _parse_progress(progress_csv_path)
+    else:
+        progress_csv_path = os.path.abspath(progress_csv_path)
+        cached = _progress_cache.get(progress_csv_path)
+        if cached is None:
+            cached = _load_progress_cache_file(progress_csv_path)
+        parsed = _parse_progress(progress_csv_path, cached)
+        _progress_cache[progress_csv_path] = parsed
+        if parsed is not cached:
+            _save_progress_cache_file(progress_csv_path, parsed)
+    return dict(zip(parsed["keys"], parsed["columns"]))
 
 
 def to_json(stub_object):
@@ -93,30 +218,74 @@ def lookup(d, keys):
     return d
 
 
-def load_exps_data(exp_folder_paths, disable_variant=False, ignore_missing_keys=False):
+def _exp_signature(exp_path):
+    """ Sizes and modification times of the files of an experiment that load_exps_data reads """
+    signature = []
+    for name in ("params.json", "variant.json", "progress.csv"):
+        try:
+            stat = os.stat(os.path.join(exp_path, name))
+            signature.append((name, stat.st_mtime, stat.st_size))
+        except OSError:
+            pass
+    columns_path = os.path.join(exp_path, "progress.cols")
+    if os.path.isdir(columns_path):
+        for name in sorted(os.listdir(columns_path)):
+            stat = os.stat(os.path.join(columns_path, name))
+            signature.append((name, stat.st_mtime, stat.st_size))
+    return tuple(signature)
+
+
+def _load_exp_data(exp_path, disable_variant):
+    params_json_path = os.path.join(exp_path, "params.json")
+    variant_json_path = os.path.join(exp_path, "variant.json")
+    progress_csv_path = os.path.join(exp_path, "progress.csv")
+    if not os.path.exists(progress_csv_path) and os.path.exists(os.path.join(exp_path, "progress.cols")):
+        progress_csv_path = os.path.join(exp_path, "progress.cols")
+    progress = load_progress(progress_csv_path)
+    if disable_variant:
+        params = load_params(params_json_path)
+    else:
+        try:
+            params = load_params(variant_json_path)
+        except IOError:
+            params = load_params(params_json_path)
+    return ext.AttrDict(progress=progress, params=params, flat_params=flatten_dict(params))
+
+
+def load_exps_data(exp_folder_paths, disable_variant=False, ignore_missing_keys=False, n_threads=1, exps_cache=None,
+                   default_values=None):
+    """
+    :param n_threads: number of threads loading the experiments in parallel
+    :param exps_cache: dict from the experiment folders to their data, filled by the call. The experiments whose files
+    did not change since they were put in it are not loaded again.
+    :param default_values: dict of the values of the params missing in some experiments, reused and filled by the call
+    """
     exps = []
     for exp_folder_path in exp_folder_paths:
-        exps += [x[0] for x in os.walk(exp_folder_path, followlinks=True)]
+        exps += [x[0] for x in os.walk(exp_folder_path, followlinks=True) if not is_columnar(x[0])]
     print("finished walking exp folders")
-    exps_data = []
-    for exp in exps:
+    if exps_cache is None:
+        exps_cache = dict()
+
+    def load(exp_path):
+        signature = _exp_signature(exp_path)
+        if exp_path in exps_cache and exps_cache[exp_path][0] == signature:
+            return exps_cache[exp_path][1]
         try:
-            exp_path = exp
-            params_json_path = os.path.join(exp_path, "params.json")
-            variant_json_path = os.path.join(exp_path, "variant.json")
-            progress_csv_path = os.path.join(exp_path, "progress.csv")
-            progress = load_progress(progress_csv_path)
-            if disable_variant:
-                params = load_params(params_json_path)
-            else:
-                try:
-                    params = load_params(variant_json_path)
-                except IOError:
-                    params = load_params(params_json_path)
-            exps_data.append(ext.AttrDict(
-                progress=progress, params=params, flat_params=flatten_dict(params)))
+            data = _load_exp_data(exp_path, disable_variant)
         except IOError as e:
             print(e)
+            data = None
+        exps_cache[exp_path] = (signature, data)
+        return data
+
+    if n_threads > 1:
+        from concurrent.futures import ThreadPoolExecutor
+        with ThreadPoolExecutor(max_workers=n_threads) as executor:
+            loaded = list(executor.map(load, exps))
+    else:
+        loaded = [load(exp) for exp in exps]
+    exps_data = [data for data in loaded if data is not None]
 
     # a dictionary of all keys and types of values
     all_keys = dict()
@@ -127,7 +296,8 @@ def load_exps_data(exp_folder_paths, disable_variant=False, ignore_missing_keys=
 
     # if any data does not have some key, specify the value of it
     if not ignore_missing_keys:
-        default_values = dict()
+        if default_values is None:
+            default_values = dict()
         for data in exps_data:
             for key in sorted(all_keys.keys()):
                 if key not in data.flat_params:
@@ -147,6 +317,12 @@ def load_exps_data(exp_folder_paths, disable_variant=False, ignore_missing_keys=
                             print("Warning: cannot cast %s to %s" % (default, all_keys[key]))
                         default_values[key] = default
                     data.flat_params[key] = default_values[key]
+    elif default_values:
+        # without asking for the missing keys, those already given a value (e.g. by a previous call) are still filled
+        for data in exps_data:
+            for key, value in default_values.items():
+                if key in all_keys and key not in data.flat_params:
+                    data.flat_params[key] = value
 
     return exps_data
 
@@ -211,9 +387,50 @@ def extract_distinct_params(exps_data, excluded_params=('exp_name', 'log_dir'),
     return filtered
 
 
+class ExpIndex(object):
+    """
+    Index of experiments by the string of the value of each of their flat params, to find the experiments selected by
+    the filters of a Selector without going through all of them
+    """
+
+    def __init__(self, exps_data):
+        self.exps_data = exps_data
+        self._by_value = dict()  # key: param, value: dict from str(value) to the indices of the experiments
+        self._missing = dict()  # key: param, value: indices of the experiments without it
+        all_keys = set(k for exp in exps_data for k in exp.flat_params)
+        for k in all_keys:
+            self._by_value[k] = dict()
+            self._missing[k] = set()
+        for idx, exp in enumerate(exps_data):
+            for k in all_keys:
+                if k in exp.flat_params:
+                    self._by_value[k].setdefault(str(exp.flat_params[k]), set()).add(idx)
+                else:
+                    self._missing[k].add(idx)
+
+    def matching(self, filters):
+        """
+        :return: the sorted indices of the experiments for which every (k, v) of filters has str(v) as value of k, or
+        does not have k (same as in Selector)
+        """
+        indices = None
+        for k, v in filters:
+            if k not in self._by_value:
+                continue
+            matching = self._by_value[k].get(str(v), set()) | self._missing[k]
+            indices = matching if indices is None else indices & matching
+        if indices is None:
+            return list(range(len(self.exps_data)))
+        return sorted(indices)
+
+
 class Selector(object):
-    def __init__(self, exps_data, filters=None, custom_filters=None):
+    def __init__(self, exps_data, filters=None, custom_filters=None, index=None):
+        """
+        :param index: ExpIndex of exps_data, used to apply the filters
+        """
         self._exps_data = exps_data
+        self._index = index if index is not None and index.exps_data is exps_data else None
         if filters is None:
             self._filters = tuple()
         else:
@@ -224,10 +441,10 @@ class Selector(object):
             self._custom_filters = custom_filters
 
     def where(self, k, v):
-        return Selector(self._exps_data, self._filters + ((k, v),), self._custom_filters)
+        return Selector(self._exps_data, self._filters + ((k, v),), self._custom_filters, self._index)
 
     def custom_filter(self, filter):
-        return Selector(self._exps_data, self._filters, self._custom_filters + [filter])
+        return Selector(self._exps_data, self._filters, self._custom_filters + [filter], self._index)
 
     def _check_exp(self, exp):
         # or exp.flat_params.get(k, None) is None
@@ -236,9 +453,12 @@ class Selector(object):
         ) and all(custom_filter(exp) for custom_filter in self._custom_filters)
 
     def extract(self):
-        return list(filter(self._check_exp, self._exps_data))
+        return list(self.iextract())
 
     def iextract(self):
+        if self._index is not None:
+            exps = (self._exps_data[idx] for idx in self._index.matching(self._filters))
+            return (exp for exp in exps if all(custom_filter(exp) for custom_filter in self._custom_filters))
         return filter(self._check_exp, self._exps_data)
 
 
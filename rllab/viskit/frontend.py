@@ -19,28 +19,40 @@ import plotly.graph_objs as go
 
 
 def sliding_mean(data_array, window=5):
-    data_array = np.array(data_array)
-    new_list = []
-    for i in range(len(data_array)):
-        indices = list(range(max(i - window + 1, 0),
-                             min(i + window + 1, len(data_array))))
-        avg = 0
-        for j in indices:
-            avg += data_array[j]
-        avg /= float(len(indices))
-        new_list.append(avg)
-
-    return np.array(new_list)
-
-
+    # mean of data_array[max(i - window + 1, 0):i + window + 1] for every i, from the cumulative sums
+    data_array = np.asarray(data_array, dtype=np.float64)
+    n = len(data_array)
+    lower = np.maximum(np.arange(n) - window + 1, 0)
+    upper = np.minimum(np.arange(n) + window + 1, n)
+    finite = np.isfinite(data_array)
+    cumsum = np.concatenate([[0.], np.cumsum(np.where(finite, data_array, 0.))])
+    new_array = (cumsum[upper] - cumsum[lower]) / (upper - lower)
+    if not np.all(finite):
+        # the windows with nan or inf values are averaged directly, so that they do not spread to the other ones
+        n_not_finite = np.concatenate([[0], np.cumsum(~finite)])
+        for i in np.where(n_not_finite[upper] - n_not_finite[lower] > 0)[0]:
+            new_array[i] = np.mean(data_array[lower[i]:upper[i]])
+    return new_array
+
+
+import functools
 import itertools
+import threading
+import time
 
 app = flask.Flask(__name__, static_url_path='/static')
 
 exps_data = None
+exps_index = None
 plottable_keys = None
 distinct_params = None
 
+_exps_cache = dict()  # experiments loaded by the previous reloads, see core.load_exps_data
+_default_values = dict()
+_PLOT_DIV_CACHE_SIZE = 128  # number of plot divs kept, for the most recent plot requests
+_reload_lock = threading.Lock()
+_data_version = 0
+
 
 @app.route('/js/<path:path>')
 def send_js(path):
@@ -274,7 +286,7 @@ def get_plot_instruction(
         nonnan_exps_data = list(filter(check_nan, exps_data))
         selector = core.Selector(nonnan_exps_data)
     else:
-        selector = core.Selector(exps_data)
+        selector = core.Selector(exps_data, index=exps_index)
     if legend_post_processor is None:
         legend_post_processor = lambda x: x
     if filters is None:
@@ -338,7 +350,7 @@ def get_plot_instruction(
                     best_regret = -np.inf
                     kv_string_best_regret = None
                     for idx, params in enumerate(product_space):
-                        selector = core.Selector(exps_data)
+                        selector = core.Selector(exps_data, index=exps_index)
                         for k, v in zip(filtered_params_k, params):
                             selector = selector.where(k, str(v))
                         data = selector.extract()
@@ -613,7 +625,13 @@ def parse_float_arg(args, key):
 @app.route("/plot_div")
 def plot_div():
     #     reload_data()
-    args = flask.request.args
+    return _plot_div(_data_version, tuple(sorted(flask.request.args.items())))
+
+
+@functools.lru_cache(maxsize=_PLOT_DIV_CACHE_SIZE)
+def _plot_div(data_version, sorted_args):
+    """ Plot div of the arguments of a plot request, for the data of the given reload (cleared when it is reloaded) """
+    args = dict(sorted_args)
     plot_key = args.get("plot_key")
     split_key = args.get("split_key", "")
     group_key = args.get("group_key", "")
@@ -721,14 +739,35 @@ def index():
     )
 
 
-def reload_data():
+def reload_data(ignore_missing_keys=False):
+    """
+    Only the experiments that are new or whose files changed since the last reload are loaded (in parallel)
+    """
     global exps_data
+    global exps_index
     global plottable_keys
     global distinct_params
-    exps_data = core.load_exps_data(args.data_paths, args.disable_variant)
-    plottable_keys = sorted(list(
-        set(flatten(list(exp.progress.keys()) for exp in exps_data))))
-    distinct_params = sorted(core.extract_distinct_params(exps_data))
+    global _data_version
+    with _reload_lock:
+        new_exps_data = core.load_exps_data(args.data_paths, args.disable_variant,
+                                            ignore_missing_keys=ignore_missing_keys, n_threads=args.n_threads,
+                                            exps_cache=_exps_cache, default_values=_default_values)
+        new_plottable_keys = sorted(list(
+            set(flatten(list(exp.progress.keys()) for exp in new_exps_data))))
+        new_distinct_params = sorted(core.extract_distinct_params(new_exps_data))
+        new_exps_index = core.ExpIndex(new_exps_data)
+        exps_data, exps_index = new_exps_data, new_exps_index
+        plottable_keys, distinct_params = new_plottable_keys, new_distinct_params
+        _data_version += 1
+        _plot_div.cache_clear()
+
+
+def crawl(interval):
+    # the params missing in new experiments take the default values given at startup, without asking for the others
+    # (an experiment without a param matches any value of it)
+    while True:
+        time.sleep(interval)
+        reload_data(ignore_missing_keys=True)
 
 
 if __name__ == "__main__":
@@ -740,6 +779,11 @@ if __name__ == "__main__":
     parser.add_argument("--disable-variant", default=False, action='store_true')
     parser.add_argument("-o", default=False, action='store_true',
         help='Open a brower tab automatically')
+    parser.add_argument("--n_threads", type=int, default=8,
+                        help='Number of threads loading the experiments')
+    parser.add_argument("--reload_interval", type=float, default=0,
+                        help='Seconds between the reloads of the new or changed experiments in the background '
+                             '(0 to only load them at startup)')
     args = parser.parse_args(sys.argv[1:])
 
     # load all folders following a prefix
@@ -753,6 +797,10 @@ if __name__ == "__main__":
                 args.data_paths.append(path)
     print("Importing data from {path}...".format(path=args.data_paths))
     reload_data()
+    if args.reload_interval > 0:
+        crawler = threading.Thread(target=crawl, args=(args.reload_interval,))
+        crawler.daemon = True
+        crawler.start()
     url = "http://localhost:%d"%(args.port)
     print("Done! View %s in your browser"%(url))
 
@@ -41,6 +41,11 @@ def run_experiment(argv):
                              '(do not save snapshots)')
     parser.add_argument('--snapshot_gap', type=int, default=1,
                         help='Gap between snapshot iterations.')
+    parser.add_argument('--snapshot_async', type=ast.literal_eval, default=False,
+                        help='Whether the snapshot files are written by a background thread')
+    parser.add_argument('--snapshot_format', type=str, default='pickle',
+                        help='Format of the snapshots: "pickle" (the whole snapshot) or "compact" (the objects once, '
+                             'and only their parameter values at every iteration)')
     parser.add_argument('--tabular_log_file', type=str, default='progress.csv',
                         help='Name of the tabular log file (in csv).')
     parser.add_argument('--text_log_file', type=str, default='debug.log',
@@ -104,6 +109,8 @@ def run_experiment(argv):
     logger.set_tf_summary_dir(osp.join(log_dir, "tf_summary"))
     logger.set_snapshot_mode(args.snapshot_mode)
     logger.set_snapshot_gap(args.snapshot_gap)
+    logger.set_snapshot_async(args.snapshot_async)
+    logger.set_snapshot_format(args.snapshot_format)
     logger.set_log_tabular_only(args.log_tabular_only)
     logger.push_prefix("[%s] " % args.exp_name)
 
@@ -128,6 +135,8 @@ def run_experiment(argv):
                 for _ in maybe_iter:
                     pass
 
+    logger.set_snapshot_async(False)
+    logger.set_snapshot_format('pickle')
     logger.set_snapshot_mode(prev_mode)
     logger.set_snapshot_dir(prev_snapshot_dir)
     logger.remove_tabular_output(tabular_log_file)
@@ -1,17 +1,17 @@
 import os.path as osp
 import argparse
 import pickle
-import joblib
 import tensorflow as tf
 
 from rllab.sampler.utils import rollout
 from rllab.misc.ext import set_seed
+from rllab.misc.compact_snapshot import load_snapshot
 
 if __name__ == "__main__":
 
     parser = argparse.ArgumentParser()
     parser.add_argument('file', type=str,
-                        help='path to the snapshot file')
+                        help='path to the snapshot file (.pkl, or .npz for compact snapshots)')
     parser.add_argument('--max_path_length', type=int, default=1000,
                         help='Max length of rollout')
     parser.add_argument('--speedup', type=float, default=1,
@@ -40,7 +40,7 @@ if __name__ == "__main__":
         all_feasible_starts = pickle.load(open(args.collection_file, 'rb'))
 
     with tf.Session() as sess:
-        data = joblib.load(args.file)
+        data = load_snapshot(args.file)
         if "algo" in data:
             policy = data["algo"].policy
             env = data["algo"].env
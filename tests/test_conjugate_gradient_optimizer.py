@@ -0,0 +1,97 @@
+import re
+
+import numpy as np
+import theano
+import theano.tensor as TT
+
+from rllab.core.parameterized import Parameterized
+from rllab.misc import krylov
+from rllab.misc import logger
+from rllab.optimizers.conjugate_gradient_optimizer import ConjugateGradientOptimizer
+
+
+def _spd_matrix(rng, n):
+    a = rng.randn(n, n)
+    return a.dot(a.T) + n * np.eye(n)
+
+
+def test_cg_warm_start():
+    rng = np.random.RandomState(0)
+    for n in [1, 5, 20]:
+        a, b = _spd_matrix(rng, n), rng.randn(n)
+        solution = np.linalg.solve(a, b)
+        f_Ax = a.dot
+
+        # already solved: no iteration, and no division by the zero residual
+        np.testing.assert_array_equal(krylov.cg(f_Ax, b, x0=solution), solution)
+        np.testing.assert_array_equal(krylov.cg(np.eye(n).dot, b, x0=b), b)
+        assert np.all(np.isfinite(krylov.cg(f_Ax, np.zeros(n), x0=np.zeros(n))))
+
+        # starting from zero is the cold solve
+        for cg_iters in [1, 3, 10]:
+            np.testing.assert_array_equal(krylov.cg(f_Ax, b, cg_iters=cg_iters, x0=np.zeros(n)),
+                                          krylov.cg(f_Ax, b, cg_iters=cg_iters))
+
+        # starting close to the solution gets closer to it than the cold solve in as many iterations
+        if n > 2:
+            x0 = solution + 1e-3 * rng.randn(n)
+            warm = krylov.cg(f_Ax, b, cg_iters=2, x0=x0)
+            cold = krylov.cg(f_Ax, b, cg_iters=2)
+            assert np.linalg.norm(warm - solution) < np.linalg.norm(cold - solution)
+
+
+class _Regressor(Parameterized):
+    def __init__(self, rng):
+        Parameterized.__init__(self)
+        self.W = theano.shared(rng.randn(3, 2), name="W")
+        self.b = theano.shared(rng.randn(2), name="b")
+
+    def get_params_internal(self, **tags):
+        return [self.W, self.b]
+
+
+def _backtrack_iters(messages):
+    return [int(m) for msg in messages for m in re.findall(r"backtrack iters: (\d+)", msg)]
+
+
+def _optimize(n_batched_backtracks, max_constraint_val, max_backtracks, monkeypatch):
+    """ One step of a linear regression from random parameters, with a trust region on its outputs """
+    rng = np.random.RandomState(0)
+    target = _Regressor(rng)
+    x_var, y_var, old_var = TT.matrix("x"), TT.matrix("y"), TT.matrix("old")
+    outputs = TT.dot(x_var, target.W) + target.b
+    loss = TT.mean(TT.square(outputs - y_var))
+    constraint = TT.mean(TT.square(outputs - old_var))
+    optimizer = ConjugateGradientOptimizer(max_backtracks=max_backtracks, n_batched_backtracks=n_batched_backtracks)
+    optimizer.update_opt(loss=loss, target=target, leq_constraint=(constraint, max_constraint_val),
+                         inputs=[x_var, y_var, old_var])
+    x = rng.randn(50, 3)
+    inputs = (x, rng.randn(50, 2), x.dot(target.W.get_value()) + target.b.get_value())
+    messages = []
+    monkeypatch.setattr(logger, "log", lambda s, *args, **kwargs: messages.append(s))
+    optimizer.optimize(inputs)
+    monkeypatch.undo()
+    return target.get_param_values(), messages
+
+
+def test_batched_line_search(monkeypatch):
+    n_backtracks = set()
+    # accepted at the full step, in the first batch of ratios, and in a later one
+    for max_constraint_val in [1., 100., 1000.]:
+        params, messages = _optimize(1, max_constraint_val, 15, monkeypatch)
+        n_backtracks.update(_backtrack_iters(messages))
+        for n_batched_backtracks in [4, 20]:
+            batched_params, batched_messages = _optimize(n_batched_backtracks, max_constraint_val, 15, monkeypatch)
+            # the same step ratio is accepted
+            np.testing.assert_array_equal(batched_params, params)
+            assert _backtrack_iters(batched_messages) == _backtrack_iters(messages)
+    assert 0 in n_backtracks and max(n_backtracks) >= 4
+
+
+def test_line_search_rejected(monkeypatch):
+    initial_params = _Regressor(np.random.RandomState(0)).get_param_values()
+    # huge steps, for which the loss only increases
+    for n_batched_backtracks in [1, 2, 3]:
+        params, messages = _optimize(n_batched_backtracks, 1e4, 3, monkeypatch)
+        assert any("Rejecting the step" in msg for msg in messages)
+        np.testing.assert_array_equal(params, initial_params)
@@ -0,0 +1,248 @@
+import gc
+
+import numpy as np
+import pytest
+
+from rllab.core.parameterized import Parameterized
+from rllab.sampler.stateful_pool import singleton_pool
+
+from curriculum.state.evaluator import FunctionWrapper, parallel_map, invalidate_evaluator, _cached_env_copies, _get_env_copies
+from curriculum.state.evaluator import evaluate_states, evaluate_states_batch, evaluate_path, compute_labels
+from curriculum.state.evaluator import StateRewardAccumulator, label_states_from_accumulator
+
+_n_unpickled_envs = 0
+
+
+class _Env(object):
+    def __init__(self, goal):
+        self.goal = goal
+
+    def __getstate__(self):
+        return dict(goal=self.goal)
+
+    def __setstate__(self, d):
+        global _n_unpickled_envs
+        _n_unpickled_envs += 1
+        self.goal = d['goal']
+
+
+class _Policy(Parameterized):
+    def __init__(self, value):
+        Parameterized.__init__(self)
+        self.value = np.array([value], dtype=float)
+
+    def get_param_values(self, **tags):
+        return self.value.copy()
+
+    def set_param_values(self, flattened_params, **tags):
+        self.value = np.array(flattened_params, dtype=float)
+
+    def __getstate__(self):
+        return dict(value=self.value)
+
+    def __setstate__(self, d):
+        Parameterized.__init__(self)
+        self.value = d['value']
+
+
+def _evaluate(x, env, policy):
+    return x, env.goal, float(policy.value[0]), _n_unpickled_envs
+
+
+def _map(env, policy):
+    results = parallel_map(FunctionWrapper(_evaluate, env, policy), range(8), resident=True)
+    assert [r[0] for r in results] == list(range(8))
+    return set(r[1] for r in results), set(r[2] for r in results), max(r[3] for r in results)
+
+
+def test_resident_evaluator():
+    singleton_pool.initialize(2)
+    try:
+        invalidate_evaluator()
+        env, policy = _Env(goal=0), _Policy(0.)
+        goals, values, n_unpickled = _map(env, policy)
+        assert goals == {0} and values == {0.}
+
+        # only the policy parameters change: they are pushed, the env stays resident in the workers
+        policy.set_param_values(np.array([1.]))
+        goals, values, n_unpickled_after = _map(env, policy)
+        assert goals == {0} and values == {1.}
+        assert n_unpickled_after == n_unpickled
+
+        # the env changes: the workers get the new env, along with the current policy parameters
+        env.goal = 5
+        goals, values, n_unpickled_after = _map(env, policy)
+        assert goals == {5} and values == {1.}
+        assert n_unpickled_after > n_unpickled
+
+        # both change at once
+        env.goal = 7
+        policy.set_param_values(np.array([2.]))
+        goals, values, _ = _map(env, policy)
+        assert goals == {7} and values == {2.}
+    finally:
+        invalidate_evaluator()
+        singleton_pool.initialize(1)
+        singleton_pool.pool = None
+
+
+def test_env_copies():
+    env = _Env(goal=0)
+    copies = _get_env_copies(env, 3)
+    assert len(copies) == 3 and all(c is not env and c.goal == 0 for c in copies)
+    assert _get_env_copies(env, 2) == copies[:2]
+
+    env.goal = 5
+    new_copies = _get_env_copies(env, 3)
+    assert all(c.goal == 5 for c in new_copies)
+    assert not any(c is old for c in new_copies for old in copies)
+
+    del env
+    gc.collect()
+    assert len(_cached_env_copies) == 0
+
+
+class _Space(object):
+    def flatten(self, x):
+        return np.asarray(x).flatten()
+
+
+class _GoalEnv(object):
+    """ Point moved by the actions, done close to the goal: the paths of different states have different lengths """
+    observation_space = _Space()
+    action_space = _Space()
+
+    def __init__(self):
+        self.goal_generator = None
+        self.start_generator = None
+
+    def update_goal_generator(self, goal_generator):
+        self.goal_generator = goal_generator
+
+    def update_start_generator(self, start_generator):
+        self.start_generator = start_generator
+
+    def reset(self):
+        self.goal = self.goal_generator.state if self.goal_generator else np.zeros(2)
+        self.position = self.start_generator.state if self.start_generator else np.zeros(2)
+        return np.concatenate([self.position, self.goal])
+
+    def step(self, action):
+        self.position = self.position + action
+        distance = np.linalg.norm(self.position - self.goal)
+        return np.concatenate([self.position, self.goal]), -distance, distance < 0.5, dict(distance=distance)
+
+
+class _GoalPolicy(object):
+    recurrent = False
+
+    def reset(self, dones=None):
+        pass
+
+    def get_action(self, observation):
+        action = 0.3 * (observation[2:] - observation[:2])
+        return action, dict(mean=action)
+
+    def get_actions(self, observations):
+        observations = np.asarray(observations)
+        actions = 0.3 * (observations[:, 2:] - observations[:, :2])
+        return actions, dict(mean=actions)
+
+
+def test_evaluate_states_n_envs():
+    rng = np.random.RandomState(0)
+    states = rng.uniform(-5, 5, size=(7, 2))
+    for as_goals, key, aggregator in [(True, 'rewards', (np.sum, np.mean)), (False, 'distance', (np.min, np.max))]:
+        kwargs = dict(horizon=20, n_traj=2, n_processes=1, full_path=True, key=key, as_goals=as_goals,
+                      aggregator=aggregator)
+        expected_rewards, expected_paths = evaluate_states(states, _GoalEnv(), _GoalPolicy(), n_envs=1, **kwargs)
+        assert len(set(len(path["rewards"]) for path in expected_paths)) > 1
+        for n_envs in [3, 100]:
+            mean_rewards, paths = evaluate_states(states, _GoalEnv(), _GoalPolicy(), n_envs=n_envs, **kwargs)
+            np.testing.assert_array_equal(mean_rewards, expected_rewards)
+            assert len(paths) == len(expected_paths)
+            for path, expected_path in zip(paths, expected_paths):
+                for k in ["observations", "actions", "rewards"]:
+                    np.testing.assert_array_equal(path[k], expected_path[k])
+                np.testing.assert_array_equal(path["agent_infos"]["mean"], expected_path["agent_infos"]["mean"])
+                np.testing.assert_array_equal(path["env_infos"]["distance"], expected_path["env_infos"]["distance"])
+
+
+def test_evaluate_states_batch_empty():
+    mean_rewards, paths = evaluate_states_batch([], _GoalEnv(), _GoalPolicy(), horizon=20, full_path=True)
+    assert len(mean_rewards) == 0 and paths == []
+    assert len(evaluate_states_batch(np.zeros((3, 2)), _GoalEnv(), _GoalPolicy(), horizon=20, n_traj=0)) == 3
+    with pytest.raises(ValueError):
+        evaluate_states_batch(np.zeros((3, 2)), _GoalEnv(), _GoalPolicy(), horizon=20, n_envs=0)
+
+
+class _StartEnv(object):
+    def transform_to_start_space(self, obs, env_infos):
+        return obs[:2]
+
+
+def _label_states_from_paths(all_paths, key, as_goal, n_traj, env=None, order_of_states=None):
+    """ Former label_states_from_paths: the reward of every path kept in a list per state """
+    state_dict = {}
+    for paths in all_paths:
+        for path in paths:
+            reward = evaluate_path(path, key=key)
+            if as_goal:
+                state = tuple(path['env_infos']['goal'][0])
+            else:
+                env_infos_first_time_step = {key: value[0] for key, value in path['env_infos'].items()}
+                state = tuple(env.transform_to_start_space(path['observations'][0], env_infos_first_time_step))
+            state_dict.setdefault(state, []).append(reward)
+    states, mean_rewards, updated = [], [], []
+    if order_of_states is None:
+        for state, rewards in state_dict.items():
+            if len(rewards) >= n_traj:
+                states.append(list(state))
+                mean_rewards.append(np.mean(rewards))
+    else:
+        for state in order_of_states:
+            states.append(state)
+            if state not in state_dict or len(state_dict[tuple(state)]) < n_traj:
+                mean_rewards.append(0)
+                updated.append(False)
+            else:
+                mean_rewards.append(np.mean(state_dict[tuple(state)]))
+                updated.append(True)
+    mean_rewards = np.array(mean_rewards).reshape(-1, 1)
+    labels = compute_labels(mean_rewards, min_reward=0, max_reward=1, improvement_threshold=0)
+    return np.array(states), labels, mean_rewards, updated
+
+
+def test_label_states_from_accumulator():
+    rng = np.random.RandomState(0)
+    # few distinct states, reached by a varying number of paths
+    state_pool = rng.randint(0, 4, size=(6, 2)).astype(float)
+    all_paths = []
+    for _ in range(3):
+        paths = []
+        for _ in range(rng.randint(1, 8)):
+            length = rng.randint(1, 5)
+            state = state_pool[rng.randint(len(state_pool))]
+            paths.append(dict(
+                observations=np.hstack([np.tile(state, (length, 1)), rng.randn(length, 2)]),
+                rewards=rng.randn(length),
+                env_infos=dict(goal=np.tile(state, (length, 1)), goal_reached=rng.uniform(size=length) < 0.3),
+            ))
+        all_paths.append(paths)
+    order_of_states = [tuple(state) for state in state_pool] + [(10., 10.)]
+    for as_goal, key in [(True, 'goal_reached'), (False, 'rewards')]:
+        env = None if as_goal else _StartEnv()
+        accumulator = StateRewardAccumulator(key=key, as_goal=as_goal, env=env)
+        for paths in all_paths:
+            accumulator.add_paths(paths)
+        for n_traj in [1, 2, 3]:
+            for order in [None, order_of_states]:
+                states, labels, mean_rewards, updated = _label_states_from_paths(
+                    all_paths, key=key, as_goal=as_goal, n_traj=n_traj, env=env, order_of_states=order)
+                result = label_states_from_accumulator(accumulator, n_traj=n_traj, return_mean_rewards=True,
+                                                       order_of_states=order)
+                np.testing.assert_array_equal(result[0], states)
+                np.testing.assert_array_equal(result[1], labels)
+                np.testing.assert_allclose(result[2], mean_rewards, rtol=1e-12)
+                if order is not None:
+                    assert result[3] == updated
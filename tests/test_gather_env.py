@@ -0,0 +1,79 @@
+import math
+
+import numpy as np
+
+from rllab.envs.mujoco.gather.gather_env import GatherEnv, APPLE, BOMB
+
+
+class _Robot(object):
+    def __init__(self, com):
+        self.com = com
+
+    def get_body_com(self, name):
+        return self.com
+
+
+class _GatherEnv(GatherEnv):
+    """ The sensors of a GatherEnv, as set up by its constructor, without the simulator """
+
+    def __init__(self, objects, com, ori, n_bins=10, sensor_range=6., sensor_span=math.pi):
+        self.n_bins = n_bins
+        self.sensor_range = sensor_range
+        self.sensor_span = sensor_span
+        self._objects = np.zeros((len(objects) + 3, 3))
+        self._n_objects = 0
+        for obj in objects:
+            self._add_object(*obj)
+        self._wrapped_env = _Robot(com)
+        self.ori = ori
+
+    def get_ori(self):
+        return self.ori
+
+
+def _old_get_readings(env, objects):
+    """ Former get_readings: the objects sorted by decreasing distance, each one overwriting the farther ones """
+    apple_readings = np.zeros(env.n_bins)
+    bomb_readings = np.zeros(env.n_bins)
+    robot_x, robot_y = env.wrapped_env.get_body_com("torso")[:2]
+    sorted_objects = sorted(objects, key=lambda o: (o[0] - robot_x) ** 2 + (o[1] - robot_y) ** 2)[::-1]
+    bin_res = env.sensor_span / env.n_bins
+    ori = env.get_ori()
+    for ox, oy, typ in sorted_objects:
+        dist = ((oy - robot_y) ** 2 + (ox - robot_x) ** 2) ** 0.5
+        if dist > env.sensor_range:
+            continue
+        angle = math.atan2(oy - robot_y, ox - robot_x) - ori
+        angle = angle % (2 * math.pi)
+        if angle > math.pi:
+            angle = angle - 2 * math.pi
+        if angle < -math.pi:
+            angle = angle + 2 * math.pi
+        half_span = env.sensor_span * 0.5
+        if abs(angle) > half_span:
+            continue
+        bin_number = int((angle + half_span) / bin_res)
+        intensity = 1.0 - dist / env.sensor_range
+        if typ == APPLE:
+            apple_readings[bin_number] = intensity
+        else:
+            bomb_readings[bin_number] = intensity
+    return apple_readings, bomb_readings
+
+
+def test_get_readings():
+    rng = np.random.RandomState(0)
+    for _ in range(300):
+        # on the grid of even coordinates used by reset, so that objects are often at the same distance
+        n_objects = rng.randint(0, 40)
+        positions = rng.randint(-5, 5, size=(n_objects, 2)) * 2
+        objects = [(float(x), float(y), int(rng.uniform() < 0.5) and BOMB or APPLE) for x, y in positions]
+        com = np.append(rng.uniform(-6, 6, size=2), 0.)
+        if rng.uniform() < 0.2:
+            com[:2] = np.round(com[:2])
+        env = _GatherEnv(objects, com, np.float64(rng.uniform(-2 * math.pi, 2 * math.pi)),
+                         n_bins=rng.randint(1, 20), sensor_span=rng.uniform(0.5, 2 * math.pi))
+        apple_readings, bomb_readings = env.get_readings()
+        old_apple_readings, old_bomb_readings = _old_get_readings(env, objects)
+        np.testing.assert_array_equal(apple_readings, old_apple_readings)
+        np.testing.assert_array_equal(bomb_readings, old_bomb_readings)
@@ -0,0 +1,82 @@
+import numpy as np
+
+from rllab.baselines.linear_feature_baseline import LinearFeatureBaseline
+
+
+def _paths(rng, n_paths, obs_shape=(3,)):
+    paths = []
+    for _ in range(n_paths):
+        length = rng.randint(1, 50)
+        rewards = rng.randn(length)
+        paths.append(dict(observations=rng.uniform(-15, 15, size=(length,) + obs_shape), rewards=rewards,
+                          returns=np.cumsum(rewards[::-1])[::-1]))
+    return paths
+
+
+def _old_fit(baseline, paths):
+    """ Former fit: the features of every path concatenated, and the statistics of this batch only """
+    featmat = np.concatenate([baseline._features(path) for path in paths])
+    returns = np.concatenate([path["returns"] for path in paths])
+    return np.linalg.lstsq(
+        featmat.T.dot(featmat) + baseline._reg_coeff * np.identity(featmat.shape[1]),
+        featmat.T.dot(returns)
+    )[0]
+
+
+def test_batch_features():
+    rng = np.random.RandomState(0)
+    baseline = LinearFeatureBaseline(env_spec=None)
+    for obs_shape in [(1,), (3,), (2, 2)]:
+        paths = _paths(rng, 5, obs_shape)
+        featmat = np.concatenate([baseline._features(dict(path, observations=path["observations"].reshape(
+            len(path["rewards"]), -1))) for path in paths])
+        np.testing.assert_array_equal(baseline._batch_features(paths), featmat)
+
+
+def test_cached_features():
+    rng = np.random.RandomState(0)
+    baseline = LinearFeatureBaseline(env_spec=None)
+    for itr in range(3):
+        paths = _paths(rng, 10)
+        predictions = baseline.predict_n(paths)
+        np.testing.assert_allclose(np.concatenate(predictions),
+                                   np.concatenate([baseline.predict(path) for path in paths]))
+        # fitted on the features cached by predict_n
+        baseline.fit(paths)
+        np.testing.assert_array_equal(baseline.get_param_values(), _old_fit(baseline, paths))
+        # and not on the ones of other paths of the same lengths
+        other_paths = [dict(path, observations=-path["observations"]) for path in paths]
+        baseline.predict_n(other_paths)
+        baseline.fit(paths)
+        np.testing.assert_array_equal(baseline.get_param_values(), _old_fit(baseline, paths))
+        baseline.fit(other_paths)
+        np.testing.assert_array_equal(baseline.get_param_values(), _old_fit(baseline, other_paths))
+
+
+def test_stats_decay():
+    rng = np.random.RandomState(0)
+    first_paths, second_paths = _paths(rng, 10), _paths(rng, 10)
+    # without decay of the statistics, the previous batches are forgotten
+    baseline = LinearFeatureBaseline(env_spec=None, stats_decay=0.)
+    baseline.fit(first_paths)
+    baseline.fit(second_paths)
+    np.testing.assert_array_equal(baseline.get_param_values(), _old_fit(baseline, second_paths))
+
+    stats_decay = 0.5
+    baseline = LinearFeatureBaseline(env_spec=None, stats_decay=stats_decay)
+    baseline.fit(first_paths)
+    np.testing.assert_array_equal(baseline.get_param_values(), _old_fit(baseline, first_paths))
+    baseline.predict_n(second_paths)
+    baseline.fit(second_paths)
+    first_featmat = baseline._batch_features(first_paths)
+    second_featmat = baseline._batch_features(second_paths)
+    returns = [np.concatenate([path["returns"] for path in paths]) for paths in [first_paths, second_paths]]
+    xtx = stats_decay * first_featmat.T.dot(first_featmat) + second_featmat.T.dot(second_featmat)
+    xty = stats_decay * first_featmat.T.dot(returns[0]) + second_featmat.T.dot(returns[1])
+    np.testing.assert_allclose(baseline.get_param_values(),
+                               np.linalg.solve(xtx + baseline._reg_coeff * np.identity(len(xtx)), xty), rtol=1e-6)
+
+    # statistics of other observations are dropped
+    other_paths = _paths(rng, 10, obs_shape=(5,))
+    baseline.fit(other_paths)
+    np.testing.assert_array_equal(baseline.get_param_values(), _old_fit(baseline, other_paths))
@@ -0,0 +1,189 @@
+import os
+import pickle
+import shutil
+import tempfile
+import threading
+
+import joblib
+import numpy as np
+
+from rllab.core.parameterized import Parameterized
+from rllab.core.serializable import Serializable
+from rllab.misc import logger
+from rllab.misc.columnar_log import ColumnarWriter, load_columnar
+from rllab.misc.compact_snapshot import load_snapshot
+
+_serializing_threads = []
+
+
+class _Policy(Parameterized, Serializable):
+    def __init__(self, hidden_sizes):
+        Serializable.quick_init(self, locals())
+        Parameterized.__init__(self)
+        self.values = np.zeros(3)
+
+    def get_param_values(self, **tags):
+        return self.values.copy()
+
+    def set_param_values(self, flattened_params, **tags):
+        self.values = np.array(flattened_params, dtype=float)
+
+
+class _Baseline(object):
+    def __init__(self):
+        self._coeffs = None
+        self._cached_paths = []
+
+
+class _FittedBaseline(Serializable):
+    def __init__(self):
+        Serializable.quick_init(self, locals())
+        self._coeffs = None
+
+    def get_param_values(self, **tags):
+        return self._coeffs
+
+    def set_param_values(self, val, **tags):
+        self._coeffs = val
+
+
+class _ThreadRecorder(object):
+    def __reduce__(self):
+        _serializing_threads.append(threading.current_thread().name)
+        return _ThreadRecorder, ()
+
+
+def test_async_snapshots():
+    snapshot_dir = tempfile.mkdtemp()
+    prev_snapshot_dir, prev_mode = logger.get_snapshot_dir(), logger.get_snapshot_mode()
+    logger.set_snapshot_dir(snapshot_dir)
+    logger.set_snapshot_mode('all')
+    try:
+        for use_cloudpickle in [True, False]:
+            del _serializing_threads[:]
+            logger.set_snapshot_async(True)
+            policy, baseline = _Policy(hidden_sizes=(32, 32)), _Baseline()
+            for itr in range(3):
+                policy.set_param_values(np.ones(3) * itr)
+                baseline._coeffs = np.ones(2) * itr
+                baseline._cached_paths.append(dict(rewards=np.ones(itr)))
+                params = dict(itr=itr, policy=policy, baseline=baseline, same_policy=policy, recorder=_ThreadRecorder())
+                logger.save_itr_params(itr, params, use_cloudpickle=use_cloudpickle)
+                # the training goes on while the snapshot is written
+                policy.set_param_values(-np.ones(3))
+                baseline._coeffs = None
+            logger.set_snapshot_async(False)
+            assert _serializing_threads == ["snapshot_writer"] * 3
+            for itr in range(3):
+                file_name = os.path.join(snapshot_dir, 'itr_%d.pkl' % itr)
+                if use_cloudpickle:
+                    with open(file_name, 'rb') as f:
+                        params = pickle.load(f)
+                else:
+                    params = joblib.load(file_name)
+                assert params["itr"] == itr
+                assert isinstance(params["policy"], _Policy) and params["same_policy"] is params["policy"]
+                assert params["policy"].__getstate__()["__args"] == ((32, 32),)
+                np.testing.assert_array_equal(params["policy"].get_param_values(), np.ones(3) * itr)
+                np.testing.assert_array_equal(params["baseline"]._coeffs, np.ones(2) * itr)
+                assert len(params["baseline"]._cached_paths) == itr + 1
+    finally:
+        logger.set_snapshot_async(False)
+        logger.set_snapshot_dir(prev_snapshot_dir)
+        logger.set_snapshot_mode(prev_mode)
+        shutil.rmtree(snapshot_dir)
+
+
+def test_compact_snapshots(monkeypatch):
+    snapshot_dir = tempfile.mkdtemp()
+    prev_snapshot_dir, prev_mode = logger.get_snapshot_dir(), logger.get_snapshot_mode()
+    prev_format = logger.get_snapshot_format()
+    logger.set_snapshot_dir(snapshot_dir)
+    logger.set_snapshot_mode('all')
+    logger.set_snapshot_format('compact')
+    messages = []
+    monkeypatch.setattr(logger, "log", lambda s, *args, **kwargs: messages.append(s))
+    try:
+        policy, baseline = _Policy(hidden_sizes=(32, 32)), _FittedBaseline()
+        for itr in range(3):
+            policy.set_param_values(np.ones(3) * itr)
+            if itr > 0:
+                baseline.set_param_values(np.ones(2) * itr)
+            if itr == 2:
+                # another object under a saved key
+                policy = _Policy(hidden_sizes=(8,))
+                policy.set_param_values(np.ones(3) * itr)
+            params = dict(itr=itr, step_size=0.01, policy=policy, baseline=baseline, paths=[dict(rewards=np.ones(2))])
+            logger.save_itr_params(itr, params)
+        assert sorted(os.listdir(snapshot_dir)) == ['itr_0.npz', 'itr_1.npz', 'itr_2.npz', 'objects.pkl']
+        # the entries that cannot be saved are only reported once
+        assert messages == ["paths is not saved in compact snapshots"]
+
+        snapshot = load_snapshot(os.path.join(snapshot_dir, 'itr_0.npz'))
+        assert sorted(snapshot.keys()) == ['baseline', 'itr', 'policy', 'step_size']
+        assert 'paths' not in snapshot and snapshot.get('paths') is None
+        assert snapshot['itr'] == 0 and snapshot['step_size'] == 0.01
+        # the objects saved last, with the parameters of the iteration
+        loaded_policy = snapshot['policy']
+        assert isinstance(loaded_policy, _Policy) and snapshot['policy'] is loaded_policy
+        assert loaded_policy.__getstate__()["__args"] == ((8,),)
+        np.testing.assert_array_equal(loaded_policy.get_param_values(), np.zeros(3))
+        assert snapshot['baseline'].get_param_values() is None
+
+        for itr in [2, 1]:
+            snapshot.load_iteration(os.path.join(snapshot_dir, 'itr_%d.npz' % itr))
+            assert snapshot['itr'] == itr and snapshot['policy'] is loaded_policy
+            np.testing.assert_array_equal(loaded_policy.get_param_values(), np.ones(3) * itr)
+            np.testing.assert_array_equal(snapshot['baseline'].get_param_values(), np.ones(2) * itr)
+    finally:
+        logger.set_snapshot_format(prev_format)
+        logger.set_snapshot_dir(prev_snapshot_dir)
+        logger.set_snapshot_mode(prev_mode)
+        shutil.rmtree(snapshot_dir)
+
+
+def test_columnar_log():
+    log_dir = tempfile.mkdtemp()
+    try:
+        dir_name = os.path.join(log_dir, 'progress.cols')
+        writer = ColumnarWriter(dir_name, flush_every=2)
+        writer.write_row(dict(a=1, b='2.5'))
+        assert load_columnar(dir_name) == dict()
+        writer.write_row(dict(a=2, b='not a number'))
+        writer.write_row(dict(a=3, b=None, c=np.float32(0.5)))
+        writer.write_row(dict(c=4, b=True))
+        writer.write_row(dict(d=5))
+        # the rows not flushed yet are not read
+        columns = load_columnar(dir_name)
+        assert sorted(columns.keys()) == ['a', 'b', 'c']
+        np.testing.assert_array_equal(columns['c'], [np.nan, np.nan, 0.5, 4])
+        writer.close()
+        columns = load_columnar(dir_name)
+        assert sorted(columns.keys()) == ['a', 'b', 'c', 'd']
+        np.testing.assert_array_equal(columns['a'], [1, 2, 3, np.nan, np.nan])
+        # non-numeric values are read as 0, as from the csv files
+        np.testing.assert_array_equal(columns['b'], [2.5, 0, 0, 1, np.nan])
+        np.testing.assert_array_equal(columns['c'], [np.nan, np.nan, 0.5, 4, np.nan])
+        np.testing.assert_array_equal(columns['d'], [np.nan, np.nan, np.nan, np.nan, 5])
+
+        # a row that was only partially written is dropped
+        with open(os.path.join(dir_name, '0.f8'), 'ab') as f:
+            f.write(np.asarray([6], dtype='<f8').tobytes())
+        assert all(len(column) == 5 for column in load_columnar(dir_name).values())
+
+        # through the logger, and a new output in the same directory starts over
+        logger.add_tabular_output(dir_name)
+        try:
+            for itr in range(3):
+                logger.record_tabular('Iteration', itr)
+                if itr > 0:
+                    logger.record_tabular('AverageReturn', itr * 10.)
+                logger.dump_tabular(with_prefix=False)
+        finally:
+            logger.remove_tabular_output(dir_name)
+        columns = load_columnar(dir_name)
+        assert sorted(columns.keys()) == ['AverageReturn', 'Iteration']
+        np.testing.assert_array_equal(columns['Iteration'], [0, 1, 2])
+        np.testing.assert_array_equal(columns['AverageReturn'], [np.nan, 10, 20])
+    finally:
+        shutil.rmtree(log_dir)
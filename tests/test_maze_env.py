@@ -0,0 +1,108 @@
+import numpy as np
+
+from curriculum.envs.maze.maze_env import MazeEnv
+from curriculum.envs.maze.maze_env_utils import construct_maze
+
+MAZE_IDS = range(13)
+
+
+def _maze_env(maze_id, length, size_scaling):
+    """ The maze geometry of a MazeEnv, as set up by its constructor, without the simulator """
+    env = MazeEnv.__new__(MazeEnv)
+    env.MAZE_SIZE_SCALING = size_scaling
+    env.MAZE_STRUCTURE = construct_maze(maze_id=maze_id, length=length)
+    env._init_torso_x, env._init_torso_y = env._find_robot()
+    env._init_grid()
+    return env
+
+
+def _maze_envs():
+    for maze_id in MAZE_IDS:
+        for length in (1, 2, 3):
+            for size_scaling in (2, 0.3):
+                try:
+                    yield _maze_env(maze_id, length, size_scaling)
+                except NotImplementedError:
+                    pass
+
+
+def _old_is_in_collision(env, pos):
+    x, y = pos
+    structure = env.MAZE_STRUCTURE
+    size_scaling = env.MAZE_SIZE_SCALING
+    for i in range(len(structure)):
+        for j in range(len(structure[0])):
+            if structure[i][j] == 1:
+                minx = j * size_scaling - size_scaling * 0.5 - env._init_torso_x
+                maxx = j * size_scaling + size_scaling * 0.5 - env._init_torso_x
+                miny = i * size_scaling - size_scaling * 0.5 - env._init_torso_y
+                maxy = i * size_scaling + size_scaling * 0.5 - env._init_torso_y
+                if minx <= x <= maxx and miny <= y <= maxy:
+                    return True
+    return False
+
+
+def _old_find_empty_space(env):
+    structure = env.MAZE_STRUCTURE
+    size_scaling = env.MAZE_SIZE_SCALING
+    empty_space = []
+    for i in range(len(structure)):
+        for j in range(len(structure[0])):
+            if structure[i][j] == 'r' or structure[i][j] == 'g' or structure[i][j] == 0:
+                empty_space.append((j * size_scaling - env._init_torso_x, i * size_scaling - env._init_torso_y))
+    return empty_space
+
+
+def _old_is_feasible(env, pos):
+    for space in _old_find_empty_space(env):
+        if np.size(np.where(np.abs(np.array(np.array(pos).reshape(-1)[:2]) - np.array(space)) <
+                            env.MAZE_SIZE_SCALING / 2)[0]) == 2:
+            return True
+    return False
+
+
+def _positions(env, n=200, seed=0):
+    rng = np.random.RandomState(seed)
+    size_scaling = env.MAZE_SIZE_SCALING
+    structure = env.MAZE_STRUCTURE
+    low = np.array([-env._init_torso_x, -env._init_torso_y]) - 2 * size_scaling
+    high = low + np.array([len(structure[0]), len(structure)]) * size_scaling + 4 * size_scaling
+    uniform = rng.uniform(low, high, size=(n, 2))
+    # also on the borders and the centers of the cells
+    grid = np.round(rng.uniform(low, high, size=(n, 2)) / size_scaling * 2) * size_scaling / 2
+    return np.concatenate([uniform, grid, [[np.nan, 0.], [np.inf, 0.], [0., -np.inf]]])
+
+
+def test_all_mazes_are_constructed():
+    for maze_id in MAZE_IDS:
+        env = _maze_env(maze_id, 1, 2)
+        assert env._wall_grid.shape == (len(env.MAZE_STRUCTURE), len(env.MAZE_STRUCTURE[0]))
+
+
+def test_ragged_maze():
+    # the row of the robot of maze 12 is longer than the others: its extra cells are ignored, like in the loops
+    env = _maze_env(12, 1, 2)
+    assert max(len(row) for row in env.MAZE_STRUCTURE) > len(env.MAZE_STRUCTURE[0])
+    assert env.find_empty_space() == _old_find_empty_space(env)
+
+
+def test_find_empty_space():
+    for env in _maze_envs():
+        assert env.find_empty_space() == _old_find_empty_space(env)
+
+
+def test_is_in_collision():
+    for env in _maze_envs():
+        for pos in _positions(env):
+            assert env._is_in_collision(pos) == _old_is_in_collision(env, pos)
+
+
+def test_is_feasible():
+    for env in _maze_envs():
+        positions = _positions(env)
+        expected = np.array([_old_is_feasible(env, pos) for pos in positions])
+        assert np.array_equal([env.is_feasible(pos) for pos in positions], expected)
+        assert np.array_equal(env.is_feasible_n(positions), expected)
+        # only the first 2 coordinates are checked
+        extended = np.concatenate([positions, np.ones((len(positions), 1))], axis=1)
+        assert np.array_equal(env.is_feasible_n(extended), expected)
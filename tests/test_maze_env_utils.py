@@ -0,0 +1,28 @@
+import math
+
+import numpy as np
+
+from rllab.envs.mujoco.maze.maze_env_utils import ray_segment_intersect, rays_segments_intersect
+
+
+def test_rays_segments_intersect():
+    rng = np.random.RandomState(0)
+    n_intersections = 0
+    for _ in range(300):
+        pt = tuple(rng.uniform(-3, 3, size=2))
+        thetas = rng.uniform(-math.pi, math.pi, size=rng.randint(1, 12))
+        segments = rng.uniform(-5, 5, size=(rng.randint(1, 10), 4))
+        if rng.uniform() < 0.3:
+            # axis-aligned segments, like the walls of a maze, and a ray along one of them
+            segments[:, 2] = segments[:, 0]
+            thetas[0] = math.pi / 2
+        valid, xi, yi = rays_segments_intersect(pt, thetas, segments)
+        assert valid.shape == xi.shape == yi.shape == (len(thetas), len(segments))
+        for i, theta in enumerate(thetas):
+            for j, segment in enumerate(segments):
+                point = ray_segment_intersect((pt, theta), ((segment[0], segment[1]), (segment[2], segment[3])))
+                assert valid[i, j] == (point is not None)
+                if point is not None:
+                    n_intersections += 1
+                    assert (xi[i, j], yi[i, j]) == point
+    assert n_intersections > 100
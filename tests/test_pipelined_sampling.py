@@ -0,0 +1,70 @@
+import threading
+
+import numpy as np
+
+from rllab.algos.trpo import TRPO
+from rllab.baselines.zero_baseline import ZeroBaseline
+from rllab.envs.grid_world_env import GridWorldEnv
+from rllab.misc import special
+from rllab.policies.categorical_mlp_policy import CategoricalMLPPolicy
+from rllab.sampler import parallel_sampler
+from rllab.sampler.stateful_pool import singleton_pool
+
+
+def test_trpo_pipelined_sampling():
+    parallel_sampler.initialize(n_parallel=2)
+    parallel_sampler.set_seed(0)
+    np.random.seed(0)
+    try:
+        env = GridWorldEnv(desc='4x4_safe')
+        policy = CategoricalMLPPolicy(env_spec=env.spec, hidden_sizes=(16,))
+        algo = TRPO(
+            env=env,
+            policy=policy,
+            baseline=ZeroBaseline(env_spec=env.spec),
+            batch_size=2000,
+            max_path_length=100,
+            n_itr=10,
+            step_size=0.1,
+            pipelined_sampling=True,
+        )
+        all_paths = algo.train()
+        # the goal is reached faster and faster, even if every batch but the first is one iteration behind
+        path_lengths = [np.mean([len(path["rewards"]) for path in paths]) for paths in all_paths]
+        assert np.mean(path_lengths[-3:]) < 0.7 * np.mean(path_lengths[:2])
+    finally:
+        singleton_pool.initialize(1)
+        singleton_pool.pool = None
+
+
+def test_stale_is_ratio():
+    env = GridWorldEnv(desc='4x4_safe')
+    policy = CategoricalMLPPolicy(env_spec=env.spec, hidden_sizes=(16,))
+    algo = TRPO(env=env, policy=policy, baseline=ZeroBaseline(env_spec=env.spec), pipelined_sampling=True)
+    algo.init_opt()
+    rng = np.random.RandomState(0)
+    states = rng.randint(0, 16, size=50)
+    observations = special.to_onehot_n(states, 16)
+    actions = special.to_onehot_n(rng.randint(0, 4, size=50), 4)
+    stale_prob = rng.dirichlet(np.ones(4), size=50)
+    is_ratio, prob = algo._f_stale_is_ratio(observations, actions, stale_prob)
+    np.testing.assert_allclose(prob, policy.get_actions(states)[1]["prob"], rtol=1e-6)
+    np.testing.assert_allclose(is_ratio, np.sum(actions * prob, axis=1) / np.sum(actions * stale_prob, axis=1),
+                               rtol=1e-5)
+
+
+def test_imap_unordered_releases_lock():
+    results = singleton_pool.run_imap_unordered(lambda G, x: x * 2, [(1,), (2,), (3,)])
+    # only the first result is used
+    assert next(iter(results)) == 2
+    acquired = []
+
+    def acquire():
+        acquired.append(singleton_pool.lock.acquire(timeout=5))
+        if acquired[0]:
+            singleton_pool.lock.release()
+
+    thread = threading.Thread(target=acquire)
+    thread.start()
+    thread.join()
+    assert acquired == [True]
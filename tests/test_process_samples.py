@@ -0,0 +1,108 @@
+import numpy as np
+
+from rllab.misc import special
+from rllab.sampler.base import BaseSampler
+
+# paths of very different lengths, so that most of the padded rows are padding
+_PATH_LENGTHS = [1, 2, 1000, 3, 17, 500, 1, 999]
+
+
+class _Distribution(object):
+    def entropy(self, agent_infos):
+        return np.zeros(np.shape(agent_infos["mean"])[:-1])
+
+
+class _Policy(object):
+    def __init__(self, recurrent):
+        self.recurrent = recurrent
+        self.distribution = _Distribution()
+
+
+class _Baseline(object):
+    def predict(self, path):
+        return path["baselines"]
+
+    def fit(self, paths):
+        pass
+
+
+class _Algo(object):
+    def __init__(self, recurrent, center_adv):
+        self.policy = _Policy(recurrent)
+        self.baseline = _Baseline()
+        self.discount = 0.99
+        self.gae_lambda = 0.97
+        self.center_adv = center_adv
+        self.positive_adv = False
+
+
+def _paths(rng, dtype=np.float64):
+    return [dict(
+        observations=rng.randn(length, 3),
+        actions=rng.randn(length, 2),
+        rewards=(rng.randn(length) * 10).astype(dtype),
+        baselines=(rng.randn(length) * 10).astype(dtype),
+        env_infos=dict(),
+        agent_infos=dict(mean=rng.randn(length, 2)),
+    ) for length in _PATH_LENGTHS]
+
+
+def _per_path(paths, discount, gae_lambda):
+    """ Former process_samples: advantages and returns of every path computed on its own """
+    advantages, returns = [], []
+    for path in paths:
+        path_baselines = np.append(path["baselines"], 0)
+        deltas = path["rewards"] + discount * path_baselines[1:] - path_baselines[:-1]
+        advantages.append(special.discount_cumsum(deltas, discount * gae_lambda))
+        returns.append(special.discount_cumsum(path["rewards"], discount))
+    return advantages, returns
+
+
+def test_discount_cumsum_concatenated():
+    rng = np.random.RandomState(0)
+    rows = [rng.randn(length) * 10 for length in _PATH_LENGTHS]
+    for discount in [0., 0.5, 0.99, 1.]:
+        cumsums = special.discount_cumsum_concatenated(np.concatenate(rows), _PATH_LENGTHS, discount)
+        # not bit-identical to the per-path lfilter calls: the results differ by about 1e-15
+        np.testing.assert_allclose(cumsums, np.concatenate([special.discount_cumsum(row, discount) for row in rows]),
+                                   rtol=1e-10, atol=1e-10)
+    cumsums = special.discount_cumsum_concatenated(np.concatenate(rows).astype(np.float32), _PATH_LENGTHS, 0.99)
+    assert cumsums.dtype == np.float32
+
+
+def test_process_samples():
+    rng = np.random.RandomState(0)
+    for recurrent in [False, True]:
+        algo = _Algo(recurrent, center_adv=False)
+        paths = _paths(rng)
+        advantages, returns = _per_path(paths, algo.discount, algo.gae_lambda)
+        samples_data = BaseSampler(algo).process_samples(0, paths)
+        for path, path_advantages, path_returns in zip(paths, advantages, returns):
+            np.testing.assert_allclose(path["advantages"], path_advantages, rtol=1e-10, atol=1e-10)
+            np.testing.assert_allclose(path["returns"], path_returns, rtol=1e-10, atol=1e-10)
+        if recurrent:
+            assert samples_data["advantages"].shape == (len(paths), max(_PATH_LENGTHS))
+            for i, (path_advantages, path_returns) in enumerate(zip(advantages, returns)):
+                length = len(path_advantages)
+                np.testing.assert_allclose(samples_data["advantages"][i, :length], path_advantages,
+                                           rtol=1e-10, atol=1e-10)
+                np.testing.assert_allclose(samples_data["returns"][i, :length], path_returns,
+                                           rtol=1e-10, atol=1e-10)
+                assert np.all(samples_data["advantages"][i, length:] == 0)
+                assert np.all(samples_data["valids"][i] == (np.arange(max(_PATH_LENGTHS)) < length))
+        else:
+            np.testing.assert_allclose(samples_data["advantages"], np.concatenate(advantages),
+                                       rtol=1e-10, atol=1e-10)
+            np.testing.assert_allclose(samples_data["returns"], np.concatenate(returns), rtol=1e-10, atol=1e-10)
+            np.testing.assert_array_equal(samples_data["rewards"], np.concatenate([p["rewards"] for p in paths]))
+
+
+def test_process_samples_dtype():
+    rng = np.random.RandomState(0)
+    for recurrent in [False, True]:
+        algo = _Algo(recurrent, center_adv=True)
+        paths = _paths(rng, dtype=np.float32)
+        samples_data = BaseSampler(algo).process_samples(0, paths)
+        for key in ["rewards", "returns", "advantages"]:
+            assert samples_data[key].dtype == np.float32
+        assert paths[0]["advantages"].dtype == np.float32
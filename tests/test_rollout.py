@@ -0,0 +1,62 @@
+import numpy as np
+
+from rllab.sampler.utils import rollout, preallocated_rollout
+
+
+class _Space(object):
+    def flatten(self, x):
+        return np.asarray(x).flatten()
+
+
+class _Env(object):
+    """ Env whose infos change type, dtype and shape along the path """
+    observation_space = _Space()
+    action_space = _Space()
+
+    def __init__(self, horizon):
+        self.horizon = horizon
+        self.t = 0
+
+    def reset(self):
+        self.t = 0
+        return np.zeros(2)
+
+    def step(self, action):
+        self.t += 1
+        t = self.t
+        env_info = dict(
+            int_then_float=[0, 0] if t < 3 else [0.5, t + 0.5],
+            tuple_pos=(t, 2 * t) if t % 2 else (t + 0.25, 1.),
+            scalar=t if t < 4 else t / 3.,
+            flag=bool(t % 2),
+            array=np.arange(3) * t if t < 5 else np.arange(3) * 0.5 * t,
+            nested=dict(goal=np.array([t, t], dtype=np.float32), reached=t > 3),
+        )
+        return np.ones(2) * t, float(t), t >= self.horizon, env_info
+
+
+class _Agent(object):
+    def reset(self):
+        pass
+
+    def get_action(self, observation):
+        return observation[:1] * 2, dict(mean=observation[:1], step=int(observation[0]))
+
+
+def _assert_same(a, b):
+    if isinstance(a, dict):
+        assert set(a) == set(b)
+        for k in a:
+            _assert_same(a[k], b[k])
+    else:
+        a, b = np.asarray(a), np.asarray(b)
+        assert a.dtype == b.dtype and a.shape == b.shape
+        np.testing.assert_array_equal(a, b)
+
+
+def test_preallocated_rollout():
+    for horizon in [1, 2, 5, 10]:
+        for max_path_length in [3, 8, np.inf]:
+            expected = rollout(_Env(horizon), _Agent(), max_path_length)
+            path = preallocated_rollout(_Env(horizon), _Agent(), max_path_length, initial_capacity=2)
+            _assert_same(path, expected)
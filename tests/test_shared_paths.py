@@ -0,0 +1,56 @@
+import glob
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+from rllab.sampler import shared_paths
+
+
+def _path(rng, length, action_dtype=np.float64):
+    return dict(
+        observations=rng.randn(length, 3),
+        actions=rng.randn(length, 2).astype(action_dtype),
+        rewards=rng.randn(length),
+        dones=np.arange(length) == length - 1,
+        env_infos=dict(goal=rng.randn(length, 2), nested=dict(reached=rng.randn(length) > 0)),
+        agent_infos=dict(mean=rng.randn(length, 2)),
+        last_obs=rng.randn(3),
+    )
+
+
+def _assert_same(a, b):
+    if isinstance(a, dict):
+        assert set(a) == set(b)
+        for k in a:
+            _assert_same(a[k], b[k])
+    else:
+        np.testing.assert_array_equal(a, b)
+
+
+def test_shared_paths():
+    rng = np.random.RandomState(0)
+    directory = tempfile.mkdtemp()
+    try:
+        collect_id = shared_paths.new_collect_id()
+        writer = shared_paths.SharedPathWriter(collect_id, capacity=30, directory=directory)
+        # the third path does not fit the layout of the columns, the last one does not fit their capacity
+        paths = [_path(rng, 10), _path(rng, 5), _path(rng, 5, np.float32), _path(rng, 10), _path(rng, 10)]
+        results = [writer.write(path) or path for path in paths]
+        assert [shared_paths.is_shared_record(r) for r in results] == [True, True, False, True, False]
+        read_paths = shared_paths.read_shared_paths(results)
+        for path, read_path in zip(paths, read_paths):
+            _assert_same(read_path, path)
+        assert len(glob.glob(os.path.join(directory, "*"))) == 0
+
+        # a collection that failed before the master read the records of the workers
+        collect_id = shared_paths.new_collect_id()
+        writer = shared_paths.SharedPathWriter(collect_id, capacity=5, directory=directory)
+        assert writer.write(_path(rng, 3)) is not None
+        writer.close()
+        assert len(glob.glob(os.path.join(directory, "*"))) > 0
+        shared_paths.remove_files(collect_id, directory)
+        assert len(glob.glob(os.path.join(directory, "*"))) == 0
+    finally:
+        shutil.rmtree(directory)
@@ -0,0 +1,42 @@
+import numpy as np
+
+from rllab.sampler.stateful_pool import singleton_pool
+
+from curriculum.envs.start_env import check_feasibility, feasibility_mask
+from curriculum.state.evaluator import invalidate_evaluator
+
+
+class _ActionSpace(object):
+    flat_dim = 2
+
+
+class _UnstableEnv(object):
+    """ Every step moves away from the origin: the starts far enough from it leave the bounds within the horizon """
+    action_space = _ActionSpace()
+
+    def reset(self, init_state):
+        self.state = np.array(init_state, dtype=float)
+        return self.state
+
+    def step(self, action):
+        self.state = self.state * 1.2 + action
+        return self.state, 0., bool(np.linalg.norm(self.state) > 5), dict()
+
+
+def test_feasibility_mask():
+    rng = np.random.RandomState(0)
+    starts = rng.uniform(-1.5, 1.5, size=(37, 2))
+    env = _UnstableEnv()
+    expected = np.array([check_feasibility(start, env, max_path_length=10) for start in starts])
+    assert 0 < np.sum(expected) < len(starts)
+    for n_parallel in [1, 3]:
+        singleton_pool.initialize(n_parallel)
+        try:
+            for n_starts in [0, 1, 2, len(starts)]:
+                mask = feasibility_mask(starts[:n_starts], env, max_path_length=10)
+                assert mask.dtype == bool
+                np.testing.assert_array_equal(mask, expected[:n_starts])
+        finally:
+            invalidate_evaluator()
+            singleton_pool.initialize(1)
+            singleton_pool.pool = None
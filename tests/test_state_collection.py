@@ -0,0 +1,175 @@
+import pickle
+
+import numpy as np
+import scipy.spatial
+
+from curriculum.state.utils import StateCollection, StateIndex, SmartStateCollection
+
+
+class _ListStateCollection(object):
+    """ Former StateCollection append: states kept in a list, checked against all the others with cdist """
+
+    def __init__(self, distance_threshold=None, states_transform=None):
+        self.distance_threshold = distance_threshold
+        self.states_transform = states_transform
+        self.state_list = []
+        self.transformed_state_list = []
+
+    def _process(self, states, transformed_states):
+        results, transformed_results = [states[0]], [transformed_states[0]]
+        for i in range(1, len(states)):
+            if np.amin(scipy.spatial.distance.cdist(transformed_results, transformed_states[i].reshape(1, -1))) > \
+                    self.distance_threshold:
+                results.append(states[i])
+                transformed_results.append(transformed_states[i])
+        return np.array(results), np.array(transformed_results)
+
+    def append(self, states):
+        states = np.array(states)
+        transformed_states = self.states_transform(states) if self.states_transform else states
+        if self.distance_threshold is not None and self.distance_threshold > 0:
+            states, transformed_states = self._process(states, transformed_states)
+            if len(self.state_list) > 0:
+                dists = scipy.spatial.distance.cdist(self.transformed_state_list, transformed_states)
+                indices = np.amin(dists, axis=0) > self.distance_threshold
+                states, transformed_states = states[indices, :], transformed_states[indices, :]
+        self.state_list.extend(states)
+        self.transformed_state_list.extend(transformed_states)
+        return states
+
+
+def _first_two(states):
+    return np.asarray(states)[:, :2] * 2
+
+
+def test_state_index_min_distances():
+    rng = np.random.RandomState(0)
+    index = StateIndex(chunk_size=7)
+    points = np.zeros((0, 3))
+    for _ in range(40):
+        new_points = rng.uniform(0, 10, size=(rng.randint(1, 10), 3))
+        index.add(new_points)
+        points = np.concatenate([points, new_points])
+        assert index.size == len(points)
+        queries = rng.uniform(0, 10, size=(20, 3))
+        expected = np.amin(scipy.spatial.distance.cdist(points, queries), axis=0)
+        np.testing.assert_allclose(index.min_distances(queries), expected, rtol=1e-12)
+        bounded = index.min_distances(queries, distance_upper_bound=2.)
+        np.testing.assert_allclose(bounded[expected <= 2.], expected[expected <= 2.], rtol=1e-12)
+        assert np.all(np.isinf(bounded[expected > 2.]))
+    restored = pickle.loads(pickle.dumps(index))
+    np.testing.assert_array_equal(restored.min_distances(queries), index.min_distances(queries))
+
+
+def test_state_collection_append():
+    rng = np.random.RandomState(0)
+    for distance_threshold, states_transform in [(None, None), (0.4, None), (0.4, _first_two)]:
+        collection = StateCollection(distance_threshold=distance_threshold, states_transform=states_transform)
+        reference = _ListStateCollection(distance_threshold=distance_threshold, states_transform=states_transform)
+        for _ in range(30):
+            states = rng.uniform(0, 8, size=(rng.randint(1, 100), 3))
+            added = collection.append(states)
+            np.testing.assert_array_equal(added, reference.append(states))
+            np.testing.assert_array_equal(collection.states, np.array(reference.state_list))
+            assert collection.size == len(reference.state_list)
+        if states_transform:
+            np.testing.assert_array_equal(collection.projected_states, np.array(reference.transformed_state_list))
+
+
+class _DictSmartStates(object):
+    """ Former SmartStateCollection selection: q values in a dict keyed by state, fully sorted on every sample """
+
+    def __init__(self, alpha, abs):
+        self.alpha = alpha
+        self.abs = abs
+        self.states = []
+        self.q_vals = {}
+        self.prev_vals = {}
+
+    def update_starts(self, states, rewards):
+        old_states, old_rewards, new_states, new_rewards = [], [], [], []
+        for state, reward in zip(states, rewards):
+            if reward < 0.02 or reward > 0.98:
+                continue
+            if tuple(state) in set(map(tuple, self.states)):
+                old_states.append(state)
+                old_rewards.append(reward)
+            else:
+                new_states.append(state)
+                new_rewards.append(reward)
+        for state in new_states:
+            self.states.append(state)
+            reward = new_rewards[np.argmax(np.all(np.array(new_states) == state, axis=1))]
+            self.q_vals[tuple(state)] = self.alpha * reward
+            self.prev_vals[tuple(state)] = reward
+        previous_values = np.array([self.prev_vals[tuple(state)] for state in old_states])
+        curr_q_values = np.array([self.q_vals[tuple(state)] for state in old_states])
+        new_values = self.alpha * (np.array(old_rewards) - previous_values) + (1 - self.alpha) * curr_q_values
+        for state, reward, new_value in zip(old_states, old_rewards, new_values):
+            self.q_vals[tuple(state)] = new_value
+            self.prev_vals[tuple(state)] = reward
+
+    def top(self, size):
+        if self.abs:
+            return np.array(sorted(self.q_vals, key=lambda k: abs(self.q_vals[k]), reverse=True)[:size])
+        return np.array(sorted(self.q_vals, key=self.q_vals.get, reverse=True)[:size])
+
+
+def test_smart_state_collection_top_k():
+    rng = np.random.RandomState(0)
+    for abs_q in [True, False]:
+        collection = SmartStateCollection(eps=0, alpha=0.3, abs=abs_q)
+        reference = _DictSmartStates(alpha=0.3, abs=abs_q)
+        for _ in range(30):
+            # few distinct states, so that states show up again, within a batch and across batches
+            states = rng.randint(0, 6, size=(rng.randint(1, 12), 2)).astype(float)
+            rewards = rng.uniform(-0.1, 1.1, size=len(states))
+            collection.update_starts(states, rewards)
+            reference.update_starts(states, rewards)
+            np.testing.assert_array_equal(collection.states, np.array(reference.states).reshape(-1, 2))
+            for size in [1, 3, 10, 50]:
+                good_states = collection.sample(size)
+                assert len(set(map(tuple, good_states))) == len(good_states)
+                np.testing.assert_array_equal(good_states, reference.top(size).reshape(-1, 2))
+
+
+def test_state_collection_sample():
+    rng = np.random.RandomState(0)
+    collection = StateCollection()
+    state_list = []
+    for _ in range(20):
+        states = rng.uniform(size=(rng.randint(1, 300), 4))
+        collection.append(states)
+        state_list.extend(states)
+        assert collection.state_list == np.array(state_list).tolist()
+        for size, replace in [(5, False), (50, True), (len(state_list) + 1, False)]:
+            np.random.seed(1)
+            if size > len(state_list):
+                expected = np.array(state_list)
+            elif replace:
+                expected = np.array(state_list)[np.random.randint(0, len(state_list), size)]
+            else:
+                expected = np.array(state_list)[np.random.choice(len(state_list), size, replace=False)]
+            np.random.seed(1)
+            samples = collection.sample(size, replace=replace)
+            np.testing.assert_array_equal(samples, expected)
+            # the samples never alias the storage of the collection
+            samples += 1
+            np.testing.assert_array_equal(collection.states, np.array(state_list))
+        np.random.seed(2)
+        noisy = collection.sample(10, replay_noise=0.1)
+        np.random.seed(2)
+        expected = np.array(state_list)[np.random.choice(len(state_list), 10, replace=False)]
+        np.testing.assert_array_equal(noisy, expected + 0.1 * np.random.randn(*expected.shape))
+    assert not collection.states.flags.writeable
+
+    # collections pickled with the former list storage
+    d = dict(distance_threshold=None, states_transform=None, idx_lim=None, state_list=state_list)
+    restored = StateCollection.__new__(StateCollection)
+    restored.__setstate__(d)
+    np.testing.assert_array_equal(restored.states, np.array(state_list))
+    restored.append(np.ones((1, 4)))
+    assert restored.size == len(state_list) + 1
+
+    collection.empty()
+    assert collection.size == 0 and len(collection.states) == 0
@@ -0,0 +1,47 @@
+import numpy as np
+
+from rllab.sampler.stateful_pool import singleton_pool
+
+
+def _collect_once(G, inc):
+    return G.collect_value, inc
+
+
+def _collect_varying(G):
+    inc = np.random.randint(1, 5)
+    return inc, inc
+
+
+def _set_collect_value(G, value):
+    G.collect_value = value
+
+
+def _run_collect_checks():
+    singleton_pool.run_each(_set_collect_value, [(7,)] * singleton_pool.n_parallel)
+
+    # the threshold is reached, and every worker stops at the first path after it
+    for threshold in [1, 10, 200]:
+        results = singleton_pool.run_collect(_collect_varying, threshold=threshold, show_prog_bar=False)
+        assert threshold <= sum(results) < threshold + 4 * singleton_pool.n_parallel
+
+    # the counts of a collection do not carry over to the next one
+    for _ in range(3):
+        results = singleton_pool.run_collect(_collect_once, threshold=50, args=(2,), show_prog_bar=False)
+        assert results[0] == 7
+        assert 25 <= len(results) < 25 + singleton_pool.n_parallel
+
+    # with a fixed increment, exactly the number of calls needed to reach the threshold
+    for threshold, inc in [(10, 3), (9, 3), (1, 5), (101, 1)]:
+        results = singleton_pool.run_collect(_collect_once, threshold=threshold, args=(inc,), show_prog_bar=False,
+                                             fixed_increment=inc)
+        assert results == [7] * int(np.ceil(threshold / inc))
+
+
+def test_run_collect():
+    for n_parallel in [1, 3]:
+        singleton_pool.initialize(n_parallel)
+        try:
+            _run_collect_checks()
+        finally:
+            singleton_pool.initialize(1)
+            singleton_pool.pool = None
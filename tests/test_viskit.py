@@ -0,0 +1,90 @@
+import json
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+from rllab.viskit import core
+
+
+def _write(path, rows, mode='w'):
+    with open(path, mode) as f:
+        for row in rows:
+            f.write(','.join(str(v) for v in row) + '\n')
+
+
+def _assert_fresh(path):
+    cached = core.load_progress(path)
+    fresh = core.load_progress(path, use_cache=False)
+    assert set(cached) == set(fresh)
+    for k in fresh:
+        np.testing.assert_array_equal(cached[k], fresh[k])
+    return fresh
+
+
+def test_load_progress_cache():
+    log_dir = tempfile.mkdtemp()
+    try:
+        path = os.path.join(log_dir, 'progress.csv')
+        _write(path, [['Iteration', 'AverageReturn']] + [[i, i * 0.5] for i in range(10)])
+        assert len(_assert_fresh(path)['Iteration']) == 10
+
+        # appended
+        _write(path, [[i, i * 0.5] for i in range(10, 15)], mode='a')
+        assert len(_assert_fresh(path)['Iteration']) == 15
+
+        # rewritten in place by a new run with the same header, longer than the parsed part
+        _write(path, [['Iteration', 'AverageReturn']] + [[i, -i * 0.5] for i in range(20)])
+        progress = _assert_fresh(path)
+        np.testing.assert_array_equal(progress['AverageReturn'], -np.arange(20) * 0.5)
+
+        # only a row in the middle changes, then a row is appended
+        rows = [['Iteration', 'AverageReturn']] + [[i, -i * 0.5] for i in range(20)]
+        rows[10] = [9, 1.5]
+        _write(path, rows + [[20, -10.]])
+        progress = _assert_fresh(path)
+        assert progress['AverageReturn'][9] == 1.5
+
+        # replaced by another file
+        _write(path + '.new', [['Iteration', 'AverageReturn']] + [[i, 1.] for i in range(30)])
+        os.replace(path + '.new', path)
+        progress = _assert_fresh(path)
+        np.testing.assert_array_equal(progress['AverageReturn'], np.ones(30))
+
+        # the cache file next to the csv is used by a new process, with an empty cache in memory
+        core._progress_cache.clear()
+        _write(path, [[30, 2.]], mode='a')
+        progress = _assert_fresh(path)
+        assert len(progress['Iteration']) == 31
+    finally:
+        shutil.rmtree(log_dir)
+
+
+def _write_exp(log_dir, name, params):
+    exp_dir = os.path.join(log_dir, name)
+    os.makedirs(exp_dir)
+    with open(os.path.join(exp_dir, 'params.json'), 'w') as f:
+        json.dump(params, f)
+    _write(os.path.join(exp_dir, 'progress.csv'), [['Iteration'], [0], [1]])
+
+
+def test_load_exps_data_default_values():
+    log_dir = tempfile.mkdtemp()
+    try:
+        _write_exp(log_dir, 'a', dict(lr=0.1, batch=10))
+        _write_exp(log_dir, 'b', dict(lr=0.2, batch=20))
+        exps_cache, default_values = dict(), dict(batch=5)
+        core.load_exps_data([log_dir], disable_variant=True, exps_cache=exps_cache, default_values=default_values)
+
+        # new runs found by the crawler, without the batch param, and with a new param nobody has a value for
+        _write_exp(log_dir, 'c', dict(lr=0.3))
+        _write_exp(log_dir, 'd', dict(lr=0.4, momentum=0.9))
+        exps_data = core.load_exps_data([log_dir], disable_variant=True, ignore_missing_keys=True,
+                                        exps_cache=exps_cache, default_values=default_values)
+        flat_params = dict((data.flat_params['exp_name'], data.flat_params) for data in exps_data)
+        assert [flat_params[name]['batch'] for name in 'abcd'] == [10, 20, 5, 5]
+        assert [name for name in 'abcd' if 'momentum' in flat_params[name]] == ['d']
+        assert default_values == dict(batch=5)
+    finally:
+        shutil.rmtree(log_dir)